@@ -1,34 +1,57 @@
 
-from fundamentals.mysql import database, readquery
+from fundamentals.mysql import readquery
 
 from flask import Flask
 from flask import jsonify
 from flask import request
+from flask import g
+from flask import Response
+from flask import stream_with_context
+from flask import send_file
+from flask import abort
 from flask_jwt_extended import JWTManager
 from flask_jwt_extended import jwt_required
 from flask_jwt_extended import get_jwt_identity, create_access_token, get_jwt
+from flask_jwt_extended import verify_jwt_in_request
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
 from flask_cors import CORS
 from datetime import timedelta
 from concurrent.futures import ThreadPoolExecutor
-import concurrent.futures
 import redis
 import base64
+import io
+import mimetypes
+import hashlib
+import hmac
+import re
 import traceback
 import os
+import time
 from functools import lru_cache
 import logging
 
 
 
-from models.transients.models_transients_get import models_transients_get
+from models.transients.models_transients_get import models_transients_get, schemaCache, crossmatchCache
 from models.transients.models_transients_put import models_transients_element_put
 from models.transients_comments.models_transients_comments import models_transients_comments_put 
-from models.transients.models_transients_count import models_transients_count
+from models.transients.models_transients_count import models_transients_count, listCountsCache, ticketCountCache
 from packages.login import login_user
-from packages.sanitizers import _sanitize_get_transients_request, _sanitize_patch_or_classify_request, _sanitize_comment_request, _sanitize_count_transients_request, _sanitize_put_transient_payload
+from packages.db_pool import connection_pool
+from packages.response_cache import response_cache
+from packages.list_counts import list_counts_reconciler
+from packages.search_index import search_index
+from packages.spatial_index import spatial_index
+from packages.io_pool import bounded_io_pool
+from packages.asset_cache import asset_cache
+from packages.asset_index import asset_presence_index
+from packages.unit_of_work import unit_of_work_metrics
+from packages.statements import statement_metrics
+from models.transients_lightcurves.transients_lightcurves_get import models_transients_lightcurves_get, lightcurveCache
+from models.superevents.models_superevent_transients_get import models_superevent_transients_get, supereventCache, skytagColumns
+from packages.sanitizers import _sanitize_get_transients_request, _sanitize_patch_or_classify_request, _sanitize_comment_request, _sanitize_count_transients_request, _sanitize_put_transient_payload, _sanitize_get_lightcurve_request, _sanitize_cone_search_request, _sanitize_superevent_request
 
 
 logging.basicConfig(filename='/home/webserver/.config/marshall_api/marshall_api.log', level=logging.INFO)
@@ -77,13 +100,66 @@ asset_defs = [
     ]
 
 
-@lru_cache(maxsize=2048)
-def _read_b64_cached(file_path: str, mtime_ns: int, size: int) -> str:
-  with open(file_path, "rb") as f:
-    file_data = f.read()
+ASSET_FILENAMES = frozenset(ad["filename"] for ad in asset_defs)
+
+
+def _read_b64_cached(file_path, st, thumbnail=False):
+  # THE BYTE-BUDGETED CACHE HOLDS THE RAW FILES; ONLY THE RESPONSE CARRIES THE BASE64 COPY
+  if thumbnail:
+    file_data = assets_file_cache.get_thumbnail(file_path, st)
+  else:
+    file_data = assets_file_cache.get_bytes(file_path, st)
   return base64.b64encode(file_data).decode("utf-8")
 
 
+@lru_cache(maxsize=8192)
+def _content_hash_cached(file_path: str, mtime_ns: int, size: int) -> str:
+  digest = hashlib.sha256()
+  with open(file_path, "rb") as f:
+    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+def _asset_etag(st):
+  # CHANGES WHENEVER THE FILE IS REWRITTEN, WITHOUT READING IT
+  return "%x-%x" % (st.st_mtime_ns, st.st_size)
+
+
+def _asset_signature(tbid, name, expires):
+  message = ("%s/%s/%s" % (int(tbid), name, int(expires))).encode("utf-8")
+  return hmac.new(app.config["JWT_SECRET_KEY"].encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+
+def _signed_asset_url(scriptRoot, tbid, name):
+  # THE EXPIRY IS ROUNDED UP TO THE NEXT PERIOD SO THE URL (AND THE BROWSER CACHE ENTRY) STAYS STABLE WITHIN IT
+  ttl = app.config["ASSET_URL_TTL_SECONDS"]
+  expires = (int(time.time()) // ttl + 2) * ttl
+  return "%s/asset/%s/%s?expires=%s&sig=%s" % (
+    scriptRoot, int(tbid), name, expires, _asset_signature(tbid, name, expires))
+
+
+def _asset_request_authorized(tbid, name):
+  # A BEARER TOKEN IN THE HEADERS, OR A SIGNED URL FROM THE MANIFEST (FOR <img> TAGS); NEVER A TOKEN IN THE URL
+  if verify_jwt_in_request(optional=True) and get_jwt_identity():
+    return True
+  expires = request.args.get("expires", "")
+  signature = request.args.get("sig", "")
+  if not expires.isdigit() or int(expires) < time.time():
+    return False
+  return hmac.compare_digest(signature.encode("utf-8"), _asset_signature(tbid, name, expires).encode("utf-8"))
+
+
+def _server_timing(timings):
+  """Server-Timing header value listing the duration of every statement of a write transaction."""
+  entries = []
+  for i, timing in enumerate(timings):
+    desc = " ".join(timing["statement"].split()[:2])
+    desc = re.sub(r'[^A-Za-z0-9_ ]', "", desc)
+    entries.append('db%s;dur=%.2f;desc="%s"' % (i, timing["seconds"] * 1000, desc))
+  return ", ".join(entries)
+
+
 dbSettings = {
     'host': '192.167.39.99', 
     'user': 'marshall', 
@@ -101,9 +177,136 @@ app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=25)
 app.config["JWT_REFRESH_TOKEN_EXPIRES"] = timedelta(hours=72)
 app.config["JWT_ACCESS_TOKEN_EXPIRES"] = ACCESS_EXPIRES
 
+# DATABASE CONNECTION POOL SHARED BY ALL THE ROUTES OF THIS WORKER
+app.config["DB_POOL_MIN_SIZE"] = 2
+app.config["DB_POOL_MAX_SIZE"] = 20
+app.config["DB_POOL_CHECKOUT_TIMEOUT"] = 30
+app.config["DB_POOL_MAX_IDLE_SECONDS"] = 300
+app.config["DB_POOL_PING_AFTER_IDLE_SECONDS"] = 5
+
+# /metrics IS ONLY SERVED TO THESE ADDRESSES OR TO A SCRAPER SENDING `Authorization: Bearer <token>`
+app.config["METRICS_ALLOWED_IPS"] = ("127.0.0.1", "::1")
+app.config["METRICS_SCRAPE_TOKEN"] = os.environ.get("MARSHALL_METRICS_TOKEN")
+
+# FETCH THE ASSOCIATED TICKET DATA (AKAS, LIGHTCURVES, COMMENTS ...) CONCURRENTLY.
+# SET TRANSIENTS_PARALLEL_FETCH TO False TO FALL BACK TO SEQUENTIAL SUB-QUERIES
+app.config["TRANSIENTS_PARALLEL_FETCH"] = True
+app.config["TRANSIENTS_FETCH_WORKERS"] = 16
+app.config["TRANSIENTS_SUBQUERY_TIMEOUT"] = 20
+# TRANSIENTS FETCHED PER BATCH BY THE format=ndjson STREAMING EXPORT
+app.config["TRANSIENTS_STREAM_BATCH_SIZE"] = 500
+
+# REDIS CACHE OF THE /getTransients LIST VIEWS (INVALIDATED ON EVERY WRITE)
+app.config["RESPONSE_CACHE_ENABLED"] = True
+app.config["RESPONSE_CACHE_TTL_SECONDS"] = 120
+
+# THE IN-MEMORY NAME SEARCH INDEX: HOW OFTEN THE SHARED GENERATION IS CHECKED AND THE MAXIMUM AGE
+# BEFORE A REBUILD (INGESTS HAPPEN OUTSIDE THE API)
+app.config["SEARCH_INDEX_CHECK_SECONDS"] = 10
+app.config["SEARCH_INDEX_MAX_AGE_SECONDS"] = 900
+
+# THE IN-MEMORY POSITIONAL INDEX OF /coneSearch: DECLINATION ZONE HEIGHT AND MAXIMUM AGE BEFORE A REBUILD
+app.config["SPATIAL_INDEX_ZONE_HEIGHT_DEG"] = 0.25
+app.config["SPATIAL_INDEX_MAX_AGE_SECONDS"] = 900
+
+# HOW OFTEN THE SIDEBAR LIST COUNTS ARE FULLY RECOUNTED IN THE BACKGROUND
+app.config["LIST_COUNTS_RECONCILE_SECONDS"] = 600
+
+# HOW LONG THE SIDEBAR LIST COUNTS ARE SERVED FROM MEMORY BEFORE BEING RE-READ
+app.config["LIST_COUNTS_CACHE_TTL_SECONDS"] = 5
+
+# HOW LONG THE TOTAL OF A FILTERED/SEARCHED TICKET LIST IS REUSED ACROSS PAGE FLIPS (WRITES INVALIDATE IT)
+app.config["TICKET_COUNT_CACHE_TTL_SECONDS"] = 30
+
+# PER-TRANSIENT LIGHTCURVE CACHE OF /getLightcurve (ENTRIES ARE REVALIDATED ON EVERY REQUEST)
+app.config["LIGHTCURVE_CACHE_TTL_SECONDS"] = 3600
+app.config["LIGHTCURVE_CACHE_MAX_TRANSIENTS"] = 5000
+
+# SHARED I/O POOL FOR THE ASSETS MOUNT: THREADS, CONCURRENT READS ON THE MOUNT AND PER-REQUEST DEADLINE
+app.config["ASSETS_IO_WORKERS"] = 32
+app.config["ASSETS_IO_MAX_CONCURRENT_READS"] = 16
+app.config["ASSETS_REQUEST_TIMEOUT"] = 10
+
+# ASSET FILE CACHE: MEMORY BUDGET PER WORKER, SHARED LOCAL DISK TIER (None TO DISABLE) AND THUMBNAIL BOX
+app.config["ASSET_CACHE_MAX_BYTES"] = 128 * 1024 * 1024
+app.config["ASSET_CACHE_DISK_DIR"] = "/tmp/marshall_asset_cache"
+app.config["ASSET_CACHE_DISK_MAX_BYTES"] = 2 * 1024 * 1024 * 1024
+app.config["ASSET_THUMBNAIL_SIZE"] = (320, 320)
+
+# ASSET PRESENCE INDEX: LIFETIME OF A FOLDER LISTING AND OF A "NO ASSET FOLDER" RESULT
+app.config["ASSET_INDEX_TTL_SECONDS"] = 60
+app.config["ASSET_INDEX_MISSING_TTL_SECONDS"] = 300
+
+# HOW LONG BROWSERS MAY REUSE AN /asset FILE BEFORE REVALIDATING IT WITH ITS ETAG
+app.config["ASSET_MAX_AGE_SECONDS"] = 300
+
+# LIFETIME OF THE SIGNED /asset URLS LISTED BY THE MANIFEST (THEY ARE VALID FOR ONE TO TWO OF THESE PERIODS)
+app.config["ASSET_URL_TTL_SECONDS"] = 600
+
+# /supereventTransients: THE lvk_skytag COLUMNS HOLDING THE PROBABILITY, DISTANCE AND CREDIBLE CONTOUR OF A TAG
+app.config["SKYTAG_PROBABILITY_COLUMN"] = "probability"
+app.config["SKYTAG_DISTANCE_COLUMN"] = "distance"
+app.config["SKYTAG_CONTOUR_COLUMN"] = "contour"
+
+# CROSSMATCH ENRICHMENT (CATALOGUE LINK, BEST MAGNITUDE, SDSS NAME) KEPT PER CATALOGUE OBJECT
+app.config["CROSSMATCH_CACHE_TTL_SECONDS"] = 86400
+app.config["CROSSMATCH_CACHE_MAX_OBJECTS"] = 100000
+
+# HOW LONG THE INFORMATION_SCHEMA COLUMN PROJECTION IS CACHED FOR, AND HOW OFTEN A WORKER CHECKS
+# THE SHARED GENERATION BUMPED BY /invalidateSchemaCache
+app.config["SCHEMA_CACHE_TTL_SECONDS"] = 3600
+app.config["SCHEMA_CACHE_CHECK_SECONDS"] = 10
+
+# THE USERS (`firstname.secondname`) ALLOWED TO CALL THE ADMINISTRATIVE ROUTES, GIVEN AS A
+# COMMA-SEPARATED LIST IN MARSHALL_ADMIN_USERS (e.g. `jane.doe,john.smith`; UNSET MEANS NO ADMINS)
+app.config["ADMIN_USERS"] = tuple(u.strip() for u in os.environ.get("MARSHALL_ADMIN_USERS", "").split(",") if u.strip())
+
 
 jwt = JWTManager(app)
 
+db_pool = connection_pool(
+    log=log,
+    dbSettings=dbSettings,
+    minSize=app.config["DB_POOL_MIN_SIZE"],
+    maxSize=app.config["DB_POOL_MAX_SIZE"],
+    checkoutTimeout=app.config["DB_POOL_CHECKOUT_TIMEOUT"],
+    maxIdleSeconds=app.config["DB_POOL_MAX_IDLE_SECONDS"],
+    pingAfterIdleSeconds=app.config["DB_POOL_PING_AFTER_IDLE_SECONDS"]
+)
+
+associated_data_executor = ThreadPoolExecutor(
+    max_workers=app.config["TRANSIENTS_FETCH_WORKERS"],
+    thread_name_prefix="associated-data"
+)
+
+
+def get_db():
+  """Borrow a pooled connection for the lifetime of the current request."""
+  if "dbConn" not in g:
+    g.dbConn = db_pool.acquire()
+  return g.dbConn
+
+
+schemaCache.ttlSeconds = app.config["SCHEMA_CACHE_TTL_SECONDS"]
+crossmatchCache.ttlSeconds = app.config["CROSSMATCH_CACHE_TTL_SECONDS"]
+crossmatchCache.maxEntries = app.config["CROSSMATCH_CACHE_MAX_OBJECTS"]
+listCountsCache.ttlSeconds = app.config["LIST_COUNTS_CACHE_TTL_SECONDS"]
+ticketCountCache.ttlSeconds = app.config["TICKET_COUNT_CACHE_TTL_SECONDS"]
+lightcurveCache.ttlSeconds = app.config["LIGHTCURVE_CACHE_TTL_SECONDS"]
+lightcurveCache.maxEntries = app.config["LIGHTCURVE_CACHE_MAX_TRANSIENTS"]
+skytagColumns.update({
+  "probability": app.config["SKYTAG_PROBABILITY_COLUMN"],
+  "distance": app.config["SKYTAG_DISTANCE_COLUMN"],
+  "contour": app.config["SKYTAG_CONTOUR_COLUMN"]
+})
+
+
+@app.teardown_appcontext
+def release_db(exception):
+  dbConn = g.pop("dbConn", None)
+  if dbConn is not None:
+    db_pool.release(dbConn)
+
 # LIMITING THE AMOUNT OF API CALLS
 
 limiter = Limiter(
@@ -134,6 +337,70 @@ jwt_redis_blocklist = redis.StrictRedis(
     host="localhost", port=6379, db=0, decode_responses=True
 )
 
+# ONE I/O POOL FOR THE WHOLE PROCESS, SO CONCURRENT /getAssets CALLS CANNOT MULTIPLY THE THREADS
+assets_io_pool = bounded_io_pool(
+    log=log,
+    maxWorkers=app.config["ASSETS_IO_WORKERS"],
+    maxConcurrentReads=app.config["ASSETS_IO_MAX_CONCURRENT_READS"],
+    name="assets-io"
+)
+
+assets_presence_index = asset_presence_index(
+    log=log,
+    basePath=BASE_ASSETS_PATH,
+    filenames=ASSET_FILENAMES,
+    ttlSeconds=app.config["ASSET_INDEX_TTL_SECONDS"],
+    missingTtlSeconds=app.config["ASSET_INDEX_MISSING_TTL_SECONDS"]
+)
+
+assets_file_cache = asset_cache(
+    log=log,
+    maxBytes=app.config["ASSET_CACHE_MAX_BYTES"],
+    diskCacheDir=app.config["ASSET_CACHE_DISK_DIR"],
+    diskMaxBytes=app.config["ASSET_CACHE_DISK_MAX_BYTES"],
+    thumbnailSize=app.config["ASSET_THUMBNAIL_SIZE"]
+)
+
+cache_redis = redis.StrictRedis(host="localhost", port=6379, db=0)
+
+transients_response_cache = response_cache(
+    log=log,
+    redisClient=cache_redis,
+    ttlSeconds=app.config["RESPONSE_CACHE_TTL_SECONDS"]
+) if app.config["RESPONSE_CACHE_ENABLED"] else None
+
+# A SCHEMA MIGRATION IS PICKED UP BY EVERY WORKER THROUGH THIS SHARED GENERATION
+schemaCache.share_generation(
+    redisClient=cache_redis,
+    generationKey="marshall:schema_cache:generation",
+    checkIntervalSeconds=app.config["SCHEMA_CACHE_CHECK_SECONDS"]
+)
+
+transient_search_index = search_index(
+    log=log,
+    pool=db_pool,
+    redisClient=cache_redis,
+    checkIntervalSeconds=app.config["SEARCH_INDEX_CHECK_SECONDS"],
+    maxAgeSeconds=app.config["SEARCH_INDEX_MAX_AGE_SECONDS"]
+)
+
+transient_spatial_index = spatial_index(
+    log=log,
+    pool=db_pool,
+    redisClient=cache_redis,
+    zoneHeightDeg=app.config["SPATIAL_INDEX_ZONE_HEIGHT_DEG"],
+    checkIntervalSeconds=app.config["SEARCH_INDEX_CHECK_SECONDS"],
+    maxAgeSeconds=app.config["SPATIAL_INDEX_MAX_AGE_SECONDS"]
+)
+
+# THE WRITE ROUTES ADJUST THE SIDEBAR COUNTS INCREMENTALLY; THIS PERIODICALLY RECOUNTS THEM TO CORRECT ANY DRIFT
+sidebar_counts_reconciler = list_counts_reconciler(
+    log=log,
+    pool=db_pool,
+    redisClient=cache_redis,
+    intervalSeconds=app.config["LIST_COUNTS_RECONCILE_SECONDS"]
+)
+
 @jwt.token_in_blocklist_loader
 def check_if_token_is_revoked(jwt_header, jwt_payload: dict):
     jti = jwt_payload["jti"]
@@ -144,10 +411,7 @@ def check_if_token_is_revoked(jwt_header, jwt_payload: dict):
 @limiter.limit("3/second")
 def login():
   try:
-    dbConn = database(
-      log=log,
-      dbSettings=dbSettings
-    ).connect()
+    dbConn = get_db()
     firstname = request.json.get("firstname", None)
     lastname = request.json.get("lastname", None)
     password = request.json.get("password", None)
@@ -215,54 +479,94 @@ def logout():
 @jwt_required()
 def getTransients():
   try:
-    dbConn = database(
-      log=log,
-      dbSettings=dbSettings
-    ).connect()
+    dbConn = get_db()
 
     raw_payload = request.get_json(silent=True) or {}
     if not isinstance(raw_payload, dict):
       return jsonify({"msg": "Bad Request", "err": "Request body must be a JSON object"}), 400
 
-    sanitized_payload = _sanitize_get_transients_request(raw_payload)
-    print(sanitized_payload)
+    try:
+      sanitized_payload = _sanitize_get_transients_request(raw_payload)
+    except ValueError as ve:
+      return jsonify({"msg": "Bad Request", "err": str(ve)}), 400
+    log.debug("sanitized payload: %s" % (sanitized_payload,))
     if not sanitized_payload:
         return jsonify({"msg": "Bad Request", "err": "Please provide a valid request."}), 400
     if 'mwl' not in sanitized_payload and 'awl' not in sanitized_payload and 'q' not in sanitized_payload and 'snoozed' not in sanitized_payload and 'cf' not in sanitized_payload:
         return jsonify({"msg": "Please provide at least a valid Marshall Workflow location, Alert Workflow locationm query string or snoozed flag!", "err": "Invalid workflow"}), 400
 
-    model = models_transients_get(log, sanitized_payload, db=dbConn, search=True)
+    parallel = app.config["TRANSIENTS_PARALLEL_FETCH"]
+    streaming = sanitized_payload.get("format") == "ndjson"
+
+    # THE KEY (AND THE LIST GENERATIONS IT EMBEDS) MUST BE READ BEFORE THE MODEL QUERIES THE DATABASE
+    cache_key = None
+    if transients_response_cache:
+      cache_key = transients_response_cache.key_for(sanitized_payload)
+    if cache_key:
+      cached_body = transients_response_cache.get(cache_key)
+      if cached_body is not None:
+        return Response(cached_body, mimetype="application/json"), 200
+
+    # EVERY WRITE (OF ANY WORKER) BUMPS THE `all` GENERATION, WHICH RETIRES THE CACHED TOTALS
+    count_generation = None
+    if transients_response_cache:
+      count_generation = transients_response_cache.generation()
+
+    model = models_transients_get(
+      log,
+      sanitized_payload,
+      db=dbConn,
+      search=True,
+      pool=db_pool,
+      executor=associated_data_executor if parallel else None,
+      subqueryTimeout=app.config["TRANSIENTS_SUBQUERY_TIMEOUT"],
+      stream=streaming,
+      searchIndex=transient_search_index,
+      countGeneration=count_generation
+    )
+
+    # NEWLINE-DELIMITED JSON EXPORT: A HEADER LINE, THEN ONE TRANSIENT PER LINE
+    if streaming:
+      def generate_ndjson():
+        for record in model.stream(batchSize=app.config["TRANSIENTS_STREAM_BATCH_SIZE"]):
+          yield app.json.dumps(record) + "\n"
+      return Response(stream_with_context(generate_ndjson()), mimetype="application/x-ndjson"), 200
+
     result = model.get()
     
     # Check if result is a dictionary (counts for all lists when mwl="all")
     if isinstance(result, dict):
-      response = {
+      response = jsonify({
         "listCounts": result
-      }
-      return jsonify(response), 200
+      })
+      if cache_key:
+        transients_response_cache.set(cache_key, response.get_data())
+      return response, 200
     
     # Otherwise, it's the standard response structure
 
-    # TODO - Currently, the free text search works only for a single transient. In principle
-    # it should work for many. This workaround (checking len of transientData) is inserted
-    # for returning a consistent respond.
-
     qs, transientData, transientAkas, transientLightcurveData, transientAtelMatches, transients_comments, totalTicketCount, transient_history, transient_crossmatches, skyTags = result
     response ={
       "qs": qs,
       "transientData": transientData,
-      "akas": transientAkas if len(transientData) > 0  else [],
-      "lc_data": transientLightcurveData if len(transientData) > 0  else [],
-      "ts_atel_matches": transientAtelMatches if len(transientData) > 0  else [],
-      "comments": transients_comments if len(transientData) > 0  else [],
-      "totalTicketCount": totalTicketCount if len(transientData) > 0  else [],
-      "transient_history": transient_history if len(transientData) > 0  else [],
-      "ts_xmatches": transient_crossmatches if len(transientData) > 0  else [],
-      "ts_skytag": skyTags
+      "akas": transientAkas,
+      "lc_data": transientLightcurveData,
+      "ts_atel_matches": transientAtelMatches,
+      "comments": transients_comments,
+      "totalTicketCount": totalTicketCount,
+      "transient_history": transient_history,
+      "ts_xmatches": transient_crossmatches,
+      "ts_skytag": skyTags,
+      "incompleteData": model.incompleteData,
+      "nextCursor": model.nextCursor,
+      "queryPlan": model.queryPlan
 
     }
-    print("returning ", str(len(transientData)))
-    return jsonify(response), 200
+    log.debug("returning %s transients" % (len(transientData),))
+    response = jsonify(response)
+    if cache_key and not model.incompleteData:
+      transients_response_cache.set(cache_key, response.get_data())
+    return response, 200
   except Exception as e:
     print(e)
     print(traceback.format_exc())
@@ -274,10 +578,7 @@ def getTransients():
 @jwt_required()
 def patchTransient():
   try:
-    dbConn = database(
-      log=log,
-      dbSettings=dbSettings
-    ).connect()
+    dbConn = get_db()
 
     raw_payload = request.get_json(silent=True) or {}
     if not isinstance(raw_payload, dict):
@@ -291,9 +592,16 @@ def patchTransient():
     except ValueError as ve:
       return jsonify({"msg": "Bad Request", "err": str(ve)}), 400
 
-    model = models_transients_element_put(log, sanitized_payload, dbConn)
+    model = models_transients_element_put(log, sanitized_payload, dbConn, cache=transients_response_cache, searchIndex=transient_search_index)
     response = model.put()
-    return jsonify({"msg": response}), 200
+    body = {"msg": response}
+    # PER-TRANSIENT OUTCOMES OF A BULK LIST MOVE
+    if model.results is not None:
+      body["results"] = model.results
+    resp = jsonify(body)
+    if model.timings:
+      resp.headers["Server-Timing"] = _server_timing(model.timings)
+    return resp, 200
   except Exception as e:
     print(e)
     print(traceback.format_exc())
@@ -305,10 +613,7 @@ def patchTransient():
 @jwt_required()
 def classifyTransient():
   try:
-    dbConn = database(
-      log=log,
-      dbSettings=dbSettings
-    ).connect()
+    dbConn = get_db()
 
     raw_payload = request.get_json(silent=True) or {}
     if not isinstance(raw_payload, dict):
@@ -322,9 +627,12 @@ def classifyTransient():
     except ValueError as ve:
       return jsonify({"msg": "Bad Request", "err": str(ve)}), 400
 
-    model = models_transients_element_put(log, sanitized_payload, dbConn)
+    model = models_transients_element_put(log, sanitized_payload, dbConn, cache=transients_response_cache, searchIndex=transient_search_index)
     response = model.put()
-    return jsonify({"msg": response}), 200
+    resp = jsonify({"msg": response})
+    if model.timings:
+      resp.headers["Server-Timing"] = _server_timing(model.timings)
+    return resp, 200
   except Exception as e:
     print(e)
     print(traceback.format_exc())
@@ -335,10 +643,7 @@ def classifyTransient():
 @jwt_required()
 def putComment():
   try:
-    dbConn = database(
-      log=log,
-      dbSettings=dbSettings
-    ).connect()
+    dbConn = get_db()
 
     raw_payload = request.get_json(silent=True) or {}
     if not isinstance(raw_payload, dict):
@@ -352,9 +657,68 @@ def putComment():
     except ValueError as ve:
       return jsonify({"msg": "Bad Request", "err": str(ve)}), 400
 
-    model = models_transients_comments_put(log, sanitized_payload, dbConn)
+    model = models_transients_comments_put(log, sanitized_payload, dbConn, cache=transients_response_cache)
     response = model.put()
-    return jsonify({"msg": response}), 200
+    resp = jsonify({"msg": response})
+    if model.timings:
+      resp.headers["Server-Timing"] = _server_timing(model.timings)
+    return resp, 200
+  except Exception as e:
+    print(e)
+    print(traceback.format_exc())
+    return jsonify({"msg": "Bad Request", "err": str(traceback.format_exc())}), 400
+
+# LIGHTCURVES OF ONE OR MANY TRANSIENTS; sinceMjd RETURNS ONLY THE POINTS NEWER THAN THE CLIENT'S LATEST
+@app.route("/getLightcurve", methods=["POST"])
+@limiter.limit("10/second")
+@jwt_required()
+def getLightcurve():
+  try:
+    dbConn = get_db()
+
+    raw_payload = request.get_json(silent=True) or {}
+    try:
+      sanitized_payload = _sanitize_get_lightcurve_request(raw_payload)
+    except ValueError as ve:
+      return jsonify({"msg": "Bad Request", "err": str(ve)}), 400
+
+    model = models_transients_lightcurves_get(
+      log,
+      sanitized_payload,
+      elementId=sanitized_payload["transientBucketIds"],
+      db=dbConn
+    )
+    lightcurves = model.get()
+    return jsonify({"lightcurves": lightcurves}), 200
+  except Exception as e:
+    print(e)
+    print(traceback.format_exc())
+    return jsonify({"msg": "Bad Request", "err": str(traceback.format_exc())}), 400
+
+# THE TRANSIENTS TAGGED BY THE LATEST ALERT OF A SUPEREVENT, RANKED BY PROBABILITY OR DISTANCE
+@app.route("/supereventTransients", methods=["POST"])
+@limiter.limit("10/second")
+@jwt_required()
+def supereventTransients():
+  try:
+    dbConn = get_db()
+
+    raw_payload = request.get_json(silent=True) or {}
+    try:
+      sanitized_payload = _sanitize_superevent_request(raw_payload)
+    except ValueError as ve:
+      return jsonify({"msg": "Bad Request", "err": str(ve)}), 400
+
+    model = models_superevent_transients_get(
+      log,
+      sanitized_payload,
+      elementId=sanitized_payload["supereventId"],
+      db=dbConn
+    )
+    superevent = model.get()
+    if superevent is None:
+      return jsonify({"msg": "Not Found", "err": "No alert found for superevent %s" % sanitized_payload["supereventId"]}), 404
+    return jsonify(superevent), 200
   except Exception as e:
     print(e)
     print(traceback.format_exc())
@@ -365,10 +729,7 @@ def putComment():
 @jwt_required()
 def countTransients():
   try:
-    dbConn = database(
-      log=log,
-      dbSettings=dbSettings
-    ).connect()
+    dbConn = get_db()
 
     raw_payload = request.get_json(silent=True) or {}
     if not isinstance(raw_payload, dict):
@@ -382,27 +743,34 @@ def countTransients():
       count = model.get()
     else: 
       raise Exception("bad request! Please check the provided flags and format.")
-    return jsonify(count=count), 200
+
+    # POLLING CLIENTS SEND THE ETAG BACK AND GET A 304 WHILE THE COUNTS ARE UNCHANGED
+    response = jsonify(count=count)
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
   except Exception as err:
     return jsonify({"msg": "Bad Request", "err": str(traceback.format_exc())}), 400
 
 
-def getSingleAsset(tbid):
+def getSingleAsset(tbid, thumbnails=False):
   assets = {
     "HOST": [],
     "PHOT": [],
     "STAMP": []
   }
   try:
-      safe_tbid = str(tbid)
-      dir_path = os.path.join(BASE_ASSETS_PATH, safe_tbid)
-      if os.path.isdir(dir_path):
+      # ONE CACHED DIRECTORY LISTING INSTEAD OF AN isdir AND A stat PER ASSET ON THE MOUNT
+      listing = assets_presence_index.listing(tbid)
+      if listing is not None:
+        dir_path = os.path.join(BASE_ASSETS_PATH, str(int(tbid)))
         for ad in asset_defs:
           file_path = os.path.join(dir_path, ad["filename"])
           encoded_data = None
+          st = listing.get(ad["filename"])
           try:
-            st = os.stat(file_path)
-            encoded_data = _read_b64_cached(file_path, st.st_mtime_ns, st.st_size)
+            if st is not None:
+              encoded_data = _read_b64_cached(file_path, st, thumbnail=thumbnails)
           except FileNotFoundError:
             encoded_data = None
           except Exception:
@@ -421,6 +789,51 @@ def getSingleAsset(tbid):
   return tbid, assets
 
 
+def getSingleAssetManifest(tbid, scriptRoot=""):
+  assets = {
+    "HOST": [],
+    "PHOT": [],
+    "STAMP": []
+  }
+  try:
+      safe_tbid = int(tbid)
+      dir_path = os.path.join(BASE_ASSETS_PATH, str(safe_tbid))
+      listing = assets_presence_index.listing(safe_tbid)
+      if listing is not None:
+        for ad in asset_defs:
+          file_path = os.path.join(dir_path, ad["filename"])
+          entry = {
+            "label": ad["assetDescription"],
+            "format": ad["format"],
+            "name": ad["filename"],
+            "url": None,
+            "thumbnailUrl": None,
+            "size": None,
+            "etag": None,
+            "hash": None
+          }
+          st = listing.get(ad["filename"])
+          try:
+            if st is None:
+              raise FileNotFoundError(file_path)
+            entry["url"] = _signed_asset_url(scriptRoot, safe_tbid, ad["filename"])
+            entry["thumbnailUrl"] = entry["url"] + "&size=thumb"
+            entry["size"] = st.st_size
+            entry["etag"] = _asset_etag(st)
+            entry["hash"] = "sha256:" + _content_hash_cached(file_path, st.st_mtime_ns, st.st_size)
+          except FileNotFoundError:
+            pass
+          except Exception as ex:
+            log.warning("could not describe the asset %s: %s" % (file_path, ex))
+
+          assets[ad["assetGroup"]].append(entry)
+  except Exception as ex:
+        # Any error relative to this tbid: report as empty and log it, avoid aborting on single error
+        log.warning("could not list the assets of %s: %s" % (tbid, ex))
+
+  return tbid, assets
+
+
 @app.route("/getAssets", methods=["POST"])  
 @limiter.limit("10/second")
 @jwt_required()
@@ -434,18 +847,28 @@ def getAssets():
     if not isinstance(transient_ids, list):
       return jsonify({"msg": "Bad Request", "err": "transientBucketIDs must be a list"}), 400
     
-    results = {}
-    futures = []
-    executor = concurrent.futures.ThreadPoolExecutor(max_workers=20)
-    for tbid in transient_ids:
-      futures.append(executor.submit(getSingleAsset, tbid=tbid))
+    # mode="manifest" LISTS THE ASSET URLS (FETCHED FROM /asset/<tbid>/<name>) INSTEAD OF INLINING BASE64 DATA
+    if raw_payload.get("mode") == "manifest":
+      scriptRoot = request.script_root
+      worker = lambda tbid: getSingleAssetManifest(tbid, scriptRoot=scriptRoot)
+    else:
+      # LIST VIEWS ASK FOR thumbnails; THE FULL-RESOLUTION FILES ARE ONLY NEEDED ON THE DETAIL VIEW
+      thumbnails = bool(raw_payload.get("thumbnails"))
+      worker = lambda tbid: getSingleAsset(tbid, thumbnails=thumbnails)
 
-    for future in concurrent.futures.as_completed(futures):
-      tbid, data = future.result()
+    results = {}
+    completed, missed = assets_io_pool.map_with_deadline(
+      worker, transient_ids, timeout=app.config["ASSETS_REQUEST_TIMEOUT"])
+    for _, (tbid, data) in completed:
       results[tbid] = data
-      #results.append(future.result())
-      
-    return jsonify(results), 200
+
+    # TRANSIENTS WHOSE DIRECTORY WAS TOO SLOW TO READ ARE RETURNED EMPTY AND LISTED IN A HEADER
+    for tbid in missed:
+      results[tbid] = {"HOST": [], "PHOT": [], "STAMP": []}
+    response = jsonify(results)
+    if missed:
+      response.headers["X-Assets-Incomplete"] = ",".join(str(t) for t in missed)
+    return response, 200
   except Exception as e:
     print(e)
     print(traceback.format_exc())
@@ -454,15 +877,52 @@ def getAssets():
       "err": str(traceback.format_exc())
     }), 400
 
+# RAW ASSET FILE WITH CONDITIONAL GET AND RANGE SUPPORT; <img> TAGS USE THE SHORT-LIVED SIGNED URLS OF THE MANIFEST
+@app.route("/asset/<int:tbid>/<name>", methods=["GET"])
+@limiter.limit("100/second")
+def getAsset(tbid, name):
+  if name not in ASSET_FILENAMES:
+    abort(404)
+  if not _asset_request_authorized(tbid, name):
+    return jsonify({"msg": "Unauthorized", "err": "A bearer token or a valid signed asset URL is required"}), 401
+  # KNOWN-MISSING FILES ARE ANSWERED WITHOUT TOUCHING THE MOUNT
+  listing = assets_presence_index.listing(tbid)
+  if listing is None or name not in listing:
+    abort(404)
+  file_path = os.path.join(BASE_ASSETS_PATH, str(tbid), name)
+  try:
+    st = os.stat(file_path)
+  except FileNotFoundError:
+    abort(404)
+
+  # ?size=thumb SERVES THE DOWNSCALED COPY FOR THE LIST VIEWS
+  if request.args.get("size") == "thumb":
+    response = send_file(
+      io.BytesIO(assets_file_cache.get_thumbnail(file_path, st)),
+      mimetype=mimetypes.guess_type(name)[0],
+      conditional=True,
+      etag=_asset_etag(st) + "-thumb",
+      last_modified=st.st_mtime,
+      max_age=app.config["ASSET_MAX_AGE_SECONDS"]
+    )
+  else:
+    response = send_file(
+      file_path,
+      conditional=True,
+      etag=_asset_etag(st),
+      last_modified=st.st_mtime,
+      max_age=app.config["ASSET_MAX_AGE_SECONDS"]
+    )
+  response.cache_control.public = False
+  response.cache_control.private = True
+  return response
+
 @app.route("/putTransient", methods=["PUT"])
 @limiter.limit("3/second")
 @jwt_required()
 def putTransient():
   try:
-    dbConn = database(
-      log=log,
-      dbSettings=dbSettings
-    ).connect()
+    dbConn = get_db()
   except Exception as e:
     print(e)
     print(traceback.format_exc())
@@ -480,15 +940,129 @@ def putTransient():
   except Exception as ve:
     return jsonify({"msg": "Bad Request", "err": str(ve)}), 400
   try:
-    model = models_transients_element_put(log, sanitized_payload, dbConn)
+    model = models_transients_element_put(log, sanitized_payload, dbConn, cache=transients_response_cache, searchIndex=transient_search_index)
     response = model.put()
-    return jsonify({"msg": response}), 200
+    # THE NEW TRANSIENT'S POSITION MUST SHOW UP IN /coneSearch
+    transient_spatial_index.mark_stale()
+    resp = jsonify({"msg": response})
+    if model.timings:
+      resp.headers["Server-Timing"] = _server_timing(model.timings)
+    return resp, 200
+  except Exception as e:
+    print(e)
+    print(traceback.format_exc())
+    return jsonify({"msg": "Bad Request", "err": str(traceback.format_exc())}), 400
+
+
+# POSITIONAL SEARCH: A CONE (ra, dec, radius), A BOX (raMin, raMax, decMin, decMax) OR A
+# BATCH CROSS-MATCH OF MANY POSITIONS (positions, radius), ANSWERED FROM THE IN-MEMORY INDEX
+@app.route("/coneSearch", methods=["POST"])
+@limiter.limit("10/second")
+@jwt_required()
+def coneSearch():
+  try:
+    raw_payload = request.get_json(silent=True) or {}
+    try:
+      sanitized_payload = _sanitize_cone_search_request(raw_payload)
+    except ValueError as ve:
+      return jsonify({"msg": "Bad Request", "err": str(ve)}), 400
+
+    if not transient_spatial_index.ready:
+      response = jsonify({"msg": "Service Unavailable", "err": "The positional index is still being built, please retry shortly"})
+      response.headers["Retry-After"] = "5"
+      return response, 503
+
+    mode = sanitized_payload["mode"]
+    limit = sanitized_payload["limit"]
+    if mode == "cone":
+      matches = transient_spatial_index.cone(
+        sanitized_payload["ra"], sanitized_payload["dec"], sanitized_payload["radius"] / 3600.0, limit=limit)
+    elif mode == "box":
+      matches = transient_spatial_index.box(
+        sanitized_payload["raMin"], sanitized_payload["raMax"], sanitized_payload["decMin"], sanitized_payload["decMax"], limit=limit)
+    else:
+      matches = transient_spatial_index.batch(
+        sanitized_payload["positions"], sanitized_payload["radius"] / 3600.0,
+        nearestOnly=sanitized_payload["nearestOnly"], limitPerPosition=limit)
+
+    return jsonify({
+      "mode": mode,
+      "matches": matches,
+      "indexAgeSeconds": transient_spatial_index.ageSeconds
+    }), 200
+  except Exception as e:
+    print(e)
+    print(traceback.format_exc())
+    return jsonify({"msg": "Bad Request", "err": str(traceback.format_exc())}), 400
+
+
+@app.route("/invalidateSchemaCache", methods=["POST"])
+@limiter.limit("3/second")
+@jwt_required()
+def invalidateSchemaCache():
+  try:
+    if get_jwt_identity() not in app.config["ADMIN_USERS"]:
+      return jsonify({"msg": "Forbidden", "err": "Only administrators can invalidate the schema cache"}), 403
+    schemaCache.bump_generation()
+    log.info("schema metadata cache invalidated")
+    return jsonify({"msg": "Schema cache invalidated"}), 200
   except Exception as e:
     print(e)
     print(traceback.format_exc())
     return jsonify({"msg": "Bad Request", "err": str(traceback.format_exc())}), 400
 
 
-if __name__ == "__main__":  
+def _metrics_scrape_allowed():
+  if request.remote_addr in app.config["METRICS_ALLOWED_IPS"]:
+    return True
+  token = app.config["METRICS_SCRAPE_TOKEN"]
+  authorization = request.headers.get("Authorization", "")
+  if token and authorization.startswith("Bearer "):
+    return hmac.compare_digest(authorization[len("Bearer "):].encode("utf-8"), token.encode("utf-8"))
+  return False
+
+
+@app.route("/metrics", methods=["GET"])
+@limiter.exempt
+def metrics():
+  """Expose the worker metrics in the Prometheus text format for scraping."""
+  if not _metrics_scrape_allowed():
+    return jsonify({"msg": "Forbidden", "err": "Metrics are only served to the configured scrapers"}), 403
+  lines = []
+  pool_metrics = db_pool.metrics()
+  for key, value in sorted(pool_metrics.items()):
+    lines.append("marshall_db_pool_%s %s" % (key, value))
+  for key, value in sorted(schemaCache.metrics().items()):
+    lines.append("marshall_schema_cache_%s %s" % (key, value))
+  for key, value in sorted(crossmatchCache.metrics().items()):
+    lines.append("marshall_crossmatch_cache_%s %s" % (key, value))
+  for key, value in sorted(assets_io_pool.metrics().items()):
+    lines.append("marshall_assets_io_%s %s" % (key, value))
+  for key, value in sorted(assets_presence_index.metrics().items()):
+    lines.append("marshall_asset_index_%s %s" % (key, value))
+  for key, value in sorted(assets_file_cache.metrics().items()):
+    lines.append("marshall_asset_cache_%s %s" % (key, value))
+  for key, value in sorted(ticketCountCache.metrics().items()):
+    lines.append("marshall_ticket_count_cache_%s %s" % (key, value))
+  for key, value in sorted(supereventCache.metrics().items()):
+    lines.append("marshall_superevent_cache_%s %s" % (key, value))
+  for key, value in sorted(lightcurveCache.metrics().items()):
+    lines.append("marshall_lightcurve_cache_%s %s" % (key, value))
+  for key, value in sorted(transient_search_index.metrics().items()):
+    lines.append("marshall_search_index_%s %s" % (key, value))
+  for key, value in sorted(transient_spatial_index.metrics().items()):
+    lines.append("marshall_spatial_index_%s %s" % (key, value))
+  lines.append("marshall_list_counts_reconcile_runs %s" % sidebar_counts_reconciler.runs)
+  for key, value in sorted(unit_of_work_metrics().items()):
+    lines.append("marshall_write_transactions_%s %s" % (key, value))
+  for key, value in sorted(statement_metrics().items()):
+    lines.append("marshall_sql_statements_%s %s" % (key, value))
+  if transients_response_cache:
+    for key, value in sorted(transients_response_cache.metrics().items()):
+      lines.append("marshall_response_cache_%s %s" % (key, value))
+  return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+if __name__ == "__main__":
   print("Starting app, listening on port 8000")
   app.run(port=8000)
\ No newline at end of file
@@ -43,7 +43,7 @@ class base_model(object):
         # self.resourceName = "basemodel"
 
         if isinstance(elementId, list):
-            self.elementId = (",").join(str(elementId))
+            self.elementId = (",").join([str(e) for e in elementId])
 
         return None
 
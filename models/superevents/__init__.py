@@ -0,0 +1 @@
+from .. import base_model
\ No newline at end of file
@@ -0,0 +1,180 @@
+#!/usr/local/bin/python
+# encoding: utf-8
+"""
+*The data model module for the `superevent_transients_get` resource*
+
+:Author:
+    David Young
+: Modified by:
+    Marco Landoni for Flask porting
+"""
+from models import base_model
+from packages.caching import ttl_cache
+from packages import statements
+
+# THE SKYTAGS OF THE LATEST ALERT OF EACH SUPEREVENT, RANKED ONCE; KEYED ON THE ALERT MAPS AND THEIR
+# SKYTAG COUNTS, SO A NEW ALERT (OR A MAP STILL BEING TAGGED) IS NEVER SERVED FROM A STALE LIST
+supereventCache = ttl_cache(ttlSeconds=3600, maxEntries=64)
+
+# THE DIRECTION OF EACH RANKING WHEN sortDesc IS NOT GIVEN: MOST PROBABLE / NEAREST FIRST
+defaultSortDesc = {
+    "probability": True,
+    "distance": False
+}
+
+# THE lvk_skytag COLUMNS THE RANKINGS AND THE CREDIBLE REGION CUT READ (SEE app.config)
+skytagColumns = {
+    "probability": "probability",
+    "distance": "distance",
+    "contour": "contour"
+}
+
+
+class models_superevent_transients_get(base_model):
+    """
+    The worker class for the models_superevent_transients_get module
+
+    Lists the transients skytagged by the latest alert of a superevent, ranked by probability
+    or distance. The ranked list is built with one two-table query the first time a given
+    alert is requested and then paged from ``supereventCache``; a request only runs a single
+    row lookup of the superevent's latest alert to validate the cached list.
+
+    **Key Arguments**
+
+    - ``log`` -- logger
+    - ``request`` -- the request; ``sortBy`` (``probability``/``distance``), ``sortDesc`` (descending; defaults to most probable / nearest first), ``maxContour``, ``pageStart`` and ``limit``
+    - ``elementId`` -- the superevent id (e.g. ``S230518h``)
+    - ``db`` -- the database connection
+
+    """
+
+    def __init__(self, log, request, elementId=False, search=False, db=None):
+        super().__init__(log, request, elementId, search)
+        self.resourceName = "superevent_transients"
+        self.defaultQs = {
+            "sortBy": "probability",
+            "pageStart": 0,
+            "limit": 100
+        }
+        self._set_default_parameters()
+        self.dbConn = db
+        self.cached = False
+
+        log.debug(
+            "instansiating a new 'models_superevent_transients_get' object")
+        return None
+
+    def get(self):
+        """execute the get method on the models_superevent_transients_get object
+
+        **Return**
+
+        - ``responseContent`` -- the superevent, its latest alert and one page of ranked skytags, or None if the superevent has no alert
+
+        """
+        self.log.debug('starting the ``get`` method')
+
+        supereventId = self.elementId
+        ranked = self._get_ranked_skytags(supereventId)
+        if ranked is None:
+            return None
+        alertTime, mapIds, rows, rankings = ranked
+
+        sortBy = self.qs["sortBy"]
+        order = rankings[sortBy]
+        sortDesc = defaultSortDesc[sortBy]
+        if "sortDesc" in self.qs:
+            sortDesc = self.qs["sortDesc"] in (True, "True")
+        if sortDesc != defaultSortDesc[sortBy]:
+            # THE CACHED RANKING IS IN THE DEFAULT DIRECTION; REVERSE IT, UNRANKED ROWS STILL LAST
+            rankedRows = [i for i in order if rows[i].get(skytagColumns[sortBy]) is not None]
+            order = rankedRows[::-1] + order[len(rankedRows):]
+
+        maxContour = self.qs.get("maxContour")
+        if maxContour is not None:
+            contour = skytagColumns["contour"]
+            order = [i for i in order if rows[i].get(contour) is not None and rows[i][contour] <= maxContour]
+
+        pageStart = int(self.qs["pageStart"])
+        limit = int(self.qs["limit"])
+        responseContent = {
+            "supereventId": supereventId,
+            "alertTime": alertTime,
+            "mapIds": mapIds,
+            "sortBy": sortBy,
+            "sortDesc": sortDesc,
+            "totalTicketCount": len(order),
+            "skytags": [rows[i] for i in order[pageStart:pageStart + limit]],
+            "cached": self.cached
+        }
+
+        self.log.debug('completed the ``get`` method')
+        return responseContent
+
+    def _get_ranked_skytags(
+            self,
+            supereventId):
+        """*return the skytags of the latest alert of a superevent and their rankings, from the cache when still current*
+
+        **Key Arguments**
+
+        - ``supereventId`` -- the superevent id
+
+        **Return**
+
+        - ``ranked`` -- ``(alertTime, mapIds, rows, rankings)`` where ``rankings`` maps ``probability``/``distance`` to the row order, or None if the superevent has no alert
+        """
+        self.log.debug('starting the ``_get_ranked_skytags`` method')
+
+        # THE MAP(S) OF THE LATEST ALERT AND HOW MANY TRANSIENTS THEY TAG SO FAR
+        sqlQuery = """
+            select a.primaryId as mapId, a.alert_time, (select count(*) from lvk_skytag s where s.mapId = a.primaryId) as skytags from lvk_events e, lvk_alerts a where e.superevent_id = %s and a.superevent_id = e.superevent_id and a.alert_time = e.alert_time order by a.primaryId
+        """
+        maps = statements.read(self.log, self.dbConn, sqlQuery, (supereventId,))
+        if not maps:
+            return None
+        alertTime = maps[0]["alert_time"]
+        mapIds = [m["mapId"] for m in maps]
+        version = tuple([(m["mapId"], m["skytags"]) for m in maps])
+
+        key = (supereventId, alertTime, version)
+        cached = supereventCache.get(key)
+        if cached is not None:
+            self.cached = True
+            return cached
+
+        sqlQuery = """
+            select s.*, a.alert_time from lvk_skytag s, lvk_alerts a where s.mapId = a.primaryId and a.primaryId in %s
+        """
+        rows = statements.read(self.log, self.dbConn, sqlQuery, (mapIds,))
+
+        rankings = {}
+        for sortBy, descending in defaultSortDesc.items():
+            column = skytagColumns[sortBy]
+            ranked = [i for i in range(len(rows)) if rows[i].get(column) is not None]
+            ranked.sort(key=lambda i: (rows[i][column], rows[i]["transientBucketId"]))
+            if descending:
+                ranked.sort(key=lambda i: rows[i][column], reverse=True)
+            unranked = [i for i in range(len(rows)) if rows[i].get(column) is None]
+            rankings[sortBy] = ranked + unranked
+
+        ranked = (alertTime, mapIds, rows, rankings)
+        supereventCache.set(key, ranked)
+
+        self.log.debug('completed the ``_get_ranked_skytags`` method')
+        return ranked
+
+    def _set_default_parameters(
+            self):
+        """ set default parameters
+        """
+        self.log.debug('starting the ``_set_default_parameters`` method')
+
+        for k, v in self.defaultQs.items():
+            if k not in self.qs:
+                self.qs[k] = v
+
+        self.log.debug('completed the ``_set_default_parameters`` method')
+        return None
+
+    # xt-class-method
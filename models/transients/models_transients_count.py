@@ -13,6 +13,14 @@ from builtins import object
 import sys
 import os
 from fundamentals.mysql import readquery
+from packages.caching import ttl_cache
+
+# THE WHOLE `meta_workflow_lists_counts` TABLE, SHARED BY THE SIDEBAR POLLS OF EVERY BROWSER TAB
+listCountsCache = ttl_cache(ttlSeconds=5, maxEntries=1)
+
+# TOTALS OF THE FILTERED AND SEARCHED TICKET LISTS (KEYED ON THE NORMALISED COUNT QUERY,
+# ITS ARGUMENTS AND THE WRITE GENERATION), SO A PAGE FLIP DOES NOT RE-RUN THE count(*)
+ticketCountCache = ttl_cache(ttlSeconds=30, maxEntries=256)
 
 
 class models_transients_count(object):
@@ -54,10 +62,12 @@ class models_transients_count(object):
         return None
 
     def get(self):
+        counts = self._get_list_counts()
+
         if self.mwfFlag == 'allQueues':
             all_list = []
             for queue in ['inbox', 'snoozed', 'review for followup', 'pending observation', 'following', 'followup complete', 'archive']:
-                count = self._get_single_counts(queue, None, None,None)
+                count = self._get_single_counts(queue, None, None, None, counts)
                 if queue == "pending observation":
                     queue = "Classification targets"
                 if queue == "following":
@@ -67,80 +77,78 @@ class models_transients_count(object):
             # ALERT WORKFLOW
 
             for queue in ['queued for atel',]:
-                count = self._get_single_counts(None, queue, None, None)
+                count = self._get_single_counts(None, queue, None, None, counts)
                 all_list.append({queue: count})
             
 
-            # NOW ADDING ALL THE CLASSIFIED TARGETS
-            count = self._get_single_counts(None, None, True, None)
+            # NOW ADDING ALL THE CLASSIFIED TARGETS
+            count = self._get_single_counts(None, None, True, None, counts)
             all_list.append({"Classified": count})
 
             return all_list
 
         else:
-            count = self._get_single_counts(self.mwfFlag, self.awfFlag, self.cFlag, self.snoozed)
+            count = self._get_single_counts(self.mwfFlag, self.awfFlag, self.cFlag, self.snoozed, counts)
             return count
 
+    def _get_list_counts(self):
+        """*read every row of ``meta_workflow_lists_counts`` in a single query*
+
+        The rows are kept in ``listCountsCache`` for a few seconds.
 
-    def _get_single_counts(self, mwfFlag, awfFlag, cFlag, snoozed):
+        **Return**
+
+        - ``counts`` -- dictionary of lowercased listName to count
+        """
+        def read_counts():
+            sqlQuery = """select listName, count from meta_workflow_lists_counts"""
+            rows = readquery(sqlQuery, self.dbConn, self.log)
+            counts = {}
+            for row in rows:
+                listName = (row["listName"] or "").lower()
+                counts[listName] = counts.get(listName, 0) + (row["count"] or 0)
+            return counts
+
+        return listCountsCache.get_or_set("counts", read_counts)
+
+    def _get_single_counts(self, mwfFlag, awfFlag, cFlag, snoozed, counts):
         """get the models_transients_count object
 
+        Each flag restricts the list names summed, exactly like the ``AND`` clauses of a
+        ``select count from meta_workflow_lists_counts where ...`` would (list names are
+        compared case-insensitively, as by the MySQL collation).
+
+        **Key Arguments**
+
+        - ``counts`` -- the list counts returned by ``_get_list_counts``
+
         **Return**
 
         - ``models_transients_count``
         """
         self.log.debug('starting the ``get`` method')
 
-        #mwfFlag = self.mwfFlag
-        #awfFlag = self.awfFlag
-        #cFlag = self.cFlag
-        #snoozed = self.snoozed
-
         if mwfFlag == "allObsQueue":
             mwfFlag = ["following", "pending observation"]
 
-        # BUILD THE QUERY TO COUNT THE TRANSIENTS WITHIN A GIVEN MARSHALL
-        # SIDEBAR LIST
-        sqlQuery = """select count from meta_workflow_lists_counts where 1=1 """
-
-        # AMEND WHERE CLAUSE TO INCLUDE WORKFLOW LOCATION FLAGS #
-        extraWhere = ""
-        if isinstance(mwfFlag, list):
-            mwfFlag = ('","').join(mwfFlag)
-            extraWhere = """%(extraWhere)s AND listName in ("%(mwfFlag)s") """ % locals(
-            )
-        elif mwfFlag:
-            mwfFlag = mwfFlag.replace('"', '')
-            extraWhere = """%(extraWhere)s AND listName in ("%(mwfFlag)s") """ % locals(
-            )
-
-        if isinstance(awfFlag, list):
-            awfFlag = ('","').join(awfFlag)
-            extraWhere = """%(extraWhere)s AND listName in ("%(awfFlag)s") """ % locals(
-            )
-        elif awfFlag:
-            awfFlag = awfFlag.replace('"', '')
-            extraWhere = """%(extraWhere)s AND listName in ("%(awfFlag)s") """ % locals(
-            )
+        # EVERY FLAG NARROWS THE SET OF MATCHING SIDEBAR LISTS
+        listNames = set(counts)
+        for flag in (mwfFlag, awfFlag):
+            if isinstance(flag, list):
+                listNames &= set([f.lower() for f in flag])
+            elif flag:
+                listNames &= set([flag.replace('"', '').lower()])
 
         if(cFlag != None):
-            extraWhere = """%(extraWhere)s  AND listName = "classified" """ % locals(
-            )
+            listNames &= set(["classified"])
 
         if snoozed:
-            extraWhere = """%(extraWhere)s  AND listName = "snoozed" """ % locals(
-            )
-
-        sqlQuery = """%(sqlQuery)s %(extraWhere)s;""" % locals()
-
-        # print(sqlQuery)
-
-        rows = readquery(sqlQuery, self.dbConn, self.log)
+            listNames &= set(["snoozed"])
 
         count = 0
-        for row in rows:
-            count += row["count"]
+        for listName in listNames:
+            count += counts[listName]
 
         self.log.debug('completed the ``get`` method')
         return count
-    # xt-class-method
\ No newline at end of file
+    # xt-class-method
@@ -14,7 +14,9 @@ import urllib.error
 import urllib.parse
 import urllib.request
 import collections
+import concurrent.futures
 import os
+import pymysql
 import sys
 from builtins import object
 from builtins import zip
@@ -22,8 +24,24 @@ from future import standard_library
 from fundamentals.mysql import database, readquery
 from models.transients_akas.models_transients_akas_get import models_transients_akas_get
 from models.transients_lightcurves.transients_lightcurves_get import models_transients_lightcurves_get
+from models.transients.models_transients_count import ticketCountCache
+from packages.caching import ttl_cache
+from packages.lightcurves import columnar_lightcurves
+from packages.pagination import encode_cursor, decode_cursor, keyset_predicate
+from packages import statements
+from packages.crossmatch_enrichment import enrich_crossmatches
 standard_library.install_aliases()
 
+# THE COLUMN PROJECTION OF THE TICKET QUERY ONLY CHANGES WHEN THE SCHEMA IS
+# MIGRATED, SO IT IS RESOLVED ONCE AND SHARED BY ALL REQUESTS OF THE PROCESS
+schemaCache = ttl_cache(ttlSeconds=3600, maxEntries=16)
+
+# THE ENRICHMENT (LINK, BEST MAGNITUDE, SDSS NAME) OF EACH CATALOGUE OBJECT, WHICH NEVER CHANGES
+crossmatchCache = ttl_cache(ttlSeconds=86400, maxEntries=100000)
+
+# A SHORT q TERM CAN MATCH MOST OF THE CATALOGUE; ONLY ITS BEST RANKED MATCHES ARE LISTED
+searchMatchesPerTerm = 200
+
 
 class models_transients_get(base_model):
     """
@@ -34,10 +52,16 @@ class models_transients_get(base_model):
     - ``log`` -- logger
     - ``request`` -- the  request in JSON format
     - ``elementId`` -- the specific element id requests (or False)
+    - ``db`` -- the database connection used for the ticket queries
+    - ``pool`` -- connection pool; together with ``executor`` it enables the parallel fetch of the associated data
+    - ``executor`` -- a bounded ``ThreadPoolExecutor`` running the associated data sub-queries
+    - ``subqueryTimeout`` -- seconds to wait for the parallel sub-queries before returning partial results
+    - ``stream`` -- skip the eager ticket query; the caller iterates ``stream()`` instead of calling ``get()``
+    - ``searchIndex`` -- the in-memory ``search_index`` answering the ``q`` search (the REGEXP scan is used if None or not yet built)
 
     """
 
-    def __init__(self, log, request, elementId=False, search=False, tcsCatalogueId=False, db=None):
+    def __init__(self, log, request, elementId=False, search=False, tcsCatalogueId=False, db=None, pool=None, executor=None, subqueryTimeout=10, stream=False, searchIndex=None, countGeneration=None):
         super().__init__(log, request, elementId, search)
 
         self.resourceName = "transients"
@@ -58,13 +82,26 @@ class models_transients_get(base_model):
         }
         self.tcsCatalogueId = tcsCatalogueId
         self.dbConn = db
+        self.pool = pool
+        self.executor = executor
+        self.subqueryTimeout = subqueryTimeout
+        self.incompleteData = []
+        self.nextCursor = None
+        self.queryPlan = None
+        self.countStrategy = None
+        self.countGeneration = countGeneration
+        self.transientsAkasModel = None
+        self.searchIndex = searchIndex
+        # THE q MATCHES, BEST FIRST (THE ORDER OF sortBy=relevance)
+        self.searchRank = None
         self.qs = request
         self._set_default_parameters()
         
-        # Skip database query if mwl="all" (we only need counts, not data)
-        if "mwl" in self.qs and self.qs["mwl"] == "all":
+        # Skip database query if mwl="all" (we only need counts, not data) or
+        # if the tickets are going to be streamed in batches
+        if ("mwl" in self.qs and self.qs["mwl"] == "all") or stream:
             self.transientData = []
-            self.matchedTransientBucketIds = ""
+            self.matchedTransientBucketIds = []
             self.totalTicketCount = 0
         else:
             self.transientData, self.matchedTransientBucketIds, self.totalTicketCount = self._get_transient_data_from_database()
@@ -91,13 +128,27 @@ class models_transients_get(base_model):
             self.log.debug('completed the ``get`` method - returning counts for all lists')
             return counts
 
-        self.transientAkas = self._get_associated_transient_aka()
-        self.transientLightcurveData = self._get_associated_lightcurve_data()
-        self.transientAtelMatches = self._get_associated_atel_data()
-        self.transients_comments = self._get_associated_comments()
-        self.transient_history = self._get_associated_transient_history()
-        self.transient_crossmatches = self._get_associated_transient_crossmatches()
-        self.skyTags = self._get_associated_multimessenger_associations()
+        fetchers = collections.OrderedDict([
+            ("transientAkas", self._get_associated_transient_aka),
+            ("transientLightcurveData", self._get_associated_lightcurve_data),
+            ("transientAtelMatches", self._get_associated_atel_data),
+            ("transients_comments", self._get_associated_comments),
+            ("transient_history", self._get_associated_transient_history),
+            ("transient_crossmatches", self._get_associated_transient_crossmatches),
+            ("skyTags", self._get_associated_multimessenger_associations)
+        ])
+        # BUILT UP FRONT AS IT MUTATES THE SHARED REQUEST OBJECT
+        self._transients_akas_model()
+
+        if self.pool and self.executor:
+            associatedData = self._fetch_associated_data_in_parallel(fetchers)
+        else:
+            associatedData = {}
+            for name, fetcher in fetchers.items():
+                associatedData[name] = fetcher()
+
+        for name, data in associatedData.items():
+            setattr(self, name, data)
 
         self.log.debug('completed the ``get`` method')
 
@@ -106,6 +157,175 @@ class models_transients_get(base_model):
         #return  self.qs, self.transientData, self.transientAkas
         return self.qs, self.transientData, self.transientAkas, self.transientLightcurveData, self.transientAtelMatches, self.transients_comments, self.totalTicketCount, self.transient_history, self.transient_crossmatches, self.skyTags
 
+    def stream(
+            self,
+            batchSize=500):
+        """
+        *stream the requested tickets, one transient (with its associated data) at a time*
+
+        The transientBucketIds are read from a server-side cursor on the request connection and
+        the ticket rows and associated data are fetched in batches of ``batchSize`` on a second
+        pooled connection, so memory stays bounded whatever the size of the export.
+
+        **Key Arguments**
+
+        - ``batchSize`` -- number of transients fetched per batch
+
+        **Return**
+
+        - a generator yielding a header dictionary (``qs`` and ``totalTicketCount``) followed by one dictionary per transient
+        """
+        self.log.debug('starting the ``stream`` method')
+
+        sqlQuery, selectionArgs, queryWhere, whereArgs, orderTerms, cursorMode, sortDescending = self._build_ticket_selection_query()
+        limit = self.qs["limit"]
+        pageStart = self.qs["pageStart"]
+        if cursorMode:
+            sqlQuery = """%(sqlQuery)s limit %%s""" % locals()
+            queryArgs = selectionArgs + [int(limit)]
+        else:
+            sqlQuery = """%(sqlQuery)s limit %%s, %%s""" % locals()
+            queryArgs = selectionArgs + [int(pageStart), int(limit)]
+
+        totalTicketCount = self._get_total_ticket_count_for_list(
+            queryWhere=queryWhere, whereArgs=whereArgs)
+        yield {
+            "qs": self.qs,
+            "totalTicketCount": totalTicketCount
+        }
+
+        # NOTHING ELSE MAY RUN ON THE REQUEST CONNECTION WHILE IT STREAMS, SO THE COLUMN
+        # PROJECTION IS RESOLVED FIRST (A schemaCache MISS QUERIES INFORMATION_SCHEMA)
+        self._get_select_columns()
+        detailConn = self.pool.acquire()
+        cursor = self.dbConn.cursor(pymysql.cursors.SSDictCursor)
+        try:
+            cursor.execute(*statements.bind(sqlQuery, queryArgs))
+            while True:
+                idRows = cursor.fetchmany(batchSize)
+                if not idRows:
+                    break
+                for record in self._get_stream_batch(idRows, detailConn):
+                    yield record
+        finally:
+            cursor.close()
+            self.pool.release(detailConn)
+
+        self.log.debug('completed the ``stream`` method')
+        return
+
+    def _get_stream_batch(
+            self,
+            idRows,
+            dbConn):
+        """
+        *fetch the ticket rows and associated data for one batch of streamed transientBucketIds*
+
+        **Key Arguments**
+
+        - ``idRows`` -- rows of the ticket selection query
+        - ``dbConn`` -- the connection used for the batch queries
+
+        **Return**
+
+        - ``records`` -- one dictionary per transient, in list order
+        """
+        matchedTransientBucketIds = [aRow["transientBucketId"] for aRow in idRows]
+        self.matchedTransientBucketIds = matchedTransientBucketIds
+
+        transientData = self._get_ticket_rows(
+            matchedTransientBucketIds, dbConn=dbConn)
+
+        # A PRIVATE REQUEST KEEPS THE AKAS FLAT AND UNLIMITED FOR THIS BATCH
+        transients_akas = models_transients_akas_get(
+            log=self.log,
+            request={"format": "html_tickets", "pageLimit": len(idRows)},
+            elementId=matchedTransientBucketIds or [-99],
+            db=dbConn
+        )
+        associatedData = collections.OrderedDict([
+            ("akas", (transients_akas.get(), "transientBucketId")),
+            ("lc_data", (self._get_associated_lightcurve_data(dbConn=dbConn), "transientBucketId")),
+            ("ts_atel_matches", (self._get_associated_atel_data(dbConn=dbConn), "transientBucketId")),
+            ("comments", (self._get_associated_comments(dbConn=dbConn), "pesstoObjectsId")),
+            ("transient_history", (self._get_associated_transient_history(dbConn=dbConn), "transientBucketId")),
+            ("ts_xmatches", (self._get_associated_transient_crossmatches(dbConn=dbConn), "transient_object_id")),
+            ("ts_skytag", (self._get_associated_multimessenger_associations(dbConn=dbConn), "transientBucketId"))
+        ])
+
+        grouped = {}
+        for name, (rows, key) in associatedData.items():
+            grouped[name] = collections.defaultdict(list)
+            for row in rows:
+                grouped[name][row[key]].append(row)
+
+        records = []
+        for row in transientData:
+            tbi = row["transientBucketId"]
+            record = {"transientData": row}
+            for name in associatedData:
+                record[name] = grouped[name].get(tbi, [])
+            records.append(record)
+
+        return records
+
+    def _fetch_associated_data_in_parallel(
+            self,
+            fetchers):
+        """
+        *run the associated data sub-queries concurrently, each on its own pooled connection*
+
+        Sub-queries that fail or do not complete within ``subqueryTimeout`` return an empty list
+        and their names are recorded in ``self.incompleteData``.
+
+        **Key Arguments**
+
+        - ``fetchers`` -- ordered dictionary of result name to fetch method (accepting ``dbConn``)
+
+        **Return**
+
+        - ``associatedData`` -- dictionary of result name to rows
+        """
+        self.log.debug('starting the ``_fetch_associated_data_in_parallel`` method')
+
+        futures = collections.OrderedDict()
+        for name, fetcher in fetchers.items():
+            futures[name] = self.executor.submit(
+                self._run_with_pooled_connection, fetcher)
+
+        done, notDone = concurrent.futures.wait(
+            list(futures.values()), timeout=self.subqueryTimeout)
+
+        associatedData = {}
+        for name, future in futures.items():
+            if future in done and future.exception() is None:
+                associatedData[name] = future.result()
+                continue
+            if future in done:
+                self.log.error("""associated data sub-query `%s` failed: %s""" % (
+                    name, future.exception()))
+            else:
+                future.cancel()
+                self.log.warning("""associated data sub-query `%s` timed out after %s seconds""" % (
+                    name, self.subqueryTimeout))
+            associatedData[name] = []
+            self.incompleteData.append(name)
+
+        self.log.debug('completed the ``_fetch_associated_data_in_parallel`` method')
+        return associatedData
+
+    def _run_with_pooled_connection(
+            self,
+            fetcher):
+        """
+        *borrow a connection from the pool for the duration of a single sub-query*
+        """
+        dbConn = self.pool.acquire(timeout=self.subqueryTimeout)
+        try:
+            return fetcher(dbConn=dbConn)
+        finally:
+            self.pool.release(dbConn)
+
     def _get_transient_data_from_database(
             self):
         """
@@ -114,58 +334,155 @@ class models_transients_get(base_model):
         **Return**
 
         - ``objectData``
-        - ``matchedTransientBucketIds``
+        - ``matchedTransientBucketIds`` -- the ordered list of matched transientBucketIds
         - ``totalTicketCount``
 
         """
         self.log.debug('starting the ``get_data_from_database`` method')
 
+        sqlQuery, selectionArgs, queryWhere, whereArgs, orderTerms, cursorMode, sortDescending = self._build_ticket_selection_query()
+
+        # Add the limits and pagination to query
+        limit = self.qs["limit"]
+        if cursorMode:
+            # ONE EXTRA ROW TELLS US WHETHER THERE IS A NEXT PAGE
+            sqlQuery = """%(sqlQuery)s limit %%s""" % locals()
+            queryArgs = selectionArgs + [int(limit) + 1]
+        else:
+            pageStart = self.qs["pageStart"]
+            sqlQuery = """%(sqlQuery)s limit %%s, %%s""" % locals()
+            queryArgs = selectionArgs + [int(pageStart), int(limit)]
+
+        # grab the full ticket rows of the page in one statement
+        self.log.debug("""sqlQuery: `%(sqlQuery)s`""" % locals())
+        pageRows = self._get_page_rows(sqlQuery, queryArgs, orderTerms)
+
+        # THE IDS THE SELECTION RETURNED, IN ORDER (A TICKET MISSING ONE OF ITS TABLES STILL COUNTS HERE)
+        pageIds = []
+        lastRows = {}
+        for row in pageRows:
+            if row["pageTransientBucketId"] not in lastRows:
+                pageIds.append(row["pageTransientBucketId"])
+            lastRows[row["pageTransientBucketId"]] = row
+
+        self.nextCursor = None
+        hasNextPage = False
+        if cursorMode and len(pageIds) > limit:
+            hasNextPage = True
+            pageIds = pageIds[:limit]
+            lastRow = lastRows[pageIds[-1]]
+            self.nextCursor = encode_cursor(
+                sortBy=self.qs.get("sortBy"),
+                sortDesc=sortDescending,
+                keys=[lastRow["sortKey%s" % i] for i in range(len(orderTerms) - 1)],
+                transientBucketId=lastRow["pageTransientBucketId"])
+        selectedIds = set(pageIds)
+
+        # ONLY THE COMPLETE TICKETS ARE RETURNED; THE SORT KEYS ARE ONLY NEEDED FOR THE CURSOR
+        objectData = []
+        for row in pageRows:
+            if row["pageTransientBucketId"] not in selectedIds or not row["ticketComplete"]:
+                continue
+            for i in range(len(orderTerms) - 1):
+                del row["sortKey%s" % i]
+            del row["pageTransientBucketId"]
+            del row["ticketComplete"]
+            objectData.append(row)
+
+        # GET ORDERED LIST OF THE TRANSIENTBUCKETIDs
+        matchedTransientBucketIds = [aRow["transientBucketId"] for aRow in objectData]
+
+        # A PAGE THAT IS NOT FULL ENDS THE LIST, SO THE TOTAL NEEDS NO COUNT QUERY
+        if cursorMode and not self.qs.get("cursor") and not hasNextPage:
+            totalTicketCount = len(pageIds)
+            self.countStrategy = "page"
+        elif not cursorMode and len(pageIds) < limit and (pageIds or not int(self.qs["pageStart"])):
+            totalTicketCount = int(self.qs["pageStart"]) + len(pageIds)
+            self.countStrategy = "page"
+        else:
+            totalTicketCount = self._get_total_ticket_count_for_list(
+                queryWhere=queryWhere, whereArgs=whereArgs)
+
+        self.queryPlan = {
+            "rows": "deferredJoin",
+            "total": self.countStrategy,
+            "statements": 1 if self.countStrategy in ("page", "elementId", "none", "cachedCount", "cachedEstimate") else 2
+        }
+        self.log.debug("""queryPlan: %s""" % (self.queryPlan,))
+
+        self.log.debug('completed the ``get_data_from_database`` method')
+        return objectData, matchedTransientBucketIds, totalTicketCount
+
+
+    def _build_ticket_selection_query(
+            self):
+        """
+        *build the query selecting the ordered transientBucketIds of the requested ticket list*
+
+        **Return**
+
+        - ``sqlQuery`` -- the selection query, without its limit clause
+        - ``selectionArgs`` -- the values bound to the placeholders of ``sqlQuery``
+        - ``queryWhere`` -- the where segment of the query, with ``%s`` placeholders (reused by the ticket count)
+        - ``whereArgs`` -- the values bound to the placeholders of ``queryWhere``
+        - ``orderTerms`` -- the ``(expression, direction)`` ORDER BY terms, the last one being the id tie-breaker
+        - ``cursorMode`` -- True if keyset (cursor) pagination was requested
+        - ``sortDescending`` -- the normalised sort direction flag
+
+        """
+        self.log.debug('starting the ``_build_ticket_selection_query`` method')
+
         tcsCatalogueId = self.tcsCatalogueId
+        # THE WHERE CLAUSES USE %s PLACEHOLDERS; THEIR VALUES ARE BOUND BY THE DRIVER (IN ORDER)
         sqlWhereList = []
-        regex1 = re.compile(r'[^A-Za-z0-9]')
-        regex2 = re.compile(r'^(AT|SN)')
+        whereArgs = []
         # SEARCH
         if self.search and "q" in self.request:
-            print('Here')
             searchString = self.request["q"]
-            #searchString = regex1.sub('', searchString)
-            #searchString = regex2.sub('^(AT|SN)', searchString)
             #self.log.debug("""searchString: `%(searchString)s`""" % locals())
 
-            # Usa LIKE per abilitare ricerche parziali:
-            sqlQuery = f"""
-                select  DISTINCT  transientBucketId from marshall_transient_akas where  REGEXP_REPLACE(name,"[^A-Za-z0-9]","") REGEXP '{searchString}' 
-                        union
-                select DISTINCT  transientBucketId from pesstoObjects where  REGEXP_REPLACE(pi_name,"[^A-Za-z0-9]","") REGEXP '{searchString}'
-                        union
-                select DISTINCT  transientBucketId from lvk_skytag s, lvk_alerts a, lvk_events e where s.mapId=a.primaryId and e.superevent_id=a.superevent_id and a.alert_time =e.alert_time and  REGEXP_REPLACE(s.superevent_id,"[^A-Za-z0-9]","") REGEXP  '{searchString}' 
-            """
+            # q HOLDS ONE OR MORE COMMA-SEPARATED NAMES/IDS, RESOLVED IN ONE BATCH
+            searchTerms = [t for t in searchString.split(",") if t] or [searchString]
+
+            # RANKED LOOKUP IN THE IN-MEMORY NAME INDEX (MATCHES OF THE FIRST TERMS FIRST)
+            transientBucketIds = None
+            if self.searchIndex and self.searchIndex.ready:
+                transientBucketIds = []
+                seen = set()
+                for term in searchTerms:
+                    for transientBucketId in self.searchIndex.search(term, limit=searchMatchesPerTerm) or []:
+                        if transientBucketId not in seen:
+                            seen.add(transientBucketId)
+                            transientBucketIds.append(transientBucketId)
+
+            # THE INDEX IS NOT BUILT YET (OR NOT CONFIGURED) - FALL BACK TO SCANNING THE NAMES
+            if transientBucketIds is None:
+                searchRegex = ("|").join(searchTerms)
+                # Usa LIKE per abilitare ricerche parziali:
+                sqlQuery = """
+                    select  DISTINCT  transientBucketId from marshall_transient_akas where  REGEXP_REPLACE(name,"[^A-Za-z0-9]","") REGEXP %s
+                            union
+                    select DISTINCT  transientBucketId from pesstoObjects where  REGEXP_REPLACE(pi_name,"[^A-Za-z0-9]","") REGEXP %s
+                            union
+                    select DISTINCT  transientBucketId from lvk_skytag s, lvk_alerts a, lvk_events e where s.mapId=a.primaryId and e.superevent_id=a.superevent_id and a.alert_time =e.alert_time and  REGEXP_REPLACE(s.superevent_id,"[^A-Za-z0-9]","") REGEXP %s
+                """
 
-            rows = readquery(sqlQuery, self.dbConn, self.log)
-            searchList = ""
-            for row in rows:
-                transientBucketId = row["transientBucketId"]
-                searchList = """%(searchList)s %(transientBucketId)s,""" % locals(
-                )
-            print("SEARCH LIST: ")
-            print(searchList)
-            print("SEARCH STRING: ")
-            print(searchString)
-            
-
-            thisWhere = """t.transientBucketId in (%(searchList)s -99)""" % locals(
-            )
+                rows = statements.read(self.log, self.dbConn, sqlQuery, (searchRegex, searchRegex, searchRegex))
+                transientBucketIds = [row["transientBucketId"] for row in rows][:searchMatchesPerTerm * len(searchTerms)]
 
-            sqlWhereList.append(thisWhere)
+            self.log.debug("""searchString: `%(searchString)s`""" % locals())
+
+            sqlWhereList.append("""t.transientBucketId in %s""")
+            whereArgs.append(transientBucketIds)
+            self.searchRank = [int(t) for t in transientBucketIds]
             thisPageName = searchString
-            self.log.debug("""searchList: `%(searchList)s`""" % locals())
+            self.log.debug("""searchList: `%(transientBucketIds)s`""" % locals())
 
         # Single Element Id (i.e. transientBucketId)
         if self.elementId:
-            thisTransientBucketId = self.elementId
-            thisWhere = """t.transientBucketId in (%(thisTransientBucketId)s)""" % locals(
-            )
-            sqlWhereList.append(thisWhere)
+            thisTransientBucketIds = [int(t) for t in str(self.elementId).split(",") if t.strip()]
+            sqlWhereList.append("""t.transientBucketId in %s""")
+            whereArgs.append(thisTransientBucketIds)
 
         # MARSHALL WORKFLOW
         if "mwl" in self.qs:
@@ -174,18 +491,19 @@ class models_transients_get(base_model):
             elif self.qs["mwl"] in ["all", "False", False]:
                 thisWhere = """1=1"""
             else:
-                thisWhere = """marshallWorkflowLocation = "%(mwl)s" """ % self.qs
+                thisWhere = """marshallWorkflowLocation = %s """
+                whereArgs.append(self.qs["mwl"])
             sqlWhereList.append(thisWhere)
 
         # ALERT WORKFLOW
         if "awl" in self.qs:
-            thisWhere = """alertWorkflowLocation = "%(awl)s" """ % self.qs
-            sqlWhereList.append(thisWhere)
+            sqlWhereList.append("""alertWorkflowLocation = %s """)
+            whereArgs.append(self.qs["awl"])
 
         # CLASSIFIED?
         if "cf" in self.qs:
-            thisWhere = """classifiedFlag = "%(cf)s" """ % self.qs
-            sqlWhereList.append(thisWhere)
+            sqlWhereList.append("""classifiedFlag = %s """)
+            whereArgs.append(str(self.qs["cf"]))
 
         # SNOOZED?
         if "snoozed" in self.qs:
@@ -193,53 +511,47 @@ class models_transients_get(base_model):
                 self.qs["snoozed"] = 1
             elif self.qs["snoozed"] is False:
                 self.qs["snoozed"] = 0
-            thisWhere = """snoozed = "%(snoozed)s" """ % self.qs
-            sqlWhereList.append(thisWhere)
-
-        # FILTER?
-        if "filterBy1" in self.qs and self.qs['filterBy1'] and "filterValue1" in self.qs and self.qs['filterValue1'] and "filterOp1" in self.qs and self.qs['filterOp1']:
-            if self.qs['filterBy1'] in ("decDeg", "raDeg"):
-                thisWhere = """t.`%(filterBy1)s` %(filterOp1)s %(filterValue1)s """ % self.qs
+            sqlWhereList.append("""snoozed = %s """)
+            whereArgs.append(str(self.qs["snoozed"]))
+
+        # FILTER? (THE COLUMN AND OPERATOR ARE VALIDATED BY THE SANITIZER, THE VALUE IS BOUND)
+        for n in self._active_filters():
+            filterBy = self.qs["filterBy" + n]
+            filterValue = self.qs["filterValue" + n]
+            filterOp = self.qs["filterOp" + n]
+            try:
+                filterValue = float(filterValue)
+                if filterBy not in ("decDeg", "raDeg"):
+                    self.qs["filterValue" + n] = filterValue
+            except (TypeError, ValueError):
+                pass
+            if filterBy in ("decDeg", "raDeg"):
+                thisWhere = """t.`%(filterBy)s` %(filterOp)s %%s """ % locals()
             else:
-                try:
-                    self.qs["filterValue1"] = float(self.qs["filterValue1"])
-                    thisWhere = """`%(filterBy1)s` %(filterOp1)s %(filterValue1)s """ % self.qs
-                except:
-                    thisWhere = """`%(filterBy1)s` %(filterOp1)s "%(filterValue1)s" """ % self.qs
-                    
-
-            sqlWhereList.append(thisWhere)
-
-        if "filterBy2" in self.qs and self.qs['filterBy2'] and "filterValue2" in self.qs and self.qs['filterValue2'] and "filterOp2" in self.qs and self.qs['filterOp2']:
-            if self.qs['filterBy2'] in ("decDeg", "raDeg"):
-                thisWhere = """t.`%(filterBy2)s` %(filterOp2)s %(filterValue2)s """ % self.qs
-            else:
-                try:
-                    self.qs["filterValue2"] = float(self.qs["filterValue2"])
-                    thisWhere = """`%(filterBy2)s` %(filterOp2)s %(filterValue2)s """ % self.qs
-                except:
-                    thisWhere = """`%(filterBy2)s` %(filterOp2)s "%(filterValue2)s" """ % self.qs
-
+                thisWhere = """`%(filterBy)s` %(filterOp)s %%s """ % locals()
             sqlWhereList.append(thisWhere)
+            whereArgs.append(filterValue)
 
         if "phaseiiiCheck" in self.qs:
             phaseiiiCheck = self.qs["phaseiiiCheck"]
             if phaseiiiCheck == "null":
                 phaseiiiCheck = "is null"
             else:
-                phaseiiiCheck = "= %(phaseiiiCheck)s" % locals()
+                whereArgs.append(phaseiiiCheck)
+                phaseiiiCheck = "= %s"
             thisWhere = """t.transientBucketId in (SELECT transientBucketId FROM phase_iii_transient_catalogue_ssdr3 p, sherlock_classifications s where s.transient_object_id=p.TransientBucketId and s.matchVerified %(phaseiiiCheck)s) """ % locals()
             sqlWhereList.append(thisWhere)
 
         # tcsCatalogueId?
         if tcsCatalogueId:
-            thisWhere = """cm.catalogue_table_id = %(tcsCatalogueId)s """ % locals(
-            )
+            thisWhere = """cm.catalogue_table_id = %s """
+            tcsArgs = [tcsCatalogueId]
             if "tcsRank" in self.qs:
-                rank = self.qs["tcsRank"]
-                thisWhere += """ and cm.rank=%(rank)s""" % locals()
+                thisWhere += """ and cm.rank=%s"""
+                tcsArgs.append(self.qs["tcsRank"])
             sqlWhereList = []
             sqlWhereList.append(thisWhere)
+            whereArgs = tcsArgs
             tcsCm = ", sherlock_crossmatches cm"
             tec = "and t.transientBucketId = cm.transient_object_id"
             sec = "and s.transientBucketId = cm.transient_object_id"
@@ -260,7 +572,11 @@ class models_transients_get(base_model):
         tep = "and t.transientBucketId = p.transientBucketId"
         sep = "and s.transientBucketId = p.transientBucketId"
 
-        orderBy = ""
+        # EACH SORT IS DESCRIBED BY THE TICKET SELECTION (WITHOUT ITS ORDER) AND
+        # THE LIST OF ITS ORDER BY TERMS, SO THE SAME TERMS DRIVE BOTH THE OFFSET
+        # AND THE KEYSET (CURSOR) PAGINATION
+        idColumn = "t.transientBucketId"
+        seekJoin = "and"
         if "sortBy" in self.qs and self.qs["sortBy"] is not False:
             sortRev = 0
             sortDirection = ""
@@ -271,92 +587,172 @@ class models_transients_get(base_model):
                 sortDirection = "desc"
             elif (self.qs["sortDesc"] != "True" and self.qs["sortDesc"] != True) and sortRev == 1:
                 sortDirection = "desc"
-            if self.qs["sortBy"] == "redshift":
-                sqlQuery = """
-                     select t.transientBucketId from transientBucketSummaries t, pesstoObjects p %(tcsCm)s %(queryWhere)s %(sep)s %(sec)s  order by t.best_redshift %(sortDirection)s
+            if self.qs["sortBy"] == "relevance":
+                # THE POSITION IN THE RANKED SEARCH MATCHES (INTEGER IDS FROM THE INDEX, NOT CLIENT INPUT)
+                sqlFrom = """
+                     from transientBucketSummaries t, pesstoObjects p %(tcsCm)s %(queryWhere)s %(tep)s %(tec)s
                 """ % locals()
+                if self.searchRank:
+                    rankList = (",").join(["%d" % t for t in self.searchRank])
+                    rankExpression = "field(t.transientBucketId, %(rankList)s)" % locals()
+                else:
+                    rankExpression = "0"
+                orderTerms = [(rankExpression, sortDirection)]
+            elif self.qs["sortBy"] == "redshift":
+                sqlFrom = """
+                     from transientBucketSummaries t, pesstoObjects p %(tcsCm)s %(queryWhere)s %(tep)s %(tec)s
+                """ % locals()
+                orderTerms = [("t.best_redshift", sortDirection)]
             elif self.qs["sortBy"] == "latestComment":
-                sqlQuery = """
-                    select * from (select t.transientBucketId from pesstoObjects p, transientBucketSummaries t %(tcsCm)s %(queryWhere)s %(tec)s %(tep)s) as a LEFT OUTER JOIN (SELECT pesstoObjectsId, MAX(dateCreated) AS latestCommentDate FROM pesstoObjectsComments GROUP BY pesstoObjectsId) as b ON a.transientBucketId = b.pesstoObjectsId ORDER BY latestCommentDate %(sortDirection)s
+                idColumn = "a.transientBucketId"
+                seekJoin = "where"
+                sqlFrom = """
+                    from (select t.transientBucketId from pesstoObjects p, transientBucketSummaries t %(tcsCm)s %(queryWhere)s %(tec)s %(tep)s) as a LEFT OUTER JOIN (SELECT pesstoObjectsId, MAX(dateCreated) AS latestCommentDate FROM pesstoObjectsComments GROUP BY pesstoObjectsId) as b ON a.transientBucketId = b.pesstoObjectsId
                 """ % locals()
+                orderTerms = [("b.latestCommentDate", sortDirection)]
 
             elif self.qs["sortBy"] == "pi_name":
                 # the ticket selection query
                 sortBy = self.qs["sortBy"]
-                sqlQuery = """
-                    select t.transientBucketId from transientBucketSummaries t, pesstoObjects p %(tcsCm)s %(queryWhere)s %(tep)s %(tec)s  order by case when p.%(sortBy)s is null then 1 else 0 end,  p.%(sortBy)s %(sortDirection)s
+                sqlFrom = """
+                    from transientBucketSummaries t, pesstoObjects p %(tcsCm)s %(queryWhere)s %(tep)s %(tec)s
                 """ % locals()
+                orderTerms = [
+                    ("case when p.%(sortBy)s is null then 1 else 0 end" % locals(), ""),
+                    ("p.%(sortBy)s" % locals(), sortDirection)]
 
             elif self.qs["sortBy"] == "observationPriority":
                 sortBy = self.qs["sortBy"]
-                sqlQuery = """
-                    select t.transientBucketId from transientBucketSummaries t, pesstoObjects p %(tcsCm)s %(queryWhere)s %(tep)s %(tec)s  order by p.%(sortBy)s, p.marshallWorkflowLocation %(sortDirection)s, case when t.dateAdded is null then 1 else 0 end,  t.dateAdded desc
+                sqlFrom = """
+                    from transientBucketSummaries t, pesstoObjects p %(tcsCm)s %(queryWhere)s %(tep)s %(tec)s
                 """ % locals()
+                orderTerms = [
+                    ("p.%(sortBy)s" % locals(), ""),
+                    ("p.marshallWorkflowLocation", sortDirection),
+                    ("case when t.dateAdded is null then 1 else 0 end", ""),
+                    ("t.dateAdded", "desc")]
 
             else:
                 # the ticket selection query
                 sortBy = self.qs["sortBy"]
-                sqlQuery = """
-                    select t.transientBucketId from transientBucketSummaries t, pesstoObjects p %(tcsCm)s %(queryWhere)s %(tep)s %(tec)s  order by case when t.%(sortBy)s is null then 1 else 0 end,  t.%(sortBy)s %(sortDirection)s
+                sqlFrom = """
+                    from transientBucketSummaries t, pesstoObjects p %(tcsCm)s %(queryWhere)s %(tep)s %(tec)s
                 """ % locals()
-                print(sqlQuery)
+                orderTerms = [
+                    ("case when t.%(sortBy)s is null then 1 else 0 end" % locals(), ""),
+                    ("t.%(sortBy)s" % locals(), sortDirection)]
         else:
-            sqlQuery = """
-                select t.transientBucketId from transientBucket t, pesstoObjects p %(tcsCm)s %(queryWhere)s and replacedByRowId =0  %(tep)s %(tec)s
+            sqlFrom = """
+                from transientBucket t, pesstoObjects p %(tcsCm)s %(queryWhere)s and replacedByRowId =0  %(tep)s %(tec)s
             """ % locals()
+            orderTerms = []
+        # THE TRANSIENTBUCKETID BREAKS TIES SO EVERY PAGE BOUNDARY IS DETERMINISTIC
+        orderTerms.append((idColumn, ""))
+        # transientBucket (AND THE CROSSMATCH JOIN) HOLD SEVERAL ROWS PER TRANSIENT; A PAGE LISTS EACH ONCE
+        selectDistinct = "distinct "
+
+        keyColumns = ""
+        for i, (expression, direction) in enumerate(orderTerms[:-1]):
+            keyColumns = """%(keyColumns)s, %(expression)s as sortKey%(i)s""" % locals()
+
+        # KEYSET PAGINATION: SEEK PAST THE LAST TICKET OF THE PREVIOUS PAGE
+        # INSTEAD OF SCANNING AND DISCARDING `pageStart` ROWS
+        cursorMode = self.qs.get("pagination") == "cursor"
+        sortDescending = self.qs.get("sortDesc") in (True, "True")
+        seekWhere = ""
+        seekArgs = []
+        if cursorMode and self.qs.get("cursor"):
+            keys, lastTransientBucketId = decode_cursor(
+                self.qs["cursor"], self.qs.get("sortBy"), sortDescending, len(orderTerms) - 1)
+            keys.append(["n", str(lastTransientBucketId)])
+            seekPredicate, seekArgs = keyset_predicate(orderTerms, keys)
+            seekWhere = """%(seekJoin)s %(seekPredicate)s""" % locals()
+
+        # THE SELECT DISTINCT ORDERS BY ITS OWN sortKey COLUMNS
+        orderBy = [("sortKey%s %s" % (i, direction)).strip() for i, (expression, direction) in enumerate(orderTerms[:-1])]
+        orderBy = (", ").join(orderBy + [idColumn])
+        sqlQuery = """
+            select %(selectDistinct)s%(idColumn)s%(keyColumns)s %(sqlFrom)s %(seekWhere)s order by %(orderBy)s
+        """ % locals()
+        # THE SEEK PREDICATE FOLLOWS THE WHERE SEGMENT IN THE STATEMENT, SO ITS VALUES ARE BOUND AFTER
+        selectionArgs = whereArgs + seekArgs
 
-        # Add the limits and pagination to query
-        pageStart = self.qs["pageStart"]
-        limit = self.qs["limit"]
-        sqlQuery = """%(sqlQuery)s limit %(pageStart)s, %(limit)s""" % locals()
+        self.log.debug('completed the ``_build_ticket_selection_query`` method')
+        return sqlQuery, selectionArgs, queryWhere, whereArgs, orderTerms, cursorMode, sortDescending
 
-        # grab the transientBucketIds
-        print(sqlQuery)
-        rows = readquery(sqlQuery, self.dbConn, self.log)
-        self.log.debug("""{rows}""".format(**dict(globals(), **locals())))
-        # GET ORDERED LIST OF THE TRANSIENTBUCKETIDs
-        matchedTransientBucketIds = ""
-        for aRow in rows:
-            tbi = aRow["transientBucketId"]
-            matchedTransientBucketIds = """%(matchedTransientBucketIds)s %(tbi)s,""" % locals(
-            )
-        matchedTransientBucketIds = "%(matchedTransientBucketIds)s -99" % locals(
-        )
+    def _get_page_rows(
+            self,
+            sqlQuery,
+            queryArgs,
+            orderTerms):
+        """
+        *get the full ticket rows of one page with a single deferred-join statement*
 
-        # select column names
-        selectColumns = ""
-        skipColumns = [
-            "lastNonDetectionDate", "classificationWRTMax", "classificationPhase"]
-        tables = {"transientBucketSummaries": "s",
-                  "transientBucket": "t",
-                  "pesstoObjects": "p",
-                  "sherlock_classifications": "sc"}
+        The paginated selection query only reads the sort keys and the transientBucketIds;
+        its page of ids is then joined to the ticket tables, so the wide rows are only built
+        for the transients that are actually returned (no second round-trip with the ids).
+        The ticket tables are outer-joined, so every selected id comes back with at least one
+        row: ``pageTransientBucketId`` is the selected id and ``ticketComplete`` is false when
+        one of the ticket tables has no row for it.
 
-        thisSchema = "marshall"
-        for k, v in list(tables.items()):
-            sqlQuery = """SELECT COLUMN_NAME from INFORMATION_SCHEMA.COLUMNS where table_name = "%(k)s" and TABLE_SCHEMA = "%(thisSchema)s" """ % locals(
-            )
-            rows = readquery(sqlQuery, self.dbConn, self.log)
-            self.log.debug(
-                """rows: {rows}""".format(**dict(globals(), **locals())))
+        **Key Arguments**
 
-            for row in rows:
-                if row["COLUMN_NAME"] not in skipColumns or k == "transientBucketSummaries":
-                    skipColumns.append(row["COLUMN_NAME"])
-                    columnName = row["COLUMN_NAME"]
-                    selectColumns = """{selectColumns} {v}.{columnName},""".format(
-                        **dict(globals(), **locals()))
+        - ``sqlQuery`` -- the paginated ticket selection query
+        - ``queryArgs`` -- the values bound to its placeholders
+        - ``orderTerms`` -- the ORDER BY terms of the selection, re-applied to its ``sortKey`` columns
 
-        selectColumns = selectColumns[:-1]
+        **Return**
+
+        - ``pageRows`` -- the ticket rows (with their ``sortKey``, ``pageTransientBucketId`` and ``ticketComplete`` columns), in list order
+        """
+        selectColumns = self._get_select_columns()
 
+        keyColumns = ""
+        outerOrder = []
+        for i, (expression, direction) in enumerate(orderTerms[:-1]):
+            keyColumns = """%(keyColumns)s page.sortKey%(i)s,""" % locals()
+            outerOrder.append(("page.sortKey%(i)s %(direction)s" % locals()).strip())
+        outerOrder.append("page.transientBucketId")
+        outerOrder = (", ").join(outerOrder)
+
+        sqlQuery = """
+            select %(keyColumns)s page.transientBucketId as pageTransientBucketId, (t.transientBucketId is not null and s.transientBucketId is not null and p.transientBucketId is not null and sc.transient_object_id is not null) as ticketComplete, annotation, %(selectColumns)s from (%(sqlQuery)s) as page left join transientBucket t on t.transientBucketId = page.transientBucketId and t.replacedByRowId = 0 and t.masterIdFlag = 1 left join transientBucketSummaries s on s.transientBucketId = page.transientBucketId left join pesstoObjects p on p.transientBucketId = page.transientBucketId left join sherlock_classifications sc on sc.transient_object_id = page.transientBucketId order by %(outerOrder)s
+        """ % locals()
+        pageRows = statements.read(self.log, self.dbConn, sqlQuery, queryArgs)
         self.log.debug(
-            """selectColumns: {selectColumns}""".format(**dict(globals(), **locals())))
+            """{pageRows}""".format(**dict(globals(), **locals())))
+
+        return pageRows
+
+    def _get_ticket_rows(
+            self,
+            transientBucketIds,
+            dbConn=None):
+        """
+        *get the full ticket rows for the given transientBucketIds, in the given order*
+
+        **Key Arguments**
+
+        - ``transientBucketIds`` -- the ordered list of transientBucketIds
+        - ``dbConn`` -- connection to run the query on (defaults to the request connection)
+
+        **Return**
+
+        - ``objectData`` -- the ticket rows
+        """
+        dbConn = dbConn or self.dbConn
+
+        # select column names (resolved once per process, see ``_get_select_columns``)
+        selectColumns = self._get_select_columns(dbConn=dbConn)
 
-        # grab the remaining data assocatied with the transientBucketIds
         sqlQuery = """
-            select annotation, %(selectColumns)s from transientBucket t, transientBucketSummaries s, pesstoObjects p, sherlock_classifications sc where t.replacedByRowId = 0 and t.transientBucketId in (%(matchedTransientBucketIds)s) and t.masterIdFlag = 1 and t.transientBucketId = p.transientBucketId and p.transientBucketId=s.transientBucketId and t.transientBucketId = sc.transient_object_id order by FIELD(t.transientBucketId, %(matchedTransientBucketIds)s)
+            select annotation, %(selectColumns)s from transientBucket t, transientBucketSummaries s, pesstoObjects p, sherlock_classifications sc where t.replacedByRowId = 0 and t.transientBucketId in %%s and t.masterIdFlag = 1 and t.transientBucketId = p.transientBucketId and p.transientBucketId=s.transientBucketId and t.transientBucketId = sc.transient_object_id
         """ % locals()
-        tmpObjectData = readquery(sqlQuery, self.dbConn, self.log)
+        tmpObjectData = statements.read_chunked(self.log, dbConn, sqlQuery, transientBucketIds)
+
+        # RESTORE THE LIST ORDER HERE RATHER THAN WITH AN ORDER BY FIELD(...) OVER THE WHOLE ID LIST
+        position = {t: i for i, t in enumerate(transientBucketIds)}
+        tmpObjectData.sort(key=lambda row: position[row["transientBucketId"]])
 
         objectData = []
         #objectData[:] = [dict(list(zip(list(row.keys()), row)))
@@ -368,13 +764,80 @@ class models_transients_get(base_model):
         self.log.debug(
             """{objectData}""".format(**dict(globals(), **locals())))
 
-        # get the total ticket count
-        totalTicketCount = self._get_total_ticket_count_for_list(
-            queryWhere=queryWhere)
+        return objectData
 
-        self.log.debug('completed the ``get_data_from_database`` method')
-        return objectData, matchedTransientBucketIds, totalTicketCount
+    def _get_select_columns(
+            self,
+            dbConn=None):
+        """
+        *get the column projection used by the ticket data query*
+
+        The INFORMATION_SCHEMA lookup is slow, so the projection is kept in ``schemaCache``
+        until its TTL expires or ``schemaCache.bump_generation()`` is called after a migration.
+
+        **Key Arguments**
+
+        - ``dbConn`` -- connection a cache miss reads INFORMATION_SCHEMA on (defaults to the request connection)
+
+        **Return**
+
+        - ``selectColumns`` -- comma separated list of aliased columns
+        """
+        thisSchema = "marshall"
+        return schemaCache.get_or_set(
+            ("selectColumns", thisSchema),
+            lambda: self._build_select_columns(thisSchema, dbConn=dbConn))
+
+    def _build_select_columns(
+            self,
+            thisSchema,
+            dbConn=None):
+        """
+        *build the column projection from INFORMATION_SCHEMA*
+
+        **Key Arguments**
+
+        - ``thisSchema`` -- the database schema name
+        - ``dbConn`` -- connection to run the query on (defaults to the request connection)
+
+        **Return**
+
+        - ``selectColumns`` -- comma separated list of aliased columns
+        """
+        self.log.debug('starting the ``_build_select_columns`` method')
+
+        skipColumns = [
+            "lastNonDetectionDate", "classificationWRTMax", "classificationPhase"]
+        tables = {"transientBucketSummaries": "s",
+                  "transientBucket": "t",
+                  "pesstoObjects": "p",
+                  "sherlock_classifications": "sc"}
+
+        tableNames = ('","').join(list(tables.keys()))
+        sqlQuery = """SELECT TABLE_NAME, COLUMN_NAME from INFORMATION_SCHEMA.COLUMNS where table_name in ("%(tableNames)s") and TABLE_SCHEMA = "%(thisSchema)s" order by FIELD(TABLE_NAME, "%(tableNames)s"), ORDINAL_POSITION""" % locals(
+        )
+        rows = readquery(sqlQuery, dbConn or self.dbConn, self.log)
+
+        # TABLE NAMES MAY COME BACK LOWERCASED (lower_case_table_names)
+        tableNamesLookup = {t.lower(): t for t in tables}
+
+        selectColumns = ""
+        for row in rows:
+            k = tableNamesLookup[row["TABLE_NAME"].lower()]
+            v = tables[k]
+            if row["COLUMN_NAME"] not in skipColumns or k == "transientBucketSummaries":
+                skipColumns.append(row["COLUMN_NAME"])
+                columnName = row["COLUMN_NAME"]
+                selectColumns = """{selectColumns} {v}.{columnName},""".format(
+                    **dict(globals(), **locals()))
+
+        selectColumns = selectColumns[:-1]
+
+        self.log.debug(
+            """selectColumns: {selectColumns}""".format(**dict(globals(), **locals())))
 
+        self.log.debug('completed the ``_build_select_columns`` method')
+        return selectColumns
 
     def _set_default_parameters(
             self):
@@ -414,7 +877,11 @@ class models_transients_get(base_model):
             self.qs["pageStart"] = self.defaultQs["pageStart"]
 
         if "sortBy" not in self.qs:
-            if "mwl" in self.qs and self.qs["mwl"] in ["following", "pending observation", "allObsQueue"]:
+            if "q" in self.qs:
+                # A SEARCH LISTS ITS EXACT, THEN PREFIX, THEN SUBSTRING MATCHES FIRST
+                self.qs["sortBy"] = "relevance"
+                self.qs["sortDesc"] = False
+            elif "mwl" in self.qs and self.qs["mwl"] in ["following", "pending observation", "allObsQueue"]:
                 self.qs["sortBy"] = "observationPriority"
                 self.qs["sortDesc"] = False
             elif ("mwl" in self.qs and self.qs["mwl"] in ["inbox"]) or "snoozed" in self.qs:
@@ -477,7 +944,8 @@ class models_transients_get(base_model):
 
 
     def _get_associated_transient_aka(
-            self):
+            self,
+            dbConn=None):
         """
         *get associated aka names for the trasnsients*
 
@@ -488,37 +956,66 @@ class models_transients_get(base_model):
         """
         self.log.debug('starting the ``_get_associated_transient_aka`` method')
         #from marshall_webapp.models.transients_akas import models_transients_akas_get
-        transients_akas = models_transients_akas_get(
-            log=self.log,
-            request=self.request,
-            elementId=self.matchedTransientBucketIds,
-            db = self.dbConn
-        )
+        transients_akas = self._transients_akas_model()
+        transients_akas.dbConn = dbConn or self.dbConn
         akas = transients_akas.get()
 
         self.log.debug(
             'completed the ``_get_associated_transient_aka`` method')
         return akas
 
-    def _get_associated_lightcurve_data(
+    def _transients_akas_model(
             self):
         """
+        *build the akas model once per request*
+
+        The akas model writes its default parameters into the shared request object when it is
+        instantiated, so it is built here (in the request thread) before any parallel fetch starts.
+        """
+        if self.transientsAkasModel is None:
+            self.transientsAkasModel = models_transients_akas_get(
+                log=self.log,
+                request=self.request,
+                # WITHOUT ANY MATCH THE -99 KEEPS THE AKAS MODEL FROM RETURNING EVERY TRANSIENT
+                elementId=self.matchedTransientBucketIds or [-99],
+                db=self.dbConn
+            )
+        return self.transientsAkasModel
+
+    def _get_associated_lightcurve_data(
+            self,
+            dbConn=None):
+        """
         *get associated lightcurve data for the matched transients*
 
         **Return**
 
-        - ``lightCurveData`` -- the found objects' lightcurve data
+        - ``lightCurveData`` -- the found objects' lightcurve data (one row per detection, or one columnar entry per transient if ``lcFormat`` is ``columnar``/``columnar_b64``)
 
         """
+        dbConn = dbConn or self.dbConn
         self.log.debug(
             'completed the ````_get_associated_lightcurve_data`` method')
 
         matchedTransientBucketIds = self.matchedTransientBucketIds
 
+        # COLUMNAR MODE: PER TRANSIENT AND FILTER/SURVEY ARRAYS, INCLUDING THE NON-DETECTION LIMITS
+        lcFormat = self.qs.get("lcFormat", "rows")
+        if lcFormat in ("columnar", "columnar_b64"):
+            sqlQuery = """
+                select transientBucketId, observationMJD, magnitude, magnitudeError, limitingMag, filter, survey from transientBucket where replacedByRowId = 0 and transientBucketId in %s and observationMJD is not null and magnitude is not null and magnitude < 50;
+            """
+            rows = statements.read_chunked(self.log, dbConn, sqlQuery, matchedTransientBucketIds)
+            lightCurveData = columnar_lightcurves(
+                rows, binary=(lcFormat == "columnar_b64"))
+            self.log.debug(
+                'completed the ``_get_associated_lightcurve_data`` method')
+            return lightCurveData
+
         sqlQuery = """
-            select transientBucketId, magnitude, filter, survey, surveyObjectUrl, observationDate from transientBucket where replacedByRowId = 0 and transientBucketId in (%(matchedTransientBucketIds)s) and observationDate is not null and observationDate != 0000-00-00 and magnitude is not null and magnitude < 50 and limitingMag = 0 order by observationDate desc;
-        """ % locals()
-        lightCurveDataTmp = readquery(sqlQuery, self.dbConn, self.log)
+            select transientBucketId, magnitude, filter, survey, surveyObjectUrl, observationDate from transientBucket where replacedByRowId = 0 and transientBucketId in %s and observationDate is not null and observationDate != 0000-00-00 and magnitude is not null and magnitude < 50 and limitingMag = 0 order by observationDate desc;
+        """
+        lightCurveDataTmp = statements.read_chunked(self.log, dbConn, sqlQuery, matchedTransientBucketIds)
         #lightCurveData = []
         #lightCurveData[:] = [dict(list(zip(list(row.keys()), row)))
         #                     for row in lightCurveDataTmp]
@@ -528,7 +1025,8 @@ class models_transients_get(base_model):
         return lightCurveDataTmp
 
     def _get_associated_atel_data(
-            self):
+            self,
+            dbConn=None):
         """
         *get associated atel data for the matched transients*
 
@@ -537,20 +1035,22 @@ class models_transients_get(base_model):
         - ``transientAtelMatches`` -- the matched atels fot the transients
 
         """
+        dbConn = dbConn or self.dbConn
         self.log.debug('starting the ``_get_associated_atel_data`` method')
 
         matchedTransientBucketIds = self.matchedTransientBucketIds
 
         sqlQuery = """
-            select distinct transientBucketId, name, surveyObjectUrl from transientBucket where replacedByRowId = 0 and transientBucketId in (%(matchedTransientBucketIds)s) and name like "%%atel_%%"
-        """ % locals()
-        transientAtelMatches = readquery(sqlQuery, self.dbConn, self.log)
+            select distinct transientBucketId, name, surveyObjectUrl from transientBucket where replacedByRowId = 0 and transientBucketId in %s and name like "%%atel_%%"
+        """
+        transientAtelMatches = statements.read_chunked(self.log, dbConn, sqlQuery, matchedTransientBucketIds)
 
         self.log.debug('completed the ``_get_associated_atel_data`` method')
         return transientAtelMatches
 
     def _get_associated_multimessenger_associations(
-            self):
+            self,
+            dbConn=None):
         """
         *get associated multimessenger association (skyTags)*
 
@@ -559,20 +1059,22 @@ class models_transients_get(base_model):
         - ``skyTags`` -- the associated multimessenger events and match metadata
 
         """
+        dbConn = dbConn or self.dbConn
         self.log.debug('starting the ``_get_associated_multimessenger_associations`` method')
 
         matchedTransientBucketIds = self.matchedTransientBucketIds
 
         sqlQuery = """
-            SELECT * FROM lvk_skytag s, lvk_alerts a, lvk_events e where s.mapId=a.primaryId and e.superevent_id=a.superevent_id and a.alert_time =e.alert_time and transientBucketId in  (%(matchedTransientBucketIds)s)
-        """ % locals()
-        skyTags = readquery(sqlQuery, self.dbConn, self.log)
+            SELECT * FROM lvk_skytag s, lvk_alerts a, lvk_events e where s.mapId=a.primaryId and e.superevent_id=a.superevent_id and a.alert_time =e.alert_time and transientBucketId in  %s
+        """
+        skyTags = statements.read_chunked(self.log, dbConn, sqlQuery, matchedTransientBucketIds)
 
         self.log.debug('completed the ``_get_associated_multimessenger_associations`` method')
         return skyTags
 
     def _get_associated_comments(
-            self):
+            self,
+            dbConn=None):
         """
         *get associated comments for the transients*
 
@@ -581,100 +1083,228 @@ class models_transients_get(base_model):
         - ``objectComments`` -- object comments
 
         """
+        dbConn = dbConn or self.dbConn
         self.log.debug('starting the ``_get_associated_comments`` method')
 
         matchedTransientBucketIds = self.matchedTransientBucketIds
 
         sqlQuery = """
-            select * from pesstoObjectsComments where pesstoObjectsID in (%(matchedTransientBucketIds)s) order by dateCreated desc
-        """ % locals()
-        objectCommentsTmp = readquery(sqlQuery, self.dbConn, self.log)
+            select * from pesstoObjectsComments where pesstoObjectsID in %s order by dateCreated desc
+        """
+        objectCommentsTmp = statements.read_chunked(self.log, dbConn, sqlQuery, matchedTransientBucketIds)
 
         self.log.debug('completed the ``_get_associated_comments`` method')
         return objectCommentsTmp
 
+    def _list_counts_query(
+            self,
+            queryWhere,
+            whereArgs=()):
+        """
+        *map a single workflow list selection onto ``meta_workflow_lists_counts``*
+
+        The precomputed counts hold one row per list, so they only answer a selection made of
+        one list clause (``mwl``, ``awl``, ``cf=1`` or ``snoozed=1``; ``mwl=all`` reads the ``all``
+        row). Any other combination (e.g. ``mwl=inbox`` with ``snoozed=0``) needs a real count.
+
+        **Key Arguments**
+
+        - ``queryWhere`` -- the where segment of the ticket list sqlQuery string
+        - ``whereArgs`` -- the values bound to the placeholders of ``queryWhere``
+
+        **Return**
+
+        - ``listCounts`` -- ``(ticketCountWhere, ticketCountArgs)`` for the list counts table, or None
+        """
+        queryWhere = queryWhere.strip()
+        clauses = []
+        if queryWhere:
+            clauses = [c.strip() for c in queryWhere[len("where"):].split(" and ")]
+
+        remainingArgs = list(whereArgs)
+        listClauses = []
+        listArgs = []
+        for clause in clauses:
+            placeholders = clause.count("%s")
+            clauseArgs, remainingArgs = remainingArgs[:placeholders], remainingArgs[placeholders:]
+            if clause == "1=1":
+                continue
+            if clause in ("marshallWorkflowLocation = %s", "alertWorkflowLocation = %s") or clause.startswith("(marshallWorkflowLocation = "):
+                listClauses.append(clause.replace("marshallWorkflowLocation", "listName").replace(
+                    "alertWorkflowLocation", "listName"))
+                listArgs.extend(clauseArgs)
+            elif clause in ("classifiedFlag = %s", "snoozed = %s") and clauseArgs == ["1"]:
+                listClauses.append("listName = %s")
+                listArgs.append("classified" if clause.startswith("classifiedFlag") else "snoozed")
+            else:
+                return None
+
+        if len(listClauses) > 1:
+            return None
+        if not listClauses:
+            return "where listName = %s", ["all"]
+        return "where " + listClauses[0], listArgs
+
     def _get_total_ticket_count_for_list(
             self,
-            queryWhere):
+            queryWhere,
+            whereArgs=()):
         """
         *get total ticket count for list*
 
         **Key Arguments**
 
         - ``queryWhere`` -- the where segment of the ticket list sqlQuery string
+        - ``whereArgs`` -- the values bound to the placeholders of ``queryWhere``
 
 
         **Return**
 
-        - ``totalTickets`` -- total number of object in list
+        - ``totalTickets`` -- total number of object in list (None if ``countMode`` is ``none``)
 
         """
         self.log.debug(
             'completed the ````_get_total_ticket_count_for_list`` method')
 
+        if self.qs.get("countMode") == "none":
+            self.countStrategy = "none"
+            return None
+
         tcsCatalogueId = self.tcsCatalogueId
-        if self.search:
+        if self.search and "q" in self.request:
             sqlQuery = """
-                select count(*) from pesstoObjects p, transientBucketSummaries t %(queryWhere)s and t.transientBucketId = p.transientBucketId;
+                select count(*) as count from pesstoObjects p, transientBucketSummaries t %(queryWhere)s and t.transientBucketId = p.transientBucketId
             """ % locals()
-            totalTickets = readquery(sqlQuery, self.dbConn, self.log)
-            totalTickets = totalTickets[0]["count(*)"]
+            totalTickets = self._count_rows(sqlQuery, whereArgs)
         elif self.elementId:
             totalTickets = 1
+            self.countStrategy = "elementId"
         elif tcsCatalogueId:
+            self.countStrategy = "tcsStats"
             if "tcsRank" in self.qs:
                 sqlQuery = """
-                    select top_ranked_transient_associations as count from tcs_stats_catalogues where table_id = %(tcsCatalogueId)s;
-                """ % locals()
+                    select top_ranked_transient_associations as count from tcs_stats_catalogues where table_id = %s;
+                """
             else:
                 sqlQuery = """
-                    select all_transient_associations as count from tcs_stats_catalogues where table_id = %(tcsCatalogueId)s;
-                """ % locals()
-            ticketCountRows = readquery(sqlQuery, self.dbConn, self.log)
+                    select all_transient_associations as count from tcs_stats_catalogues where table_id = %s;
+                """
+            ticketCountRows = statements.read(self.log, self.dbConn, sqlQuery, (tcsCatalogueId,))
             totalTickets = 0
             for row in ticketCountRows:
                 totalTickets += row["count"]
-        elif 'filterBy1' in self.qs or 'filterBy2' in self.qs:
-            tcsCm = ", sherlock_crossmatches cm"
-            tec = "and t.transientBucketId = cm.transient_object_id"
-            sec = "and s.transientBucketId = cm.transient_object_id"
-            tep = "and t.transientBucketId = p.transientBucketId"
-            sep = "and s.transientBucketId = p.transientBucketId"
-
-            sqlQuery = """
-                    select count(*) as count from transientBucketSummaries t, pesstoObjects p %(queryWhere)s %(tep)s
-                """ % locals()
-
-            ticketCountRows = readquery(sqlQuery, self.dbConn, self.log)
-
-            totalTickets = 0
-            for row in ticketCountRows:
-                print(row)
-                print(row["count"])
-                totalTickets += int(row["count"])
-        elif 'phase_iii_transient_catalogue_ssdr3' in queryWhere:
+        elif not self._active_filters() and 'phase_iii_transient_catalogue_ssdr3' in queryWhere:
             sqlQuery = """
                     select count(*) as count FROM phase_iii_transient_catalogue_ssdr3 p, sherlock_classifications s where s.transient_object_id=p.TransientBucketId and s.matchVerified is null
             """ % locals()
-            ticketCountRows = readquery(sqlQuery, self.dbConn, self.log)
-            totalTickets = 0
-            for row in ticketCountRows:
-                totalTickets += row["count"]
+            totalTickets = self._count_rows(sqlQuery)
         else:
-            ticketCountWhere = queryWhere.replace("marshallWorkflowLocation", "listName").replace(
-                "alertWorkflowLocation", "listName").replace('classifiedFlag = "1"', 'listName="classified"').replace('snoozed = "1"', 'listName="snoozed"')
-            sqlQuery = """
-                select count from meta_workflow_lists_counts %(ticketCountWhere)s;
-            """ % locals()
-            ticketCountRows = readquery(sqlQuery, self.dbConn, self.log)
-            totalTickets = 0
-            for row in ticketCountRows:
-                totalTickets += row["count"]
+            listCounts = None
+            if not self._active_filters():
+                listCounts = self._list_counts_query(queryWhere, whereArgs)
+
+            if listCounts:
+                # A SINGLE WORKFLOW LIST IS ANSWERED FROM THE PRECOMPUTED LIST COUNTS
+                self.countStrategy = "listCounts"
+                ticketCountWhere, ticketCountArgs = listCounts
+                sqlQuery = """
+                    select count from meta_workflow_lists_counts %(ticketCountWhere)s
+                """ % locals()
+                ticketCountRows = statements.read(self.log, self.dbConn, sqlQuery, ticketCountArgs)
+                totalTickets = 0
+                for row in ticketCountRows:
+                    totalTickets += row["count"]
+            else:
+                tep = "and t.transientBucketId = p.transientBucketId"
+                sqlQuery = """
+                        select count(*) as count from transientBucketSummaries t, pesstoObjects p %(queryWhere)s %(tep)s
+                    """ % locals()
+                totalTickets = self._count_rows(sqlQuery, whereArgs)
 
         self.log.debug(
             'completed the ``_get_total_ticket_count_for_list`` method')
         return totalTickets
 
+    def _count_rows(
+            self,
+            sqlQuery,
+            args=()):
+        """
+        *run (or reuse) an expensive ``select count(*) as count`` of a filtered or searched list*
+
+        Totals are kept in ``ticketCountCache`` keyed on the whitespace-normalised query, its
+        arguments, the ``countMode`` and the write generation passed to the model, so paging
+        through a list runs the count once. With ``countMode=estimate`` the total is the row
+        estimate of the query plan (EXPLAIN) instead, which costs no scan at all.
+
+        **Key Arguments**
+
+        - ``sqlQuery`` -- the count query, with ``%s`` placeholders
+        - ``args`` -- the values bound to its placeholders
+
+        **Return**
+
+        - ``count`` -- the (exact or estimated) number of rows
+        """
+        countMode = "estimate" if self.qs.get("countMode") == "estimate" else "exact"
+        # LISTS (THE SEARCH MATCHES) ARE NOT HASHABLE
+        keyArgs = tuple(tuple(a) if isinstance(a, (list, tuple, set)) else a for a in args)
+        key = (countMode, " ".join(sqlQuery.split()), keyArgs, self.countGeneration)
+
+        count = ticketCountCache.get(key)
+        if count is not None:
+            self.countStrategy = "cachedEstimate" if countMode == "estimate" else "cachedCount"
+            return count
+
+        count = None
+        if countMode == "estimate":
+            count = self._estimate_rows(sqlQuery, args)
+        if count is None:
+            countMode = "exact"
+            rows = statements.read(self.log, self.dbConn, sqlQuery, args)
+            count = int(rows[0]["count"]) if rows else 0
+            key = (countMode,) + key[1:]
+
+        self.countStrategy = "estimate" if countMode == "estimate" else "count"
+        ticketCountCache.set(key, count)
+        return count
+
+    def _estimate_rows(
+            self,
+            sqlQuery,
+            args=()):
+        """
+        *estimate the rows counted by ``sqlQuery`` from its EXPLAIN plan*
+
+        The estimate is the product over the joined tables of ``rows`` times ``filtered``
+        (the fan-out the optimizer itself assumes). Returns None when the plan carries no
+        estimate (e.g. a count answered from the table metadata), so the caller counts exactly.
+        """
+        try:
+            plan = statements.read(self.log, self.dbConn, "explain " + sqlQuery, args)
+        except Exception as e:
+            self.log.warning("could not explain the count query: %s" % (e,))
+            return None
+
+        estimate = 1.0
+        for row in plan:
+            if row.get("rows") is None:
+                return None
+            estimate *= float(row["rows"]) * float(row.get("filtered") or 100) / 100
+        if not plan:
+            return None
+        return int(round(estimate))
+
+    def _active_filters(
+            self):
+        """
+        *the numbers ("1", "2") of the column filters that constrain the ticket selection*
+
+        A filter only applies when its column, operator and value are all set (the default
+        ``filterBy1`` with ``filterValue1`` switched off constrains nothing).
+        """
+        return [n for n in ("1", "2") if self.qs.get("filterBy" + n) and self.qs.get("filterValue" + n) and self.qs.get("filterOp" + n)]
+
     def _count_single_list(
             self,
             listName):
@@ -692,8 +1322,8 @@ class models_transients_get(base_model):
         """
         self.log.debug('starting the ``_count_single_list`` method')
 
-        sqlQuery = """select count from meta_workflow_lists_counts where listName = "%(listName)s" """ % locals()
-        rows = readquery(sqlQuery, self.dbConn, self.log)
+        sqlQuery = """select count from meta_workflow_lists_counts where listName = %s """
+        rows = statements.read(self.log, self.dbConn, sqlQuery, (listName,))
         
         count = 0
         if rows:
@@ -728,21 +1358,22 @@ class models_transients_get(base_model):
         return counts
 
     def _get_associated_transient_history(
-            self):
+            self,
+            dbConn=None):
         """
         *get associated transient history*
         """
+        dbConn = dbConn or self.dbConn
         self.log.debug(
             'completed the ````_get_associated_transient_history`` method')
 
         matchedTransientBucketIds = self.matchedTransientBucketIds
 
         sqlQuery = """
-            select * from transients_history_logs where transientBucketId in (%(matchedTransientBucketIds)s) order by dateCreated desc
-        """ % locals()
-        print(sqlQuery)
+            select * from transients_history_logs where transientBucketId in %s order by dateCreated desc
+        """
 
-        objectHistory = readquery(sqlQuery, self.dbConn, self.log)
+        objectHistory = statements.read_chunked(self.log, dbConn, sqlQuery, matchedTransientBucketIds)
 
 
         from operator import itemgetter
@@ -755,69 +1386,30 @@ class models_transients_get(base_model):
         return objectHistory
 
     def _get_associated_transient_crossmatches(
-            self):
+            self,
+            dbConn=None):
         """
         *get associated transient crossmatches*
         """
+        dbConn = dbConn or self.dbConn
         self.log.debug(
             'completed the ````_get_associated_transient_crossmatches`` method')
 
-        from astrocalc.coords import unit_conversion
-        # ASTROCALC UNIT CONVERTER OBJECT
-        converter = unit_conversion(
-            log=self.log
-        )
-
         matchedTransientBucketIds = self.matchedTransientBucketIds
 
         sqlQuery = """
-            select *, t.raDeg, t.decDeg from sherlock_crossmatches t, transientBucket b where b.replacedByRowId = 0 and b.transientBucketId in (%(matchedTransientBucketIds)s) and b.transientBucketId = t.transient_object_id  and b.masterIDFlag = 1 and rank is not null order by rank
-        """ % locals()
+            select *, t.raDeg, t.decDeg from sherlock_crossmatches t, transientBucket b where b.replacedByRowId = 0 and b.transientBucketId in %s and b.transientBucketId = t.transient_object_id  and b.masterIDFlag = 1 and rank is not null order by rank
+        """
 
-        crossmatches = readquery(sqlQuery, self.dbConn, self.log)
+        crossmatches = statements.read_chunked(self.log, dbConn, sqlQuery, matchedTransientBucketIds)
 
         from operator import itemgetter
         crossmatches = list(crossmatches)
         crossmatches = sorted(
             crossmatches, key=itemgetter('rank'), reverse=False)
 
-        for c in crossmatches:
-            c["object_link"] = None
-            objectName = urllib.parse.quote(c["catalogue_object_id"])
-            if "ned" in c["catalogue_table_name"].lower():
-                c[
-                    "object_link"] = "https://ned.ipac.caltech.edu/cgi-bin/objsearch?objname=%(objectName)s&extend=no&hconst=73&omegam=0.27&omegav=0.73&corr_z=1&out_csys=Equatorial&out_equinox=J2000.0&obj_sort=RA+or+Longitude&of=pre_text&zv_breaker=30000.0&list_limit=5&img_stamp=YES" % locals()
-            elif "sdss" in c["catalogue_table_name"].lower():
-                c[
-                    "object_link"] = "http://skyserver.sdss.org/dr12/en/tools/explore/Summary.aspx?id=%(objectName)s" % locals()
-                ra = converter.ra_decimal_to_sexegesimal(
-                    ra=c["raDeg"],
-                    delimiter=""
-                )
-                dec = converter.dec_decimal_to_sexegesimal(
-                    dec=c["decDeg"],
-                    delimiter=""
-                )
-                c["catalogue_object_id"] = "SDSS J" + ra[0:9] + dec[0:9]
-                objectName = urllib.parse.quote(c["catalogue_object_id"])
-            elif "milliquas" in c["catalogue_table_name"].lower():
-                c[
-                    "object_link"] = "https://heasarc.gsfc.nasa.gov/db-perl/W3Browse/w3query.pl?bparam_name=%(objectName)s&navtrail=%%3Ca+class%%3D%%27navpast%%27+href%%3D%%27https%%3A%%2F%%2Fheasarc.gsfc.nasa.gov%%2FW3Browse%%2Fall%%2Fmilliquas.html%%27%%3E+Choose+Tables%%3C%%2Fa%%3E+%%3E+%%3Ca+class%%3D%%27navpast%%27+href%%3D%%27%%2Fcgi-bin%%2FW3Browse%%2Fw3table.pl%%3FREAL_REMOTE_HOST%%3D143.117.37.81%%26tablehead%%3Dname%%253Dmilliquas%%26Action%%3DMore%%2BOptions%%26REAL_REMOTE_HOST%%3D143%%252E117%%252E37%%252E81%%26Equinox%%3D2000%%26Action%%3DMore%%2BOptions%%26sortby%%3Dpriority%%26ResultMax%%3D1000%%26maxpriority%%3D99%%26Coordinates%%3DEquatorial%%26tablehead%%3Dname%%253Dmilliquas%%26Action%%3DParameter%%2BSearch%%27%%3EParameter+Search%%3C%%2Fa%%3E&popupFrom=Query+Results&tablehead=name%%3Dheasarc_milliquas%%26description%%3DMillion+Quasars+Catalog+%%28MILLIQUAS%%29%%2C+Version+4.5+%%2810+May+2015%%29%%26url%%3Dhttp%%3A%%2F%%2Fheasarc.gsfc.nasa.gov%%2FW3Browse%%2Fgalaxy-catalog%%2Fmilliquas.html%%26archive%%3DN%%26radius%%3D1%%26mission%%3DGALAXY+CATALOG%%26priority%%3D5%%26tabletype%%3DObject&dummy=Examples+of+query+constraints%%3A&varon=name&bparam_name%%3A%%3Aunit=+&bparam_name%%3A%%3Aformat=char25&varon=ra&bparam_ra=&bparam_ra%%3A%%3Aunit=degree&bparam_ra%%3A%%3Aformat=float8%%3A.5f&varon=dec&bparam_dec=&bparam_dec%%3A%%3Aunit=degree&bparam_dec%%3A%%3Aformat=float8%%3A.5f&varon=bmag&bparam_bmag=&bparam_bmag%%3A%%3Aunit=mag&bparam_bmag%%3A%%3Aformat=float8%%3A4.1f&varon=rmag&bparam_rmag=&bparam_rmag%%3A%%3Aunit=mag&bparam_rmag%%3A%%3Aformat=float8%%3A4.1f&varon=redshift&bparam_redshift=&bparam_redshift%%3A%%3Aunit=+&bparam_redshift%%3A%%3Aformat=float8%%3A6.3f&varon=radio_name&bparam_radio_name=&bparam_radio_name%%3A%%3Aunit=+&bparam_radio_name%%3A%%3Aformat=char22&varon=xray_name&bparam_xray_name=&bparam_xray_name%%3A%%3Aunit=+&bparam_xray_name%%3A%%3Aformat=char22&bparam_lii=&bparam_lii%%3A%%3Aunit=degree&bparam_lii%%3A%%3Aformat=float8%%3A.5f&bparam_bii=&bparam_bii%%3A%%3Aunit=degree&bparam_bii%%3A%%3Aformat=float8%%3A.5f&bparam_broad_type=&bparam_broad_type%%3A%%3Aunit=+&bparam_broad_type%%3A%%3Aformat=char4&bparam_optical_flag=&bparam_optical_flag%%3A%%3Aunit=+&bparam_optical_flag%%3A%%3Aformat=char3&bparam_red_psf_flag=&bparam_red_psf_flag%%3A%%3Aunit=+&bparam_red_psf_flag%%3A%%3Aformat=char1&bparam_blue_psf_flag=&bparam_blue_psf_flag%%3A%%3Aunit=+&bparam_blue_psf_flag%%3A%%3Aformat=char1&bparam_ref_name=&bparam_ref_name%%3A%%3Aunit=+&bparam_ref_name%%3A%%3Aformat=char6&bparam_ref_redshift=&bparam_ref_redshift%%3A%%3Aunit=+&bparam_ref_redshift%%3A%%3Aformat=char6&bparam_qso_prob=&bparam_qso_prob%%3A%%3Aunit=percent&bparam_qso_prob%%3A%%3Aformat=int2%%3A3d&bparam_alt_name_1=&bparam_alt_name_1%%3A%%3Aunit=+&bparam_alt_name_1%%3A%%3Aformat=char22&bparam_alt_name_2=&bparam_alt_name_2%%3A%%3Aunit=+&bparam_alt_name_2%%3A%%3Aformat=char22&Entry=&Coordinates=J2000&Radius=Default&Radius_unit=arcsec&NR=CheckCaches%%2FGRB%%2FSIMBAD%%2FNED&Time=&ResultMax=10&displaymode=Display&Action=Start+Search&table=heasarc_milliquas" % locals()
-            elif ("ps1" not in c["catalogue_table_name"].lower()) and ("ritter" not in c["catalogue_table_name"].lower()) and ("down" not in c["catalogue_table_name"].lower()) and ("guide_star" not in c["catalogue_table_name"].lower()) and ("kepler" not in c["catalogue_table_name"].lower()):
-                c[
-                    "object_link"] = "http://simbad.u-strasbg.fr/simbad/sim-id?Ident=%(objectName)s&NbIdent=1&Radius=2&Radius.unit=arcmin&submit=submit+id" % locals()
-
-            c["best_mag"] = None
-            c["best_mag_error"] = None
-            c["best_mag_filter"] = None
-            filters = ["R", "V", "B", "I", "J", "G", "H", "K", "U",
-                       "_r", "_g", "_i", "_g", "_z", "_y", "_u", "unkMag"]
-            for f in filters:
-                if c[f] and not c["best_mag"]:
-                    c["best_mag"] = c[f]
-                    c["best_mag_error"] = c[f + "Err"]
-                    c["best_mag_filter"] = f.replace(
-                        "_", "").replace("Mag", "")
+        # LINKS, BEST MAGNITUDES AND SDSS NAMES ARE ONLY COMPUTED FOR THE CATALOGUE OBJECTS NOT SEEN BEFORE
+        enrich_crossmatches(crossmatches, cache=crossmatchCache)
 
         self.log.debug(
             'completed the ``_get_associated_transient_crossmatches`` method')
@@ -8,7 +8,6 @@
 """
 from builtins import zip
 from builtins import object
-from fundamentals.mysql import readquery, writequery
 import sys
 import os
 from fundamentals import times
@@ -16,6 +15,15 @@ from marshallEngine.feeders.useradded import data, images
 from astrocalc.times import conversions
 from datetime import datetime, date, time
 import yaml
+from models.transients.models_transients_count import listCountsCache, ticketCountCache
+from packages.list_counts import list_count_deltas, apply_list_count_deltas
+from packages.response_cache import lists_for_workflow_state
+from packages.unit_of_work import unit_of_work
+from packages import statements
+from collections import namedtuple
+
+# A LIST MOVE SETTING A COLUMN FROM ANOTHER COLUMN OF THE SAME ROW (RATHER THAN FROM A VALUE)
+column_value = namedtuple("column_value", ["column"])
 
 class models_transients_element_put(object):
     """
@@ -25,18 +33,33 @@ class models_transients_element_put(object):
 
     - ``log`` -- logger
     - ``request`` -- the pyramid request
+    - ``db`` -- the database connection
+    - ``cache`` -- the list-view ``response_cache`` to invalidate on writes (or None)
+    - ``searchIndex`` -- the free-text ``search_index`` to refresh when PI names or transients are added (or None)
     """
     def __init__(
         self,
         log,
         request,
-        db
+        db,
+        cache=None,
+        searchIndex=None
     ):
         self.log = log
         self.request = request
         self.transientBucketId = request["elementId"] if "elementId" in request else None
+        self.transientBucketIds = request["elementIds"] if "elementIds" in request else None
         self.response = ""
+        self.results = None
+        self.workflowStates = {}
+        self.workflowStatesAfter = {}
+        self.countsChanged = False
+        self.uow = None
+        self.timings = []
+        self.searchIndexStale = False
         self.dbConn = db
+        self.cache = cache
+        self.searchIndex = searchIndex
         # xt-self-arg-tmpx
 
         log.debug("instansiating a new 'models_transients_element_put' object")
@@ -50,22 +73,136 @@ class models_transients_element_put(object):
     def put(self):
         """get the models_transients_element_put object
 
+        All the statements of the write (including the sidebar list count changes) run in a
+        single transaction that is replayed on a deadlock. The workflow state of the
+        transient is read before and after the write so that the sidebar list counts can be
+        adjusted incrementally and the cached list views showing it (in either state) invalidated.
+
         **Return**
 
         - ``response``
         """
+        if self.transientBucketIds is not None:
+            # BULK LIST MOVE
+            transientBucketIds = self.transientBucketIds
+        elif self.transientBucketId is None:
+            # A NEW TRANSIENT LANDS IN THE INBOX (THE INGEST IS COUNTED BY THE RECONCILIATION)
+            # THE MARSHALL ENGINE INGEST COMMITS ON ITS OWN, SO THIS PATH CANNOT JOIN A TRANSACTION
+            try:
+                return self._put()
+            finally:
+                ticketCountCache.invalidate()
+                if self.cache:
+                    self.cache.bump(["mwl:inbox"])
+        else:
+            transientBucketIds = [self.transientBucketId]
+
+        self.uow = unit_of_work(log=self.log, dbConn=self.dbConn)
+        try:
+            response = self.uow.run(lambda: self._put_in_transaction(transientBucketIds))
+        finally:
+            self.timings = self.uow.timings
+            self.log.debug("put timings: %s" % (self.uow.report(),))
+
+        # ONLY ONCE COMMITTED ARE THE CHANGES VISIBLE TO THE OTHER READERS
+        if self.countsChanged:
+            listCountsCache.invalidate()
+        ticketCountCache.invalidate()
+        if self.searchIndexStale and self.searchIndex:
+            self.searchIndex.mark_stale()
+        if self.cache:
+            listNames = set()
+            for states in (self.workflowStates, self.workflowStatesAfter):
+                for state in states.values():
+                    listNames |= lists_for_workflow_state(state)
+            self.cache.bump(listNames)
+        return response
+
+    def _put_in_transaction(
+            self,
+            transientBucketIds):
+        """*the body of the write transaction (replayed from scratch on a deadlock)*
+        """
+        self.response = ""
+        self.results = None
+        # LOCK THE ROWS SO THE MOVE RULES AND THE -1 COUNT DELTAS SEE THE COMMITTED STATE,
+        # NOT A SNAPSHOT A CONCURRENT MOVE OF THE SAME TRANSIENT IS ABOUT TO CHANGE
+        self.workflowStates = self._read_workflow_states(transientBucketIds, forUpdate=True)
+        response = self._put()
+        self.workflowStatesAfter = self._read_workflow_states(transientBucketIds)
+        self.countsChanged = self._update_sidebar_list_counts(
+            self.workflowStates, self.workflowStatesAfter)
+        return response
+
+    def _read(
+            self,
+            sqlQuery,
+            args=None):
+        """*read rows, inside the transaction when one is open*
+
+        ``args`` are bound by the driver to the ``%s`` placeholders of ``sqlQuery`` (see ``packages.statements``).
+        """
+        if self.uow:
+            return self.uow.query(sqlQuery, args)
+        return statements.read(self.log, self.dbConn, sqlQuery, args)
+
+    def _write(
+            self,
+            sqlQuery,
+            args=None):
+        """*execute a statement, inside the transaction when one is open*
+        """
+        if self.uow:
+            return self.uow.execute(sqlQuery, args)
+        return statements.write(self.log, self.dbConn, sqlQuery, args)
+
+    def _read_workflow_states(
+            self,
+            transientBucketIds,
+            forUpdate=False):
+        """*read the workflow list state of the given transients*
+
+        **Key Arguments**
+
+        - ``transientBucketIds`` -- list of transientBucketIds
+        - ``forUpdate`` -- lock the rows until the transaction ends (a locking read of the latest committed rows)
+
+        **Return**
+
+        - ``states`` -- dictionary of transientBucketId to ``marshallWorkflowLocation``, ``alertWorkflowLocation``, ``snoozed``, ``classifiedFlag``, ``pi_name`` and ``pi_email``
+        """
+        if not transientBucketIds:
+            return {}
+        sqlQuery = """
+            select transientBucketId, marshallWorkflowLocation, alertWorkflowLocation, snoozed, classifiedFlag, pi_name, pi_email from pesstoObjects where transientBucketId in %s order by transientBucketId
+        """
+        if forUpdate:
+            sqlQuery = sqlQuery.rstrip() + " for update"
+        rows = self._read(sqlQuery, [sorted(int(t) for t in transientBucketIds)])
+
+        states = {}
+        for row in rows:
+            states[row["transientBucketId"]] = row
+        return states
+
+    def _put(self):
+        """perform the write requested
+        """
         self.log.debug('starting the ``get`` method')
 
+        # move many objects to another list in one go
+        if self.transientBucketIds is not None:
+            self._move_transients_to_another_list()
+            return self.response
+
         # move the objects to another list if requested
         if "mwl" in self.request or "awl" in self.request or "snoozed" in self.request:
             self._move_transient_to_another_list()
-            self._refresh_sidebar_list_counts()
             return self.response
 
         # change the pi is requested
         if set(("piName", "piEmail")) <= set(self.request):
             self._change_pi_for_object()
-            self._refresh_sidebar_list_counts()
             return self.response
 
         if "observationPriority" in self.request:
@@ -74,7 +211,6 @@ class models_transients_element_put(object):
         
         if "clsType" in self.request:
             self._add_transient_classification()
-            self._refresh_sidebar_list_counts()
             return self.response
         
         if "objectDate" in self.request:
@@ -91,348 +227,271 @@ class models_transients_element_put(object):
 
     def _move_transient_to_another_list(
             self):
-        """ create sqlquery for the put request
+        """ move the transient to the requested list
+
+        Raises ``ValueError`` if the move is not allowed from the transient's current list.
         """
-        print("Moving the transient to another list")
-        self.log.debug('starting the ``_create_sqlquery`` method')
+        self.log.debug('starting the ``_move_transient_to_another_list`` method')
         transientBucketId = self.transientBucketId
 
-        sqlQuery = u"""
-            select marshallWorkflowLocation, alertWorkflowLocation, snoozed from pesstoObjects where transientBucketId = %(transientBucketId)s
-        """ % locals()
-        objectData = readquery(sqlQuery, self.dbConn, self.log)
-
-        oldMwl = objectData[0]["marshallWorkflowLocation"]
-        print(f"The old mwl is {oldMwl}")
-        oldAwl = objectData[0]["alertWorkflowLocation"]
-        oldSnoozed = objectData[0]["snoozed"]
         username = self.request["authenticated_userid"].replace(".", " ").title()
-        now = datetime.now()
-        now = now.strftime("%Y-%m-%d %H:%M:%S")
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        plan = self._plan_list_move(
+            transientBucketId, self.workflowStates.get(transientBucketId), username, now)
 
-        ## TODO: Controlla qua se c'è un snoozed.
-        if "snoozed" in self.request and self.request["snoozed"] == True:
-            if oldMwl.lower() == "inbox":
-                print("Snoozing the object")
-                logEntry = "object snoozed by %(username)s" % locals(
-                )
-                snoozed = ", snoozed = 1"
-                sqlQuery = """
-                    update pesstoObjects set snoozed = 1, marshallWorkflowLocation = "archive" where transientBucketId = %(transientBucketId)s
-                """ % locals()
-                writequery(self.log, sqlQuery, self.dbConn)
-
-                #NOW UPDATING THE LOG
-                sqlQuery = u"""insert ignore into transients_history_logs (
-                transientBucketId,
-                dateCreated,
-                log
-                )
-                VALUES (
-                %s,
-                "%s",
-                "%s"
-                )""" % (transientBucketId, now, logEntry)
-                writequery(self.log, sqlQuery, self.dbConn)
+        self.response = self.response + plan["message"]
+        if plan["error"]:
+            raise ValueError(plan["error"])
+        self._apply_list_moves([plan])
 
+        self.log.debug('completed the ``_move_transient_to_another_list`` method')
+        return None
 
+    def _move_transients_to_another_list(
+            self):
+        """ apply the same list move to many transients
 
-                self.response = self.response + \
-                        " transientBucketId %(transientBucketId)s snoozed by %(username)s<BR>" % locals(
-                    )
+        Every transient is checked against the same rules as a single move; the allowed
+        moves are written together in one transaction and the per-transient outcome is
+        stored in ``self.results``.
+        """
+        self.log.debug('starting the ``_move_transients_to_another_list`` method')
 
+        username = self.request["authenticated_userid"].replace(".", " ").title()
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        plans = []
+        for transientBucketId in self.transientBucketIds:
+            plans.append(self._plan_list_move(
+                transientBucketId, self.workflowStates.get(transientBucketId), username, now))
+
+        self._apply_list_moves([p for p in plans if not p["error"]])
+
+        self.results = []
+        for plan in plans:
+            self.response = self.response + plan["message"]
+            self.results.append({
+                "elementId": plan["transientBucketId"],
+                "success": not plan["error"],
+                "msg": plan["message"],
+                "err": plan["error"]
+            })
+
+        self.log.debug('completed the ``_move_transients_to_another_list`` method')
+        return None
 
+    def _plan_list_move(
+            self,
+            transientBucketId,
+            state,
+            username,
+            now):
+        """*work out the writes moving one transient to the requested list*
 
-                self.log.debug('completed the ``_create_sqlquery`` method')
-                return None
-            else:
-                self.response = self.response + \
-                    " transientBucketId %(transientBucketId)s cannot be snoozed as it is not in the `inbox` list<BR>" % locals(
-                    )
-                self.log.debug('completed the ``_create_sqlquery`` method')
-                raise ValueError("Invalid marshallWorkflowLocation")
-                return None
+        Nothing is written here; the rules of the list workflow are applied to the transient's
+        current state and the resulting column changes and history log entries returned.
 
+        **Key Arguments**
 
-        if "snoozed" in self.request and self.request["snoozed"] == False:
-            if oldSnoozed == True:
-            # Check that the object is really snoozed.
+        - ``transientBucketId`` -- the transient to move
+        - ``state`` -- its current row from ``_read_workflow_states`` (None if it does not exist)
+        - ``username`` -- the user performing the move (for the history logs)
+        - ``now`` -- the timestamp of the move
 
-                sqlQuery = """
-                    update pesstoObjects set snoozed = 0, marshallWorkflowLocation = "inbox" where transientBucketId = %(transientBucketId)s
-                """ % locals()
-                writequery(self.log, sqlQuery, self.dbConn)
-                logEntry = "object unsnoozed by %(username)s" % locals(
-                )
+        **Return**
 
-                #NOW UPDATING THE LOG
-                sqlQuery = u"""insert ignore into transients_history_logs (
-                transientBucketId,
-                dateCreated,
-                log
+        - ``plan`` -- dictionary with the ``sets`` (column to new value, or ``column_value`` to copy another column), ``logEntries``, the response ``message`` and the ``error`` (None if the move is allowed)
+        """
+        plan = {
+            "transientBucketId": transientBucketId,
+            "dateCreated": now,
+            "sets": {},
+            "logEntries": [],
+            "message": "",
+            "error": None
+        }
+        sets = plan["sets"]
+
+        def reject(message, error="Invalid marshallWorkflowLocation"):
+            plan["message"] = plan["message"] + message
+            plan["error"] = error
+            return plan
+
+        if not state:
+            return reject(" transientBucketId %(transientBucketId)s does not exist<BR>" % locals(), "Unknown transientBucketId")
+
+        oldMwl = state["marshallWorkflowLocation"]
+        oldAwl = state["alertWorkflowLocation"]
+        oldSnoozed = state["snoozed"]
+
+        def archive():
+            # IF ARCHIVED, WE NEED TO SET TO archive THE marshallWorkflowLocation and store in unarchiveToMarshallWorkflowLocation the current marshallWorkflowLocation
+            sets["marshallWorkflowLocation"] = "archive"
+            sets["unarchiveToMarshallWorkflowLocation"] = oldMwl
+            plan["message"] = plan["message"] + \
+                " transientBucketId %(transientBucketId)s moved to the `archive` marshallWorkflowLocation and will be unarchived to the `%(oldMwl)s` list<BR>" % locals(
                 )
-                VALUES (
-                %s,
-                "%s",
-                "%s"
-                )""" % (transientBucketId, now, logEntry)
-                writequery(self.log, sqlQuery, self.dbConn)
-
-
-
-                self.response = self.response + \
-                        " transientBucketId %(transientBucketId)s unsnoozed by %(username)s<BR>" % locals(
-                    )
-                return None
-            else:
-                self.response = self.response + \
-                    " transientBucketId %(transientBucketId)s cannot be unsnoozed as it is not in snoozed." % locals(
-                    )
-                raise ValueError("Invalid marshallWorkflowLocation")
-                return None
-
+            return plan
 
+        ## TODO: Controlla qua se c'è un snoozed.
+        if "snoozed" in self.request and self.request["snoozed"] == True:
+            if (oldMwl or "").lower() == "inbox":
+                sets["snoozed"] = 1
+                sets["marshallWorkflowLocation"] = "archive"
+                plan["logEntries"].append("object snoozed by %(username)s" % locals())
+                plan["message"] = " transientBucketId %(transientBucketId)s snoozed by %(username)s<BR>" % locals(
+                )
+                return plan
+            return reject(" transientBucketId %(transientBucketId)s cannot be snoozed as it is not in the `inbox` list<BR>" % locals())
 
+        if "snoozed" in self.request and self.request["snoozed"] == False:
+            # Check that the object is really snoozed.
+            if oldSnoozed == True:
+                sets["snoozed"] = 0
+                sets["marshallWorkflowLocation"] = "inbox"
+                plan["logEntries"].append("object unsnoozed by %(username)s" % locals())
+                plan["message"] = " transientBucketId %(transientBucketId)s unsnoozed by %(username)s<BR>" % locals(
+                )
+                return plan
+            return reject(" transientBucketId %(transientBucketId)s cannot be unsnoozed as it is not in snoozed." % locals())
 
         if "mwl" in self.request:
             mwl = self.request["mwl"]
-            print(mwl)
 
             # VALIDATE THE MOVE
             if mwl not in ["inbox", "pending observation", "review for followup", "following", "followup complete", "archive" , "unarchive"]:
-                self.response = self.response + \
-                    " transientBucketId %(transientBucketId)s cannot be moved to the `%(mwl)s` marshallWorkflowLocation as it is not a valid list<BR>" % locals(
-                    )
-                self.log.debug('completed the ``_create_sqlquery`` method')
-                raise ValueError("Invalid marshallWorkflowLocation")
-                return None
-            
+                return reject(" transientBucketId %(transientBucketId)s cannot be moved to the `%(mwl)s` marshallWorkflowLocation as it is not a valid list<BR>" % locals())
+
             # CHECK IF IT IS AN UNARCHIVE MOVE. IN THAT CASE, PUT THE TRANSIENT BACK TO THE UNARCHIVE TO MARSHALL WORKFLOW LOCATION
             if mwl == "unarchive":
                 if oldMwl == "archive":
-                    sqlQuery = """
-                        update pesstoObjects set marshallWorkflowLocation = unarchiveToMarshallWorkflowLocation where transientBucketId = %(transientBucketId)s
-                    """ % locals()
-                    writequery(self.log, sqlQuery, self.dbConn)
-                    self.response = self.response + \
-                        " transientBucketId %(transientBucketId)s moved back to previous marshallWorkflowLocation<BR>" % locals(
-                        )
-                    return None
-                else:
-                    self.response = self.response + \
-                        " transientBucketId %(transientBucketId)s cannot be unarchived as it is not in the `archive` list<BR>" % locals(
-                        )
-                    self.log.debug('completed the ``_create_sqlquery`` method')
-                    raise ValueError("Invalid marshallWorkflowLocation")
-                    return None
-            # CHECK THE OLD WORKFLOW LOCATION AND OTHER STUFF NEEDED (AS PI OR CLASSIFICATION) IN ORDER TO MOVE CORRECTLY
+                    sets["marshallWorkflowLocation"] = column_value("unarchiveToMarshallWorkflowLocation")
+                    plan["message"] = " transientBucketId %(transientBucketId)s moved back to previous marshallWorkflowLocation<BR>" % locals(
+                    )
+                    return plan
+                return reject(" transientBucketId %(transientBucketId)s cannot be unarchived as it is not in the `archive` list<BR>" % locals())
 
+            # CHECK THE OLD WORKFLOW LOCATION AND OTHER STUFF NEEDED (AS PI OR CLASSIFICATION) IN ORDER TO MOVE CORRECTLY
             if oldMwl == "Inbox":
-                # THE ONLY POSSIBLE MOVE IS ARCHIVE
-                print("Here")
+                # THE ONLY POSSIBLE MOVE IS ARCHIVE
                 if mwl != "archive":
-                    self.response = self.response + \
-                        " transientBucketId %(transientBucketId)s cannot be moved to the `%(mwl)s` marshallWorkflowLocation as it is in the `inbox` list<BR>" % locals(
-                        )
-                    self.log.debug('completed the ``_create_sqlquery`` method')
-                    raise ValueError("Invalid marshallWorkflowLocation")
-                    return None
-                else:
-                    # IF ARCHIVED, WE NEED TO SET TO archive THE marshallWorkflowLocation and store in unarchiveToMarshallWorkflowLocation the current marshallWorkflowLocation
-                    sqlQuery = """
-                        update pesstoObjects set marshallWorkflowLocation = "archive", unarchiveToMarshallWorkflowLocation = "%(oldMwl)s" where transientBucketId = %(transientBucketId)s
-                    """ % locals()
-                    writequery(self.log, sqlQuery, self.dbConn)
-                    self.response = self.response + \
-                        " transientBucketId %(transientBucketId)s moved to the `archive` marshallWorkflowLocation and will be unarchived to the `%(oldMwl)s` list<BR>" % locals(
-                        )
-                    return None
+                    return reject(" transientBucketId %(transientBucketId)s cannot be moved to the `%(mwl)s` marshallWorkflowLocation as it is in the `inbox` list<BR>" % locals())
+                return archive()
+
             if oldMwl == "pending observation":
-                # THE POSSIBLE MOVES ARE REVIEW FOR FOLLOWUP OR ARCHIVE. REVIEW FOR FOLLOWUP REQUIRES classifiedFlag = True
+                # THE POSSIBLE MOVES ARE REVIEW FOR FOLLOWUP OR ARCHIVE. REVIEW FOR FOLLOWUP REQUIRES classifiedFlag = True
                 if mwl == "review for followup":
-                    sqlQuery = u"""
-                        select classifiedFlag from pesstoObjects where transientBucketId = %(transientBucketId)s
-                    """ % locals()
-                    objectData = readquery(sqlQuery, self.dbConn, self.log)
-                    classifiedFlag = objectData[0]["classifiedFlag"]
-                    if not classifiedFlag:
-                        self.response = self.response + \
-                            " transientBucketId %(transientBucketId)s cannot be moved to the `%(mwl)s` marshallWorkflowLocation as it is not classified<BR>" % locals(
-                            )
-                        self.log.debug('completed the ``_create_sqlquery`` method')
-                        raise ValueError("Invalid marshallWorkflowLocation")
-                        return None
+                    if not state["classifiedFlag"]:
+                        return reject(" transientBucketId %(transientBucketId)s cannot be moved to the `%(mwl)s` marshallWorkflowLocation as it is not classified<BR>" % locals())
                 elif mwl == "archive":
-                    # IF ARCHIVED, WE NEED TO SET TO archive THE marshallWorkflowLocation and store in unarchiveToMarshallWorkflowLocation the current marshallWorkflowLocation
-                    sqlQuery = """
-                        update pesstoObjects set marshallWorkflowLocation = "archive", unarchiveToMarshallWorkflowLocation = "%(oldMwl)s" where transientBucketId = %(transientBucketId)s
-                    """ % locals()
-                    writequery(self.log, sqlQuery, self.dbConn)
-                    self.response = self.response + \
-                        " transientBucketId %(transientBucketId)s moved to the `archive` marshallWorkflowLocation and will be unarchived to the `%(oldMwl)s` list<BR>" % locals(
-                        )
-                    return None
+                    return archive()
                 else:
-                    self.response = self.response + \
-                        " transientBucketId %(transientBucketId)s cannot be moved to the `%(mwl)s` marshallWorkflowLocation as it is in the `pending observation` list<BR>" % locals(
-                        )           
-                    self.log.debug('completed the ``_create_sqlquery`` method')
-                    raise ValueError("Invalid marshallWorkflowLocation")
-                    return None 
+                    return reject(" transientBucketId %(transientBucketId)s cannot be moved to the `%(mwl)s` marshallWorkflowLocation as it is in the `pending observation` list<BR>" % locals())
+
             if oldMwl == "review for followup":
                 # THE ONLY POSSIBLE MOVE IS FOLLOWUP IF THE PI IS SET OR ARCHIVE
                 if mwl == "following":
-                    sqlQuery = u"""
-                        select pi_name, pi_email from pesstoObjects where transientBucketId = %(transientBucketId)s
-                    """ % locals()
-                    objectData = readquery(sqlQuery, self.dbConn, self.log)
-                    piName = objectData[0]["pi_name"]
-                    piEmail = objectData[0]["pi_email"]
-                    if not piName or not piEmail:
-                        self.response = self.response + \
-                            " transientBucketId %(transientBucketId)s cannot be moved to the `%(mwl)s` marshallWorkflowLocation as it does not have a PI assigned<BR>" % locals(
-                            )
-                        self.log.debug('completed the ``_create_sqlquery`` method')
-                        raise ValueError("Invalid marshallWorkflowLocation")
-                        return None
+                    if not state["pi_name"] or not state["pi_email"]:
+                        return reject(" transientBucketId %(transientBucketId)s cannot be moved to the `%(mwl)s` marshallWorkflowLocation as it does not have a PI assigned<BR>" % locals())
                 elif mwl == "archive":
-                    # IF ARCHIVED, WE NEED TO SET TO archive THE marshallWorkflowLocation and store in unarchiveToMarshallWorkflowLocation the current marshallWorkflowLocation
-                    sqlQuery = """
-                        update pesstoObjects set marshallWorkflowLocation = "archive", unarchiveToMarshallWorkflowLocation = "%(oldMwl)s" where transientBucketId = %(transientBucketId)s
-                    """ % locals()
-                    writequery(self.log, sqlQuery, self.dbConn)
-                    self.response = self.response + \
-                        " transientBucketId %(transientBucketId)s moved to the `archive` marshallWorkflowLocation and will be unarchived to the `%(oldMwl)s` list<BR>" % locals(
-                        )
-                    return None
+                    return archive()
                 else:
-                    self.response = self.response + \
-                        " transientBucketId %(transientBucketId)s cannot be moved to the `%(mwl)s` marshallWorkflowLocation as it is in the `review for followup` list<BR>" % locals(
-                        )           
-                    self.log.debug('completed the ``_create_sqlquery`` method')
-                    raise ValueError("Invalid marshallWorkflowLocation")
-                    return None 
-            
+                    return reject(" transientBucketId %(transientBucketId)s cannot be moved to the `%(mwl)s` marshallWorkflowLocation as it is in the `review for followup` list<BR>" % locals())
+
             if oldMwl == "following":
                 # THE ONLY POSSIBLE MOVE IS FOLLOWUP COMPLETE
-                if mwl != "followup complete" :
-                    self.response = self.response + \
-                        " transientBucketId %(transientBucketId)s cannot be moved to the `%(mwl)s` marshallWorkflowLocation as it is in the `following` list<BR>" % locals(
-                        )
-                    self.log.debug('completed the ``_create_sqlquery`` method')
-                    raise ValueError("Invalid marshallWorkflowLocation")
-                    return None
-            
+                if mwl != "followup complete":
+                    return reject(" transientBucketId %(transientBucketId)s cannot be moved to the `%(mwl)s` marshallWorkflowLocation as it is in the `following` list<BR>" % locals())
+
             if oldMwl == "followup complete":
                 # THE ONLY POSSIBLE MOVE IS ARCHIVE
-                if mwl != "archive" :
-                    self.response = self.response + \
-                        " transientBucketId %(transientBucketId)s cannot be moved to the `%(mwl)s` marshallWorkflowLocation as it is in the `followup complete` list<BR>" % locals(
-                        )
-                    self.log.debug('completed the ``_create_sqlquery`` method')
-                    raise ValueError("Invalid marshallWorkflowLocation")
-                    return None
-                else:
-                    # IF ARCHIVED, WE NEED TO SET TO archive THE marshallWorkflowLocation and store in unarchiveToMarshallWorkflowLocation the current marshallWorkflowLocation
-                    sqlQuery = """
-                        update pesstoObjects set marshallWorkflowLocation = "archive", unarchiveToMarshallWorkflowLocation = "%(oldMwl)s" where transientBucketId = %(transientBucketId)s
-                    """ % locals()
-                    writequery(self.log, sqlQuery, self.dbConn)
-                    self.response = self.response + \
-                        " transientBucketId %(transientBucketId)s moved to the `archive` marshallWorkflowLocation and will be unarchived to the `%(oldMwl)s` list<BR>" % locals(
-                        )
-                    return None
-
-
-            
-            sqlQuery = """
-                update pesstoObjects set marshallWorkflowLocation = "%(mwl)s"   where transientBucketId = %(transientBucketId)s
-            """ % locals()
-            writequery(self.log, sqlQuery, self.dbConn)
-            self.response = self.response + \
+                if mwl != "archive":
+                    return reject(" transientBucketId %(transientBucketId)s cannot be moved to the `%(mwl)s` marshallWorkflowLocation as it is in the `followup complete` list<BR>" % locals())
+                return archive()
+
+            sets["marshallWorkflowLocation"] = mwl
+            plan["message"] = plan["message"] + \
                 " transientBucketId %(transientBucketId)s moved to the `%(mwl)s` marshallWorkflowLocation<BR>" % locals(
                 )
-            logEntry = " transientBucketId %(transientBucketId)s moved to the `%(mwl)s` marshallWorkflowLocation<BR> by %(username)s" % locals(
-                )
-            now = datetime.now()
-            sqlQuery = u"""insert ignore into transients_history_logs (
-                transientBucketId,
-                dateCreated,
-                log
-            )
-            VALUES (
-                %s,
-                "%s",
-                "%s"
-            )""" % (transientBucketId, now, logEntry)
-            writequery(self.log, sqlQuery, self.dbConn)
-
+            plan["logEntries"].append(" transientBucketId %(transientBucketId)s moved to the `%(mwl)s` marshallWorkflowLocation<BR> by %(username)s" % locals(
+            ))
 
             # RESET THE LAST TIME REVIEWED IF REQUIRED
             ## TODO Recheck action on Archive here
-
             if mwl == "archive":
-                now = datetime.now()
-                now = now.strftime("%Y-%m-%d %H:%M:%S")
-                sqlQuery = """
-                    update pesstoObjects set lastReviewedMagDate = "%(now)s" where transientBucketId = %(transientBucketId)s
-                """ % locals()
-                writequery(self.log, sqlQuery, self.dbConn)
-
+                sets["lastReviewedMagDate"] = now
                 #DELETE ALL THE ASSOCIATED OB USING THE SCHEDULER API (TBD TODO)
 
-
         # CHANGE THE ALERT WORKFLOW LOCATION LIST IF REQUESTED (STILL TBD TODO)
         if "awl" in self.request:
             awl = self.request["awl"]
 
-            if awl == "queued for atel":
-                #Shoud we check for the marshall location ? If this is the case, then do it here
-                sqlQuery = """
-                    update pesstoObjects set alertWorkflowLocation = "%(awl)s", snoozed = 0 where transientBucketId = %(transientBucketId)s
-                """ % locals()
-                writequery(self.log, sqlQuery, self.dbConn)
-                self.response = self.response + \
+            #Shoud we check for the marshall location ? If this is the case, then do it here
+            if awl == "released" and oldAwl != "queued for atel":
+                return reject("", "Invalid marshallAlertLocation")
+            if awl == "not to be released" and oldAwl == "released":
+                return reject("", "Invalid marshallAlertLocation")
+            if awl in ("queued for atel", "released", "not to be released"):
+                sets["alertWorkflowLocation"] = awl
+                sets["snoozed"] = 0
+                plan["message"] = plan["message"] + \
                     " transientBucketId %(transientBucketId)s moved to the `%(awl)s` alertWorkflowLocation" % locals(
                     )
-                # TODO -Should be reported this in the log ?
-                logEntry = "moved from '%(oldAwl)s' to '%(awl)s' list by %(username)s" % locals(
-                )
-                return None
-            if awl == "released":
-                if oldAwl == "queued for atel":
-                    sqlQuery = """
-                    update pesstoObjects set alertWorkflowLocation = "%(awl)s", snoozed = 0 where transientBucketId = %(transientBucketId)s
-                    """ % locals()
-                    writequery(self.log, sqlQuery, self.dbConn)
-                    self.response = self.response + \
-                        " transientBucketId %(transientBucketId)s moved to the `%(awl)s` alertWorkflowLocation" % locals(
-                     )
-                    # TODO -Should be reported this in the log ?
-                    logEntry = "moved from '%(oldAwl)s' to '%(awl)s' list by %(username)s" % locals(
-                    )
-                    return None
-                else:
-                    raise ValueError("Invalid marshallAlertLocation")
-            if awl == "not to be released":
-                if oldAwl == "released":
-                    raise ValueError("Invalid marshallAlertLocation")
-                else:
-                    sqlQuery = """
-                    update pesstoObjects set alertWorkflowLocation = "%(awl)s", snoozed = 0 where transientBucketId = %(transientBucketId)s
-                    """ % locals()
-                    writequery(self.log, sqlQuery, self.dbConn)
-                    self.response = self.response + \
-                        " transientBucketId %(transientBucketId)s moved to the `%(awl)s` alertWorkflowLocation" % locals(
-                     )
-                    # TODO -Should be reported this in the log ?
-                    logEntry = "moved from '%(oldAwl)s' to '%(awl)s' list by %(username)s" % locals(
-                    )
-                    return None
+                # TODO -Should be reported this in the log ?
+                return plan
+
+        return plan
+
+    def _apply_list_moves(
+            self,
+            plans):
+        """*write the planned list moves*
 
+        Transients receiving identical column changes are updated by one ``UPDATE ... WHERE
+        transientBucketId IN (...)`` and all the history log entries are inserted by one
+        multi-row ``INSERT``.
+
+        **Key Arguments**
+
+        - ``plans`` -- the allowed plans returned by ``_plan_list_move``
+        """
+        self.log.debug('starting the ``_apply_list_moves`` method')
+
+        groups = {}
+        historyArgs = []
+        for plan in plans:
+            if plan["sets"]:
+                key = tuple(sorted(plan["sets"].items()))
+                groups.setdefault(key, []).append(int(plan["transientBucketId"]))
+            for logEntry in plan["logEntries"]:
+                historyArgs.extend([int(plan["transientBucketId"]), plan["dateCreated"], logEntry])
+
+        for sets, ids in groups.items():
+            setClauses = []
+            args = []
+            for column, value in sets:
+                if isinstance(value, column_value):
+                    setClauses.append("%s = %s" % (column, value.column))
+                else:
+                    setClauses.append("%s = %%s" % (column,))
+                    args.append(value)
+            setClause = (", ").join(setClauses)
+            args.append(ids)
+            sqlQuery = """
+                update pesstoObjects set %(setClause)s where transientBucketId in %%s
+            """ % locals()
+            self._write(sqlQuery, args)
 
+        if historyArgs:
+            values = (", ").join(["(%s, %s, %s)"] * (len(historyArgs) // 3))
+            sqlQuery = """insert ignore into transients_history_logs (
+                transientBucketId,
+                dateCreated,
+                log
+            )
+            VALUES %(values)s""" % locals()
+            self._write(sqlQuery, historyArgs)
 
-        self.log.debug('completed the ``_create_sqlquery`` method')
+        self.log.debug('completed the ``_apply_list_moves`` method')
         return None
 
     def _change_pi_for_object(
@@ -451,9 +510,9 @@ class models_transients_element_put(object):
         # ALLOW TO CHANGE THE PI ONLY IF THE OBJECT IS IN THE REVIEW FOR FOLLOWUP OR FOLLOWING LIST OR PI HAS ALREADY BEEN SET
 
         sqlQuery = """
-            select pi_name, pi_email, marshallWorkflowLocation from pesstoObjects where transientBucketId = %(transientBucketId)s
-        """ % locals()
-        objectData =  readquery(sqlQuery, self.dbConn, self.log)
+            select pi_name, pi_email, marshallWorkflowLocation from pesstoObjects where transientBucketId = %s
+        """
+        objectData = self._read(sqlQuery, (transientBucketId,))
         oldPiName = objectData[0]["pi_name"]
         oldPiEmail = objectData[0]["pi_email"]
         mwl = objectData[0]["marshallWorkflowLocation"]
@@ -468,9 +527,12 @@ class models_transients_element_put(object):
 
         # CHANGE THE PI IN THE DATABASE
         sqlQuery = """
-            update pesstoObjects set pi_name = "%(piName)s", pi_email = "%(piEmail)s" where transientBucketId = %(transientBucketId)s
-        """ % locals()
-        writequery(self.log, sqlQuery, self.dbConn)
+            update pesstoObjects set pi_name = %s, pi_email = %s where transientBucketId = %s
+        """
+        self._write(sqlQuery, (piName, piEmail, transientBucketId))
+
+        # THE PI NAME IS SEARCHABLE (THE INDEX IS MARKED STALE ONCE THE CHANGE IS COMMITTED)
+        self.searchIndexStale = True
 
         self.response = self.response + \
             "changed the PI of transient #%(transientBucketId)s to '%(piName)s' (%(piEmail)s)" % locals(
@@ -490,10 +552,10 @@ class models_transients_element_put(object):
         )
         VALUES (
             %s,
-            "%s",
-            "%s"
-        )""" % (transientBucketId, now, logEntry)
-        writequery(self.log, sqlQuery, self.dbConn)
+            %s,
+            %s
+        )"""
+        self._write(sqlQuery, (transientBucketId, now, logEntry))
 
         self.log.debug('completed the ``_change_pi_for_object`` method')
         return None
@@ -514,9 +576,9 @@ class models_transients_element_put(object):
 
         # GET OLD DATA
         sqlQuery = """
-            select observationPriority, marshallWorkflowLocation from pesstoObjects where transientBucketId = %(transientBucketId)s
-        """ % locals()
-        objectData = readquery(sqlQuery, self.dbConn, self.log)
+            select observationPriority, marshallWorkflowLocation from pesstoObjects where transientBucketId = %s
+        """
+        objectData = self._read(sqlQuery, (transientBucketId,))
 
         oldobservationPriority = objectData[0]["observationPriority"]
         mwl = objectData[0]["marshallWorkflowLocation"]
@@ -526,9 +588,9 @@ class models_transients_element_put(object):
 
         # CHANGE THE OBSERVATION PRIORITY IN THE DATABASE
         sqlQuery = """
-            update pesstoObjects set observationPriority = %(observationPriority)s where transientBucketId = %(transientBucketId)s
-        """ % locals()
-        writequery(self.log, sqlQuery, self.dbConn)
+            update pesstoObjects set observationPriority = %s where transientBucketId = %s
+        """
+        self._write(sqlQuery, (None if observationPriority == "null" else int(observationPriority), transientBucketId))
 
         # RESPONSE
         self.response = self.response + \
@@ -577,10 +639,10 @@ class models_transients_element_put(object):
         )
         VALUES (
             %s,
-            "%s",
-            "%s"
-        )""" % (transientBucketId, now, logEntry)
-        writequery(self.log, sqlQuery, self.dbConn)
+            %s,
+            %s
+        )"""
+        self._write(sqlQuery, (transientBucketId, now, logEntry))
 
         self.log.debug(
             'completed the ``_set_observational_priority_for_object`` method')
@@ -603,9 +665,9 @@ class models_transients_element_put(object):
         # CLASSIFICATION
         
         sqlQuery = """
-            select p.classifiedFlag, t.raDeg, t.decDeg, t.name from transientBucket t, pesstoObjects p where replacedByRowId = 0 and t.transientBucketId = %(transientBucketId)s and t.transientBucketId=p.transientBucketId limit 1
-        """ % locals()
-        rows = readquery(sqlQuery, self.dbConn, self.log)
+            select p.classifiedFlag, t.raDeg, t.decDeg, t.name from transientBucket t, pesstoObjects p where replacedByRowId = 0 and t.transientBucketId = %s and t.transientBucketId=p.transientBucketId limit 1
+        """
+        rows = self._read(sqlQuery, (transientBucketId,))
 
 
         # ADD VARIABLES TO a
@@ -629,22 +691,23 @@ class models_transients_element_put(object):
         if params["clsType"] == "supernova":
             params["clsType"] = "SN " + params["clsSnClassification"]
         if "clsRedshift" not in params or len(params["clsRedshift"]) == 0:
-            params["clsRedshift"] = "null"
+            params["clsRedshift"] = None
         if "clsClassificationWRTMax" not in params:
             params["clsClassificationWRTMax"] = "unknown"
         if "clsClassificationPhase" not in params or len(params["clsClassificationPhase"]) == 0:
-            params["clsClassificationPhase"] = "null"
+            params["clsClassificationPhase"] = None
 
         params["username"] = self.request["authenticated_userid"].replace(".", " ").title()
-        print(params)
+        self.log.debug("""classification params: `%(params)s`""" % locals())
         
         # INSERT THE NEW CLASSIFICATION ROW INTO THE TRANSIENTBUCKET
         sqlQuery = """
-                INSERT IGNORE INTO transientBucket (raDeg, decDeg, name, transientBucketId, observationDate, observationMjd, survey, spectralType, transientRedshift, classificationWRTMax, classificationPhase, reducer) VALUES(%(raDeg)s, %(decDeg)s, "%(name)s", %(transientBucketId)s, "%(clsObsdate)s", %(obsMjd)s, "%(clsSource)s", "%(clsType)s", %(clsRedshift)s, "%(clsClassificationWRTMax)s", %(clsClassificationPhase)s, "%(username)s") ON DUPLICATE KEY UPDATE raDeg = values(raDeg), decDeg = values(decDeg), name = values(name), transientBucketId = values(transientBucketId), observationDate = values(observationDate), observationMjd = values(observationMjd), survey = values(survey), spectralType = values(spectralType), transientRedshift = values(transientRedshift), classificationWRTMax = values(classificationWRTMax), classificationPhase = values(classificationPhase), reducer=values(reducer);
-            """ % params
+                INSERT IGNORE INTO transientBucket (raDeg, decDeg, name, transientBucketId, observationDate, observationMjd, survey, spectralType, transientRedshift, classificationWRTMax, classificationPhase, reducer) VALUES(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE raDeg = values(raDeg), decDeg = values(decDeg), name = values(name), transientBucketId = values(transientBucketId), observationDate = values(observationDate), observationMjd = values(observationMjd), survey = values(survey), spectralType = values(spectralType), transientRedshift = values(transientRedshift), classificationWRTMax = values(classificationWRTMax), classificationPhase = values(classificationPhase), reducer=values(reducer);
+            """
 
         #WRITE THE QUERY
-        writequery(self.log, sqlQuery, self.dbConn)
+        self._write(sqlQuery, [params[k] for k in ("raDeg", "decDeg", "name", "transientBucketId", "clsObsdate", "obsMjd", "clsSource",
+                                                   "clsType", "clsRedshift", "clsClassificationWRTMax", "clsClassificationPhase", "username")])
         
         # UPDATE THE OBJECT'S LOCATION IN THE VARIOUS MARSHALL WORKFLOWS
 
@@ -656,21 +719,17 @@ class models_transients_element_put(object):
 
         if params["classifiedFlag"] == 1:
             sqlQuery = """
-                update pesstoObjects set snoozed = 0, alertWorkflowLocation = "%(awl)s" where transientBucketId = %(transientBucketId)s
-            """ % locals()
+                update pesstoObjects set snoozed = 0, alertWorkflowLocation = %s where transientBucketId = %s
+            """
         else:
             sqlQuery = """
-                update pesstoObjects set classifiedFlag = 1, snoozed = 0, marshallWorkflowLocation = "review for followup", alertWorkflowLocation = "%(awl)s" where transientBucketId = %(transientBucketId)s
-            """ % locals()
-        writequery(self.log, sqlQuery, self.dbConn)
+                update pesstoObjects set classifiedFlag = 1, snoozed = 0, marshallWorkflowLocation = "review for followup", alertWorkflowLocation = %s where transientBucketId = %s
+            """
+        self._write(sqlQuery, (awl, transientBucketId))
 
         # RUN THE STORED PROCDURE TO UPDATE THE PESSTO OBJECTS TABLE
-        sqlQuery = f"call update_single_transientbucket_summary({self.transientBucketId})"
-        writequery(
-                log=self.log,
-                sqlQuery=sqlQuery,
-                dbConn=self.dbConn
-            )
+        sqlQuery = "call update_single_transientbucket_summary(%s)"
+        self._write(sqlQuery, (self.transientBucketId,))
         
 
         self.response = self.response + \
@@ -681,53 +740,33 @@ class models_transients_element_put(object):
             'completed the ``_add_transient_classification`` method')
         return None
 
-    def _refresh_sidebar_list_counts(self):
-        self.log.debug('starting the ``put`` method')
+    def _update_sidebar_list_counts(
+            self,
+            statesBefore,
+            statesAfter):
+        """*apply the +1/-1 changes of the sidebar list counts caused by a write*
 
-        # all marshall workflow list titles
-        marshallWorkflowLists = ["inbox", "archive", "following", "pending observation",
-                                 "followup complete", "review for followup", "pending classification"]
+        **Key Arguments**
 
-        # count objects in each list and update the `meta_workflow_lists_counts`
-        # table
-        for thisList in marshallWorkflowLists:
-            sqlListName = thisList.replace(" ", "_")
-            sqlQuery = """update meta_workflow_lists_counts set count = (select count(*) from pesstoObjects where marshallWorkflowLocation="%(thisList)s") where listname = "%(thisList)s" """ % locals(
-            )
-            writequery(self.log, sqlQuery, self.dbConn)
-
-
-        # all alert workflow list titles
-        alertWorkflowLists = [
-            "external alert released", "pessto classification released", "archived without alert", "queued for atel"]
-
-        # count objects in each list and update the `meta_workflow_lists_counts`
-        # table
-        for thisList in alertWorkflowLists:
-            sqlListName = thisList.replace(" ", "_")
-            sqlQuery = """update meta_workflow_lists_counts set count = (select count(*) from pesstoObjects where alertWorkflowLocation="%(thisList)s") where listname = "%(thisList)s" """ % locals(
-            )
-            writequery(self.log, sqlQuery, self.dbConn)
-
-        # count all objects
-        sqlQuery = """update meta_workflow_lists_counts set count = (select count(*) from pesstoObjects) where listname = "all" """ % locals(
-        )
-        writequery(self.log, sqlQuery, self.dbConn)
-
-
-        # count classified objects
-        sqlQuery = """update meta_workflow_lists_counts set count = (select count(*) from pesstoObjects where classifiedFlag = 1) where listname = "classified" """ % locals(
-        )
-        writequery(self.log, sqlQuery, self.dbConn)
+        - ``statesBefore`` -- the workflow states read before the write (see ``_read_workflow_states``)
+        - ``statesAfter`` -- the workflow states read after the write
 
+        **Return**
 
-        # count snoozed objects
-        sqlQuery = """update meta_workflow_lists_counts set count = (select count(*) from pesstoObjects where snoozed = 1) where listname = "snoozed" """ % locals(
-        )
-        writequery(self.log, sqlQuery, self.dbConn)
+        - ``changed`` -- True if any count changed (the caller invalidates ``listCountsCache`` once committed)
+        """
+        self.log.debug('starting the ``_update_sidebar_list_counts`` method')
 
+        deltas = {}
+        for transientBucketId in set(statesBefore) | set(statesAfter):
+            for listName, delta in list_count_deltas(statesBefore.get(transientBucketId), statesAfter.get(transientBucketId)).items():
+                deltas[listName] = deltas.get(listName, 0) + delta
+        deltas = dict((k, v) for k, v in deltas.items() if v)
+        if deltas:
+            apply_list_count_deltas(self.log, self.dbConn, deltas, unitOfWork=self.uow)
 
-        self.log.debug('completed the ``put`` method')
+        self.log.debug('completed the ``_update_sidebar_list_counts`` method')
+        return bool(deltas)
 
     def _add_new_transient(self):
 
@@ -774,18 +813,10 @@ class models_transients_element_put(object):
 
 
 
-        # add some default null values
-        if "objectRedshift" not in params or len(str(params["objectRedshift"])) == 0:
-            params["objectRedshift"] = "null"
-        if "objectUrl" not in params:
-            params["objectUrl"] = "null"
-        else:
-            params["objectUrl"] = """ '%(objectUrl)s' """ % params
-        if "objectImageStamp" not in params:
-            params["objectImageStamp"] = "null"
-        else:
-            params[
-                "objectImageStamp"] = """ '%(objectImageStamp)s' """ % params
+        # add some default null values (the sanitizer passes missing values on as "null")
+        for key in ("objectRedshift", "objectUrl", "objectImageStamp"):
+            if key not in params or params[key] is None or str(params[key]).strip() in ("", "null"):
+                params[key] = None
 
         # now add the new transient to the `fs_user_added` table
         sqlQuery = u"""
@@ -806,12 +837,10 @@ class models_transients_element_put(object):
                     ingested,
                     summaryRow,
                     dateCreated,
-                    dateLastModified) VALUES ('%(objectName)s',%(objectImageStamp)s,%(objectUrl)s,'%(objectSurvey)s','%(objectRa)s','%(objectDec)s','%(objectMagnitude)s','%(objectMagnitude)s','%(mjd)s','%(objectDate)s','SN',%(objectRedshift)s,'%(ticketAuthor)s',0,1,NOW(),NOW())""" % params
-        writequery(
-                log=self.log,
-                sqlQuery=sqlQuery,
-                dbConn=self.dbConn
-            )
+                    dateLastModified) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,'SN',%s,%s,0,1,NOW(),NOW())"""
+        statements.write(self.log, self.dbConn, sqlQuery, [params[k] for k in (
+            "objectName", "objectImageStamp", "objectUrl", "objectSurvey", "objectRa", "objectDec", "objectMagnitude",
+            "objectMagnitude", "mjd", "objectDate", "objectRedshift", "ticketAuthor")])
 
         self.dbConn.ping(reconnect=True)
 
@@ -834,6 +863,10 @@ class models_transients_element_put(object):
             dbConn=dbConn
         ).cache(limit=3000)
 
+        # THE NEW TRANSIENT'S NAMES ARE SEARCHABLE
+        if self.searchIndex:
+            self.searchIndex.mark_stale()
+
 
         self.log.debug('completed the ``_add_new_transient`` method')
         self.response = self.response + 'completed the ``_add_new_transient`` method'
@@ -21,7 +21,7 @@ import urllib.parse
 import urllib.error
 import re
 from models.base_model import base_model
-from fundamentals.mysql  import readquery  
+from packages import statements
 
 
 class models_transients_akas_get(base_model):
@@ -79,28 +79,27 @@ class models_transients_akas_get(base_model):
         where = self.sql["where"]
         limit = self.sql["limit"]
 
+        # THE IDS ARE BOUND BY THE DRIVER (THE LIST FILLS THE IN %s)
         if elementId:
-            sqlWhere = where + " and transientBucketId in (%(elementId)s)" % locals(
-            )
+            sqlWhere = where + " and transientBucketId in %s"
+            args = ([int(e) for e in str(elementId).split(",") if e.strip()],)
         else:
             sqlWhere = ""
+            args = ()
 
         sqlQuery = """
             select transientBucketId, GROUP_CONCAT(name) as akas from marshall_transient_akas %(sqlWhere)s group by transientBucketId %(limit)s
         """ % locals()
-        tmp = readquery( sqlQuery, self.dbConn,  self.log)
+        tmp = statements.read(self.log, self.dbConn, sqlQuery, args)
 
-        theseIds = []
-        theseIds[:] = [str(t["transientBucketId"]) for t in tmp]
-        theseIds = (",").join(theseIds)
-        sqlWhere = where + \
-            " and transientBucketId in (-99, %(theseIds)s)" % locals()
+        theseIds = [t["transientBucketId"] for t in tmp]
+        sqlWhere = where + " and transientBucketId in %s"
 
         if len(theseIds):
             sqlQuery = """
                 select transientBucketId, name, url, master from marshall_transient_akas %(sqlWhere)s and hidden = 0 order by transientBucketId, master desc
             """ % locals()
-            rows = readquery(sqlQuery, self.dbConn, self.log)
+            rows = statements.read_chunked(self.log, self.dbConn, sqlQuery, theseIds)
         else:
             rows = []
 
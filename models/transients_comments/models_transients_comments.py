@@ -13,7 +13,8 @@ from builtins import object
 import sys
 import os
 from fundamentals import times
-from fundamentals.mysql import readquery, writequery
+from packages.response_cache import lists_for_workflow_state
+from packages.unit_of_work import unit_of_work
 
 
 class models_transients_comments_put(object):
@@ -25,6 +26,7 @@ class models_transients_comments_put(object):
     - ``log`` -- logger
     - ``request`` -- the pyramid request
     - ``elementId`` -- the specific element id requests (or False)
+    - ``cache`` -- the list-view ``response_cache`` to invalidate on writes (or None)
 
     """
 
@@ -32,12 +34,15 @@ class models_transients_comments_put(object):
         self,
         log,
         request,
-        db
+        db,
+        cache=None
     ):
         self.log = log
         self.request = request
         self.elementId = request["elementId"]
         self.dbConn = db
+        self.cache = cache
+        self.timings = []
         # xt-self-arg-tmpx
 
         log.debug(
@@ -66,15 +71,34 @@ class models_transients_comments_put(object):
         author = self.request["authenticated_userid"]
         comment = self.request["comment"]
 
-        comment = comment.replace(
-            "'", "\\'").replace('"', '\\"')
-
-        # add the comment to the database
+        # add the comment to the database (the values are bound by the driver)
         sqlQuery = """
-            INSERT INTO pesstoObjectsComments (pesstoObjectsId,commentAuthor,comment,dateCreated,dateLastModified) VALUES(%(transientBucketId)s,"%(author)s","%(comment)s","%(now)s","%(now)s");
-        """ % locals()
+            INSERT INTO pesstoObjectsComments (pesstoObjectsId,commentAuthor,comment,dateCreated,dateLastModified) VALUES(%s,%s,%s,%s,%s);
+        """
         self.log.debug("""add comment sqlquery: `%(sqlQuery)s`""" % locals())
-        writequery(self.log, sqlQuery, self.dbConn)
+
+        # THE COMMENT AND THE READ OF THE LISTS IT SHOWS IN SHARE ONE TRANSACTION
+        uow = unit_of_work(log=self.log, dbConn=self.dbConn)
+
+        def work():
+            uow.execute(sqlQuery, (transientBucketId, author, comment, now, now))
+            if not self.cache:
+                return None
+            stateQuery = """
+                select marshallWorkflowLocation, alertWorkflowLocation, snoozed, classifiedFlag from pesstoObjects where transientBucketId = %s
+            """
+            rows = uow.query(stateQuery, (transientBucketId,))
+            return rows[0] if rows else None
+
+        try:
+            state = uow.run(work)
+        finally:
+            self.timings = uow.timings
+            self.log.debug("add comment timings: %s" % (uow.report(),))
+
+        # THE COMMENT SHOWS ON THE TICKET IN EVERY LIST THE TRANSIENT BELONGS TO
+        if self.cache:
+            self.cache.bump(lists_for_workflow_state(state))
 
         responseContent = "%(author)s added the comment:<blockquote>%(comment)s</blockquote>to transient #%(transientBucketId)s in the marshall<BR><BR>" % locals(
         )
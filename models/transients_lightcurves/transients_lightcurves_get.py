@@ -15,7 +15,14 @@ import os
 
 import collections
 from models import base_model
-from fundamentals.mysql import readquery
+from packages.caching import ttl_cache
+from packages import statements
+from packages.lightcurves import columnar_lightcurves
+
+# LIGHTCURVE ROWS PER transientBucketId, VALIDATED AGAINST THE transientBucket ROW COUNT AND
+# LATEST primaryKeyId ON EVERY REQUEST SO NEWLY INGESTED PHOTOMETRY IS NEVER MISSED
+lightcurveCache = ttl_cache(ttlSeconds=3600, maxEntries=5000)
+
 
 class models_transients_lightcurves_get(base_model):
     """
@@ -24,8 +31,9 @@ class models_transients_lightcurves_get(base_model):
     **Key Arguments**
 
     - ``log`` -- logger
-    - ``request`` -- the pyramid request
-    - ``elementId`` -- the specific element id requests (or False)
+    - ``request`` -- the request; ``sinceMjd`` only returns the newer points and ``lcFormat`` selects the rows or columnar output
+    - ``elementId`` -- the transientBucketId, or a list of transientBucketIds
+    - ``db`` -- the database connection
     
     """
 
@@ -48,30 +56,106 @@ class models_transients_lightcurves_get(base_model):
 
         **Return**
 
-        - ``responseContent`` -- the reponse to send to the browser
+        - ``responseContent`` -- one ``{"transientBucketId", "latestMjd", "lightcurve"}`` dictionary per requested transient (``lightcurve`` holds the columnar series if ``lcFormat`` is ``columnar``/``columnar_b64``)
         
         """
         self.log.debug('starting the ``get`` method')
 
-        transientBucketId = self.elementId
-        # GRAB THE LIGHTCURVE DATA FOR THE OBJECT
-        sqlQuery = """
-            select observationMJD, observationDate, magnitude, magnitudeError, limitingMag, filter, survey from transientBucket where replacedByRowId = 0 and transientBucketId = %(transientBucketId)s and observationDate is not null and observationDate != 0000-00-00 and magnitude is not null and magnitude < 50 and survey != "bright sn list" order by observationDate asc;
-        """ % locals()
-        lightCurve = readquery(sqlQuery, self.dbConn, self.log)
-
-        for row in lightCurveTmp:
-            odict = collections.OrderedDict(sorted({}.items()))
-            for key in list(row.keys()):
-                if row[key] == None:
-                    value = "-"
-                else:
-                    value = row[key]
-                odict[key] = value
-            lightCurve.append(odict)
+        transientBucketIds = [int(t) for t in str(self.elementId).split(",") if t.strip()]
+        lightCurves = self._get_lightcurve_rows(transientBucketIds)
+
+        sinceMjd = self.qs.get("sinceMjd")
+        lcFormat = self.qs.get("lcFormat", "rows")
+
+        responseContent = []
+        for transientBucketId in transientBucketIds:
+            rows = lightCurves.get(transientBucketId, [])
+            mjds = [r["observationMJD"] for r in rows if r["observationMJD"] is not None]
+            if sinceMjd is not None:
+                rows = [r for r in rows if r["observationMJD"] is not None and r["observationMJD"] > sinceMjd]
+
+            if lcFormat in ("columnar", "columnar_b64"):
+                columnar = columnar_lightcurves(rows, binary=(lcFormat == "columnar_b64"))
+                lightCurve = columnar[0]["series"] if columnar else []
+            else:
+                lightCurve = []
+                for row in rows:
+                    odict = collections.OrderedDict(sorted({}.items()))
+                    for key in list(row.keys()):
+                        if key == "transientBucketId":
+                            continue
+                        if row[key] == None:
+                            value = "-"
+                        else:
+                            value = row[key]
+                        odict[key] = value
+                    lightCurve.append(odict)
+
+            responseContent.append({
+                "transientBucketId": transientBucketId,
+                "latestMjd": max(mjds) if mjds else None,
+                "lightcurve": lightCurve
+            })
 
         self.log.debug('completed the ``get`` method')
-        return lightCurve
+        return responseContent
+
+    def _get_lightcurve_rows(
+            self,
+            transientBucketIds):
+        """*return the lightcurve rows of the transients, from the cache when still current*
+
+        A single grouped query reads the row count and latest primaryKeyId of each transient;
+        only the transients whose version changed (or are not cached) have their photometry
+        re-read, all in one query.
+
+        **Key Arguments**
+
+        - ``transientBucketIds`` -- list of transientBucketIds
+
+        **Return**
+
+        - ``lightCurves`` -- dictionary of transientBucketId to its rows (ordered by observation date)
+        """
+        self.log.debug('starting the ``_get_lightcurve_rows`` method')
+
+        if not transientBucketIds:
+            return {}
+
+        sqlQuery = """
+            select transientBucketId, max(primaryKeyId) as latestRowId, count(*) as numberOfRows from transientBucket where transientBucketId in %s group by transientBucketId
+        """
+        versions = {}
+        for row in statements.read_chunked(self.log, self.dbConn, sqlQuery, transientBucketIds):
+            versions[row["transientBucketId"]] = (row["latestRowId"], row["numberOfRows"])
+
+        lightCurves = {}
+        staleIds = []
+        for transientBucketId in transientBucketIds:
+            if transientBucketId not in versions:
+                lightCurves[transientBucketId] = []
+                continue
+            cached = lightcurveCache.get(transientBucketId)
+            if cached and cached[0] == versions[transientBucketId]:
+                lightCurves[transientBucketId] = cached[1]
+            else:
+                staleIds.append(transientBucketId)
+
+        if staleIds:
+            # GRAB THE LIGHTCURVE DATA FOR THE OBJECTS
+            sqlQuery = """
+                select transientBucketId, observationMJD, observationDate, magnitude, magnitudeError, limitingMag, filter, survey from transientBucket where replacedByRowId = 0 and transientBucketId in %s and observationDate is not null and observationDate != 0000-00-00 and magnitude is not null and magnitude < 50 and survey != "bright sn list" order by observationDate asc
+            """
+            fresh = collections.defaultdict(list)
+            for row in statements.read_chunked(self.log, self.dbConn, sqlQuery, staleIds):
+                fresh[row["transientBucketId"]].append(row)
+            for transientBucketId in staleIds:
+                lightCurves[transientBucketId] = fresh.get(transientBucketId, [])
+                lightcurveCache.set(
+                    transientBucketId, (versions[transientBucketId], lightCurves[transientBucketId]))
+
+        self.log.debug('completed the ``_get_lightcurve_rows`` method')
+        return lightCurves
 
     def _set_default_parameters(
             self):
@@ -94,9 +178,9 @@ class models_transients_lightcurves_get(base_model):
         transientBucketId = self.elementId
 
         sqlQuery = u"""
-            select * from transientBucketSummaries where transientBucketId = %(transientBucketId)s
-        """ % locals()
-        extraMetadata = readquery(sqlQuery, self.dbConn, self.log)
+            select * from transientBucketSummaries where transientBucketId = %s
+        """
+        extraMetadata = statements.read(self.log, self.dbConn, sqlQuery, (transientBucketId,))
 
         self.log.debug('completed the ``get_metadata`` method')
         return extraMetadata
@@ -1,6 +1,3 @@
 from . import login
 from . import sanitizers
-
-
-
-
+from . import db_pool
@@ -0,0 +1,227 @@
+# ---------------------------------------------------------------------------
+#  Byte-budgeted cache of the asset files (and their thumbnails)
+# ---------------------------------------------------------------------------
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+
+class asset_cache(object):
+    """
+    *LRU cache of asset file contents bounded by their total size in bytes*
+
+    Entries are keyed on the file path, mtime and size, so a rewritten file is never
+    served stale. The raw bytes are kept (not their base64 encoding, which is a third
+    larger) and the least recently used entries are evicted once ``maxBytes`` is exceeded.
+
+    With ``diskCacheDir`` set, misses are also written to a local cache directory shared
+    by all the workers of the host, so only one of them pays for the read from the
+    remote mount (or for building a thumbnail).
+
+    **Key Arguments**
+
+    - ``log`` -- logger
+    - ``maxBytes`` -- memory budget of the cache
+    - ``diskCacheDir`` -- shared local directory for the second cache tier (None to disable)
+    - ``diskMaxBytes`` -- size the disk tier is pruned back to (oldest files first)
+    - ``thumbnailSize`` -- bounding box (width, height) of the thumbnails
+    """
+
+    def __init__(
+        self,
+        log,
+        maxBytes=128 * 1024 * 1024,
+        diskCacheDir=None,
+        diskMaxBytes=2 * 1024 * 1024 * 1024,
+        thumbnailSize=(320, 320)
+    ):
+        self.log = log
+        self.maxBytes = maxBytes
+        self.diskCacheDir = diskCacheDir
+        self.diskMaxBytes = diskMaxBytes
+        self._diskWrites = 0
+        self.thumbnailSize = tuple(thumbnailSize)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {
+            "hits": 0,
+            "misses": 0,
+            "diskHits": 0,
+            "evictions": 0,
+            "bytes": 0
+        }
+
+        if diskCacheDir:
+            os.makedirs(diskCacheDir, exist_ok=True)
+
+        return None
+
+    def get_bytes(
+            self,
+            filePath,
+            st):
+        """*return the contents of ``filePath``*
+
+        **Key Arguments**
+
+        - ``filePath`` -- path of the asset
+        - ``st`` -- its ``os.stat`` result (the cache key includes mtime and size)
+        """
+        key = (filePath, st.st_mtime_ns, st.st_size, None)
+        return self._get(key, lambda: self._read_file(filePath))
+
+    def get_thumbnail(
+            self,
+            filePath,
+            st):
+        """*return a downscaled copy of the image at ``filePath`` (same format)*
+
+        Falls back to the original contents if the file cannot be decoded as an image.
+        """
+        key = (filePath, st.st_mtime_ns, st.st_size, self.thumbnailSize)
+        return self._get(key, lambda: self._make_thumbnail(self.get_bytes(filePath, st)))
+
+    def metrics(
+            self):
+        """*hit/miss/eviction counters and memory use*
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["entries"] = len(self._entries)
+        metrics["maxBytes"] = self.maxBytes
+        return metrics
+
+    def _get(
+            self,
+            key,
+            load):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self._metrics["hits"] += 1
+                return data
+            self._metrics["misses"] += 1
+
+        data = self._read_disk_tier(key)
+        if data is None:
+            data = load()
+            self._write_disk_tier(key, data)
+        else:
+            with self._lock:
+                self._metrics["diskHits"] += 1
+
+        self._store(key, data)
+        return data
+
+    def _store(
+            self,
+            key,
+            data):
+        # A SINGLE HUGE FILE MUST NOT FLUSH THE WHOLE CACHE
+        if len(data) > self.maxBytes // 4:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._metrics["bytes"] -= len(previous)
+            self._entries[key] = data
+            self._metrics["bytes"] += len(data)
+            while self._metrics["bytes"] > self.maxBytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._metrics["bytes"] -= len(evicted)
+                self._metrics["evictions"] += 1
+
+    def _read_file(
+            self,
+            filePath):
+        with open(filePath, "rb") as f:
+            return f.read()
+
+    def _make_thumbnail(
+            self,
+            data):
+        try:
+            image = Image.open(io.BytesIO(data))
+            imageFormat = image.format
+            if image.width <= self.thumbnailSize[0] and image.height <= self.thumbnailSize[1]:
+                return data
+            image.thumbnail(self.thumbnailSize)
+            if imageFormat == "JPEG" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            output = io.BytesIO()
+            image.save(output, format=imageFormat, optimize=True)
+            return output.getvalue()
+        except Exception as e:
+            self.log.warning("could not build a thumbnail: %s" % (e,))
+            return data
+
+    def _disk_path(
+            self,
+            key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.diskCacheDir, digest[:2], digest)
+
+    def _read_disk_tier(
+            self,
+            key):
+        if not self.diskCacheDir:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk_tier(
+            self,
+            key,
+            data):
+        if not self.diskCacheDir:
+            return
+        diskPath = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(diskPath), exist_ok=True)
+            # WRITE-THEN-RENAME SO THE OTHER WORKERS NEVER READ A PARTIAL FILE
+            fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(diskPath))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmpPath, diskPath)
+        except OSError as e:
+            self.log.warning("could not write the asset disk cache: %s" % (e,))
+            return
+
+        with self._lock:
+            self._diskWrites += 1
+            prune = self._diskWrites % 256 == 0
+        if prune:
+            self._prune_disk_tier()
+
+    def _prune_disk_tier(
+            self):
+        files = []
+        total = 0
+        for dirPath, _, fileNames in os.walk(self.diskCacheDir):
+            for fileName in fileNames:
+                path = os.path.join(dirPath, fileName)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        files.sort()
+        for _, size, path in files:
+            if total <= self.diskMaxBytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
@@ -0,0 +1,121 @@
+# ---------------------------------------------------------------------------
+#  Presence index of the asset files on the remote mount
+# ---------------------------------------------------------------------------
+
+import os
+
+from packages.caching import ttl_cache
+
+
+class asset_presence_index(object):
+    """
+    *Cached directory listings of the per-transient asset folders*
+
+    Each ``<basePath>/<transientBucketId>`` folder is listed with a single ``os.scandir``
+    and only the known asset files are stat-ed, so the files that do not exist cost no
+    remote syscall at all. Listings are kept for ``ttlSeconds``; folders that do not
+    exist are remembered for ``missingTtlSeconds`` (negative caching).
+
+    **Key Arguments**
+
+    - ``log`` -- logger
+    - ``basePath`` -- root of the asset folders
+    - ``filenames`` -- the asset file names worth indexing
+    - ``ttlSeconds`` -- lifetime of a folder listing
+    - ``missingTtlSeconds`` -- lifetime of a "folder does not exist" result
+    - ``maxEntries`` -- folders kept in each cache
+    """
+
+    def __init__(
+        self,
+        log,
+        basePath,
+        filenames,
+        ttlSeconds=60,
+        missingTtlSeconds=300,
+        maxEntries=20000
+    ):
+        self.log = log
+        self.basePath = basePath
+        self.filenames = frozenset(filenames)
+        self._listings = ttl_cache(ttlSeconds=ttlSeconds, maxEntries=maxEntries)
+        self._missing = ttl_cache(ttlSeconds=missingTtlSeconds, maxEntries=maxEntries)
+        self.scans = 0
+
+        return None
+
+    def listing(
+            self,
+            transientBucketId):
+        """*return the asset files present for a transient*
+
+        **Key Arguments**
+
+        - ``transientBucketId`` -- the transient (must be an integer)
+
+        **Return**
+
+        - ``listing`` -- dictionary of file name to ``os.stat_result``, or None if the transient has no asset folder
+        """
+        try:
+            transientBucketId = int(transientBucketId)
+        except (TypeError, ValueError):
+            return None
+
+        if self._missing.get(transientBucketId):
+            return None
+        listing = self._listings.get(transientBucketId)
+        if listing is not None:
+            return listing
+
+        listing = self._scan(transientBucketId)
+        if listing is None:
+            self._missing.set(transientBucketId, True)
+        else:
+            self._listings.set(transientBucketId, listing)
+        return listing
+
+    def invalidate(
+            self,
+            transientBucketId=None):
+        """*forget the listing of one transient, or of every transient*
+        """
+        if transientBucketId is None:
+            self._listings.invalidate()
+            self._missing.invalidate()
+        else:
+            self._listings.invalidate(int(transientBucketId))
+            self._missing.invalidate(int(transientBucketId))
+        return None
+
+    def metrics(
+            self):
+        """*directory scans and cache counters*
+        """
+        listings = self._listings.metrics()
+        missing = self._missing.metrics()
+        return {
+            "scans": self.scans,
+            "listings": listings["entries"],
+            "missingFolders": missing["entries"],
+            "hits": listings["hits"] + missing["hits"]
+        }
+
+    def _scan(
+            self,
+            transientBucketId):
+        self.scans += 1
+        dirPath = os.path.join(self.basePath, str(transientBucketId))
+        listing = {}
+        try:
+            with os.scandir(dirPath) as entries:
+                for entry in entries:
+                    if entry.name not in self.filenames:
+                        continue
+                    try:
+                        listing[entry.name] = entry.stat()
+                    except OSError:
+                        pass
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return listing
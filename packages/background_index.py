@@ -0,0 +1,134 @@
+# ---------------------------------------------------------------------------
+#  Base of the in-memory indexes rebuilt in a background thread
+# ---------------------------------------------------------------------------
+
+import threading
+import time
+
+import redis
+
+
+class background_index(object):
+    """
+    *An in-memory index rebuilt in a background thread, kept in step across workers through Redis*
+
+    The index is rebuilt whenever the shared Redis generation is bumped (``mark_stale``
+    in any worker) or once it is older than ``maxAgeSeconds``. Subclasses set ``indexName``
+    and implement ``rebuild``, which reads the rows, builds the index state and hands it
+    to ``_swap``; readers take ``self._state`` once per lookup, so a rebuild never blocks them.
+
+    **Key Arguments**
+
+    - ``log`` -- logger
+    - ``pool`` -- the ``connection_pool`` the rebuilds borrow a connection from
+    - ``redisClient`` -- a ``redis.StrictRedis`` client holding the shared generation
+    - ``checkIntervalSeconds`` -- how often the generation is checked
+    - ``maxAgeSeconds`` -- the index is rebuilt at least this often
+    - ``generationKey`` -- the Redis key of the generation counter
+    """
+
+    # USED IN THE THREAD NAME AND THE LOG MESSAGES
+    indexName = "index"
+
+    def __init__(
+        self,
+        log,
+        pool,
+        redisClient,
+        checkIntervalSeconds=10,
+        maxAgeSeconds=900,
+        generationKey=None
+    ):
+        self.log = log
+        self.pool = pool
+        self.redis = redisClient
+        self.checkIntervalSeconds = checkIntervalSeconds
+        self.maxAgeSeconds = maxAgeSeconds
+        self.generationKey = generationKey
+
+        # THE INDEX STATE, SWAPPED IN ONE ASSIGNMENT ON REBUILD
+        self._state = None
+        self._lock = threading.Lock()
+        self._stale = threading.Event()
+        self._stale.set()
+        self.generation = None
+        self.builtAt = None
+        self.buildSeconds = None
+        self.rebuilds = 0
+
+        self._thread = threading.Thread(
+            target=self._refresh_forever, name=self.indexName.replace(" ", "-") + "-refresh", daemon=True)
+        self._thread.start()
+
+        return None
+
+    @property
+    def ready(self):
+        """*True once the index has been built at least once*"""
+        return self._state is not None
+
+    @property
+    def ageSeconds(self):
+        """*seconds since the last rebuild (None before the first one)*"""
+        return time.monotonic() - self.builtAt if self.builtAt else None
+
+    def mark_stale(
+            self):
+        """*ask every worker to rebuild its index (e.g. after a transient was added)*
+        """
+        self._stale.set()
+        try:
+            self.redis.incr(self.generationKey)
+        except redis.RedisError as e:
+            self.log.warning("could not bump the %s generation: %s" % (self.indexName, e))
+        return None
+
+    def rebuild(
+            self):
+        """*read the indexed rows from the database and swap in a fresh index (see ``_swap``)*
+        """
+        raise NotImplementedError
+
+    def _swap(
+            self,
+            state,
+            generation,
+            started):
+        # INSTALL A FRESHLY BUILT STATE, READ AT `generation` BY A REBUILD STARTED AT `started`
+        with self._lock:
+            self._state = state
+            self.generation = generation
+            self.builtAt = time.monotonic()
+            self.buildSeconds = self.builtAt - started
+            self.rebuilds += 1
+        return None
+
+    def _read_generation(
+            self):
+        try:
+            return self.redis.get(self.generationKey)
+        except redis.RedisError as e:
+            self.log.warning("could not read the %s generation: %s" % (self.indexName, e))
+            return self.generation
+
+    def _needs_rebuild(
+            self):
+        if self._stale.is_set() or self.builtAt is None:
+            return True
+        if time.monotonic() - self.builtAt > self.maxAgeSeconds:
+            return True
+        return self._read_generation() != self.generation
+
+    def _refresh_forever(
+            self):
+        while True:
+            try:
+                if self._needs_rebuild():
+                    self._stale.clear()
+                    self.rebuild()
+            except Exception as e:
+                self.log.warning("%s rebuild failed: %s" % (self.indexName, e))
+                time.sleep(self.checkIntervalSeconds)
+                self._stale.set()
+                continue
+            self._stale.wait(self.checkIntervalSeconds)
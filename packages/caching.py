@@ -0,0 +1,176 @@
+# ---------------------------------------------------------------------------
+#  In-process caching helpers
+# ---------------------------------------------------------------------------
+
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+_MISSING = object()
+
+
+class ttl_cache(object):
+    """
+    *A small thread-safe LRU cache whose entries expire after ``ttlSeconds``*
+
+    The cache lives in the memory of a single worker process, so it suits data
+    that is cheap to hold and identical for every request (schema metadata,
+    list counts, ...).
+
+    **Key Arguments**
+
+    - ``ttlSeconds`` -- lifetime of an entry; ``None`` keeps entries until evicted or invalidated
+    - ``maxEntries`` -- least recently used entries are evicted beyond this size
+
+    ``share_generation`` ties the cache to a Redis generation counter, so that
+    ``bump_generation`` in any worker invalidates it in all of them.
+    """
+
+    def __init__(
+        self,
+        ttlSeconds=60,
+        maxEntries=1024
+    ):
+        self.ttlSeconds = ttlSeconds
+        self.maxEntries = maxEntries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.redis = None
+        self.generationKey = None
+        self.checkIntervalSeconds = None
+        self.generation = None
+        self._checkedAt = None
+
+        return None
+
+    def share_generation(
+            self,
+            redisClient,
+            generationKey,
+            checkIntervalSeconds=10):
+        """*drop every entry whenever the shared Redis ``generationKey`` changes*
+
+        The generation is read at most once every ``checkIntervalSeconds``, so a bump
+        reaches the other workers within that interval.
+
+        **Key Arguments**
+
+        - ``redisClient`` -- a ``redis.StrictRedis`` client holding the shared generation
+        - ``generationKey`` -- the Redis key of the generation counter
+        - ``checkIntervalSeconds`` -- how often the generation is checked
+        """
+        self.redis = redisClient
+        self.generationKey = generationKey
+        self.checkIntervalSeconds = checkIntervalSeconds
+        self.generation = self._read_generation()
+        self._checkedAt = time.monotonic()
+        return None
+
+    def bump_generation(
+            self):
+        """*invalidate the cache in this worker and, through the shared generation, in every other one*
+        """
+        self.invalidate()
+        if self.redis is None:
+            return None
+        try:
+            self.generation = self.redis.incr(self.generationKey)
+        except redis.RedisError:
+            pass
+        return None
+
+    def get(
+            self,
+            key,
+            default=None):
+        """*return the cached value for ``key`` or ``default`` if missing/expired*
+        """
+        self._check_generation()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+        return default
+
+    def set(
+            self,
+            key,
+            value):
+        """*store ``value`` under ``key``*
+        """
+        expires = None
+        if self.ttlSeconds is not None:
+            expires = time.monotonic() + self.ttlSeconds
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+        return None
+
+    def get_or_set(
+            self,
+            key,
+            factory):
+        """*return the cached value for ``key``, computing it with ``factory()`` on a miss*
+
+        The factory runs outside the lock, so two threads missing at the same
+        time may both compute the value; the last one wins.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def invalidate(
+            self,
+            key=_MISSING):
+        """*drop ``key`` from the cache, or every entry if no key is given*
+        """
+        with self._lock:
+            if key is _MISSING:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+        return None
+
+    def _read_generation(
+            self):
+        try:
+            generation = self.redis.get(self.generationKey)
+        except redis.RedisError:
+            return self.generation
+        return int(generation) if generation is not None else None
+
+    def _check_generation(
+            self):
+        if self.redis is None or time.monotonic() - self._checkedAt < self.checkIntervalSeconds:
+            return None
+        self._checkedAt = time.monotonic()
+        generation = self._read_generation()
+        if generation != self.generation:
+            self.generation = generation
+            self.invalidate()
+        return None
+
+    def metrics(
+            self):
+        """*hit/miss counters and current size*
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries)
+            }
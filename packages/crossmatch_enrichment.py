@@ -0,0 +1,115 @@
+# ---------------------------------------------------------------------------
+#  Crossmatch enrichment: catalogue links, best magnitudes and SDSS names
+# ---------------------------------------------------------------------------
+
+import urllib.parse
+
+import numpy as np
+
+# THE CATALOGUE MAGNITUDE COLUMNS, IN ORDER OF PREFERENCE FOR THE BEST MAGNITUDE
+BEST_MAG_FILTERS = ("R", "V", "B", "I", "J", "G", "H", "K", "U",
+                    "_r", "_g", "_i", "_z", "_y", "_u", "unkMag")
+
+# THE COLUMNS ADDED (OR, FOR SDSS, REWRITTEN) BY THE ENRICHMENT
+ENRICHED_COLUMNS = ("catalogue_object_id", "object_link", "best_mag", "best_mag_error", "best_mag_filter")
+
+# CATALOGUES WITHOUT A SIMBAD LINK
+NO_SIMBAD_LINK = ("ps1", "ritter", "down", "guide_star", "kepler")
+
+# THE CATALOGUE PAGE URL TEMPLATES (``%(objectName)s`` IS THE URL-QUOTED CATALOGUE OBJECT ID)
+NED_LINK = "https://ned.ipac.caltech.edu/cgi-bin/objsearch?objname=%(objectName)s&extend=no&hconst=73&omegam=0.27&omegav=0.73&corr_z=1&out_csys=Equatorial&out_equinox=J2000.0&obj_sort=RA+or+Longitude&of=pre_text&zv_breaker=30000.0&list_limit=5&img_stamp=YES"
+SDSS_LINK = "http://skyserver.sdss.org/dr12/en/tools/explore/Summary.aspx?id=%(objectName)s"
+MILLIQUAS_LINK = "https://heasarc.gsfc.nasa.gov/db-perl/W3Browse/w3query.pl?bparam_name=%(objectName)s&navtrail=%%3Ca+class%%3D%%27navpast%%27+href%%3D%%27https%%3A%%2F%%2Fheasarc.gsfc.nasa.gov%%2FW3Browse%%2Fall%%2Fmilliquas.html%%27%%3E+Choose+Tables%%3C%%2Fa%%3E+%%3E+%%3Ca+class%%3D%%27navpast%%27+href%%3D%%27%%2Fcgi-bin%%2FW3Browse%%2Fw3table.pl%%3FREAL_REMOTE_HOST%%3D143.117.37.81%%26tablehead%%3Dname%%253Dmilliquas%%26Action%%3DMore%%2BOptions%%26REAL_REMOTE_HOST%%3D143%%252E117%%252E37%%252E81%%26Equinox%%3D2000%%26Action%%3DMore%%2BOptions%%26sortby%%3Dpriority%%26ResultMax%%3D1000%%26maxpriority%%3D99%%26Coordinates%%3DEquatorial%%26tablehead%%3Dname%%253Dmilliquas%%26Action%%3DParameter%%2BSearch%%27%%3EParameter+Search%%3C%%2Fa%%3E&popupFrom=Query+Results&tablehead=name%%3Dheasarc_milliquas%%26description%%3DMillion+Quasars+Catalog+%%28MILLIQUAS%%29%%2C+Version+4.5+%%2810+May+2015%%29%%26url%%3Dhttp%%3A%%2F%%2Fheasarc.gsfc.nasa.gov%%2FW3Browse%%2Fgalaxy-catalog%%2Fmilliquas.html%%26archive%%3DN%%26radius%%3D1%%26mission%%3DGALAXY+CATALOG%%26priority%%3D5%%26tabletype%%3DObject&dummy=Examples+of+query+constraints%%3A&varon=name&bparam_name%%3A%%3Aunit=+&bparam_name%%3A%%3Aformat=char25&varon=ra&bparam_ra=&bparam_ra%%3A%%3Aunit=degree&bparam_ra%%3A%%3Aformat=float8%%3A.5f&varon=dec&bparam_dec=&bparam_dec%%3A%%3Aunit=degree&bparam_dec%%3A%%3Aformat=float8%%3A.5f&varon=bmag&bparam_bmag=&bparam_bmag%%3A%%3Aunit=mag&bparam_bmag%%3A%%3Aformat=float8%%3A4.1f&varon=rmag&bparam_rmag=&bparam_rmag%%3A%%3Aunit=mag&bparam_rmag%%3A%%3Aformat=float8%%3A4.1f&varon=redshift&bparam_redshift=&bparam_redshift%%3A%%3Aunit=+&bparam_redshift%%3A%%3Aformat=float8%%3A6.3f&varon=radio_name&bparam_radio_name=&bparam_radio_name%%3A%%3Aunit=+&bparam_radio_name%%3A%%3Aformat=char22&varon=xray_name&bparam_xray_name=&bparam_xray_name%%3A%%3Aunit=+&bparam_xray_name%%3A%%3Aformat=char22&bparam_lii=&bparam_lii%%3A%%3Aunit=degree&bparam_lii%%3A%%3Aformat=float8%%3A.5f&bparam_bii=&bparam_bii%%3A%%3Aunit=degree&bparam_bii%%3A%%3Aformat=float8%%3A.5f&bparam_broad_type=&bparam_broad_type%%3A%%3Aunit=+&bparam_broad_type%%3A%%3Aformat=char4&bparam_optical_flag=&bparam_optical_flag%%3A%%3Aunit=+&bparam_optical_flag%%3A%%3Aformat=char3&bparam_red_psf_flag=&bparam_red_psf_flag%%3A%%3Aunit=+&bparam_red_psf_flag%%3A%%3Aformat=char1&bparam_blue_psf_flag=&bparam_blue_psf_flag%%3A%%3Aunit=+&bparam_blue_psf_flag%%3A%%3Aformat=char1&bparam_ref_name=&bparam_ref_name%%3A%%3Aunit=+&bparam_ref_name%%3A%%3Aformat=char6&bparam_ref_redshift=&bparam_ref_redshift%%3A%%3Aunit=+&bparam_ref_redshift%%3A%%3Aformat=char6&bparam_qso_prob=&bparam_qso_prob%%3A%%3Aunit=percent&bparam_qso_prob%%3A%%3Aformat=int2%%3A3d&bparam_alt_name_1=&bparam_alt_name_1%%3A%%3Aunit=+&bparam_alt_name_1%%3A%%3Aformat=char22&bparam_alt_name_2=&bparam_alt_name_2%%3A%%3Aunit=+&bparam_alt_name_2%%3A%%3Aformat=char22&Entry=&Coordinates=J2000&Radius=Default&Radius_unit=arcsec&NR=CheckCaches%%2FGRB%%2FSIMBAD%%2FNED&Time=&ResultMax=10&displaymode=Display&Action=Start+Search&table=heasarc_milliquas"
+SIMBAD_LINK = "http://simbad.u-strasbg.fr/simbad/sim-id?Ident=%(objectName)s&NbIdent=1&Radius=2&Radius.unit=arcmin&submit=submit+id"
+
+
+def sdss_names(raDeg, decDeg):
+    """
+    Return the SDSS IAU names (``SDSS JHHMMSS.ss+DDMMSS.s``, truncated not rounded) of arrays of positions.
+
+    The sexagesimal fields are computed for the whole batch at once, in integer units of the
+    last digit kept, so a truncation can never show 60 seconds.
+    """
+    ra = np.mod(np.asarray(raDeg, dtype="f8"), 360.0) / 15.0
+    # CENTISECONDS OF TIME (THE EPSILON ABSORBS BINARY REPRESENTATION ERRORS LIKE 1.9999999)
+    raUnits = np.floor(ra * 360000.0 + 1e-6).astype("i8")
+    raFields = (raUnits // 360000, raUnits // 6000 % 60, raUnits // 100 % 60, raUnits % 100)
+
+    dec = np.asarray(decDeg, dtype="f8")
+    signs = np.where(dec < 0, "-", "+")
+    # DECI-ARCSECONDS
+    decUnits = np.floor(np.abs(dec) * 36000.0 + 1e-6).astype("i8")
+    decFields = (decUnits // 36000, decUnits // 600 % 60, decUnits // 10 % 60, decUnits % 10)
+
+    return ["SDSS J%02d%02d%02d.%02d%s%02d%02d%02d.%d" % fields
+            for fields in zip(*(raFields + (signs,) + decFields))]
+
+
+def object_link(catalogueTableName, catalogueObjectId):
+    """
+    Return the URL of a catalogue object's page (NED, SDSS, MILLIQUAS or SIMBAD), or None.
+    """
+    objectName = urllib.parse.quote(catalogueObjectId)
+    tableName = catalogueTableName.lower()
+    if "ned" in tableName:
+        return NED_LINK % {"objectName": objectName}
+    elif "sdss" in tableName:
+        return SDSS_LINK % {"objectName": objectName}
+    elif "milliquas" in tableName:
+        return MILLIQUAS_LINK % {"objectName": objectName}
+    elif not any(name in tableName for name in NO_SIMBAD_LINK):
+        return SIMBAD_LINK % {"objectName": objectName}
+    return None
+
+
+def best_magnitude(crossmatch):
+    """
+    Return ``(best_mag, best_mag_error, best_mag_filter)``: the first magnitude set in
+    ``BEST_MAG_FILTERS`` order, or ``(None, None, None)``.
+    """
+    for f in BEST_MAG_FILTERS:
+        if crossmatch.get(f):
+            return crossmatch[f], crossmatch[f + "Err"], f.replace("_", "").replace("Mag", "")
+    return None, None, None
+
+
+def enrich_crossmatches(crossmatches, cache=None):
+    """
+    Add ``object_link``, ``best_mag``, ``best_mag_error`` and ``best_mag_filter`` to crossmatch rows (in place).
+
+    SDSS matches also get their ``catalogue_object_id`` rewritten to the SDSS IAU name.
+    The enrichment only depends on the catalogue object, so it is kept in ``cache``
+    (a ``ttl_cache``) keyed by ``(catalogue_table_name, catalogue_object_id)`` and only
+    computed for the objects not seen before; their SDSS names are converted in one batch.
+
+    - ``crossmatches`` -- rows of ``sherlock_crossmatches`` (with ``raDeg``/``decDeg`` and the magnitude columns)
+    - ``cache`` -- the enrichment cache (None to always compute)
+
+    Returns the rows.
+    """
+    misses = []
+    for c in crossmatches:
+        key = (c["catalogue_table_name"], c["catalogue_object_id"])
+        enriched = cache.get(key) if cache is not None else None
+        if enriched is None:
+            misses.append((key, c))
+        else:
+            c.update(enriched)
+
+    # THE SDSS NAMES OF ALL THE MISSES IN ONE VECTORISED CONVERSION
+    sdss = [c for key, c in misses if "sdss" in c["catalogue_table_name"].lower()]
+    sdssNames = {}
+    if sdss:
+        names = sdss_names([c["raDeg"] for c in sdss], [c["decDeg"] for c in sdss])
+        sdssNames = dict(zip([id(c) for c in sdss], names))
+
+    for key, c in misses:
+        # THE SDSS LINK IS BUILT FROM THE ORIGINAL OBJECT ID, THE DISPLAYED ID IS THE IAU NAME
+        c["object_link"] = object_link(c["catalogue_table_name"], c["catalogue_object_id"])
+        if id(c) in sdssNames:
+            c["catalogue_object_id"] = sdssNames[id(c)]
+        c["best_mag"], c["best_mag_error"], c["best_mag_filter"] = best_magnitude(c)
+        if cache is not None:
+            cache.set(key, dict((k, c[k]) for k in ENRICHED_COLUMNS))
+
+    return crossmatches
@@ -0,0 +1,300 @@
+# ---------------------------------------------------------------------------
+#  Process-wide MySQL connection pool
+# ---------------------------------------------------------------------------
+
+import threading
+import time
+from collections import deque
+
+from fundamentals.mysql import database
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be borrowed within the checkout timeout."""
+    pass
+
+
+class connection_pool(object):
+    """
+    *A thread-safe pool of MySQL connections shared by all the Flask routes*
+
+    Connections are created with ``fundamentals.mysql.database`` (so they keep the
+    autocommit / DictCursor behaviour the models rely on), health-checked with a
+    ping when they are borrowed after having been idle, and closed by a background
+    reaper when they stay idle for longer than ``maxIdleSeconds`` (the pool never
+    shrinks below ``minSize``).
+
+    **Key Arguments**
+
+    - ``log`` -- logger
+    - ``dbSettings`` -- the database settings passed to ``fundamentals.mysql.database``
+    - ``minSize`` -- connections kept open even when idle
+    - ``maxSize`` -- hard cap on open connections; borrowers wait when it is reached
+    - ``checkoutTimeout`` -- seconds a borrower waits before ``PoolTimeout`` is raised
+    - ``maxIdleSeconds`` -- idle connections older than this are reaped
+    - ``pingAfterIdleSeconds`` -- connections idle for longer than this are pinged on checkout
+    - ``reapIntervalSeconds`` -- how often the reaper thread runs
+    """
+
+    def __init__(
+        self,
+        log,
+        dbSettings,
+        minSize=2,
+        maxSize=20,
+        checkoutTimeout=30,
+        maxIdleSeconds=300,
+        pingAfterIdleSeconds=5,
+        reapIntervalSeconds=30
+    ):
+        self.log = log
+        self.dbSettings = dbSettings
+        self.minSize = minSize
+        self.maxSize = max(maxSize, minSize, 1)
+        self.checkoutTimeout = checkoutTimeout
+        self.maxIdleSeconds = maxIdleSeconds
+        self.pingAfterIdleSeconds = pingAfterIdleSeconds
+        self.reapIntervalSeconds = reapIntervalSeconds
+
+        self._lock = threading.Condition()
+        # (connection, lastReturnedAt) pairs, most recently returned on the right
+        self._idle = deque()
+        self._inUse = set()
+        self._opening = 0
+        self._closed = False
+
+        self._metrics = {
+            "checkouts": 0,
+            "waiters": 0,
+            "waitSecondsTotal": 0.0,
+            "waitSecondsMax": 0.0,
+            "timeouts": 0,
+            "created": 0,
+            "discarded": 0,
+            "reaped": 0
+        }
+
+        self._reaper = threading.Thread(
+            target=self._reap_forever, name="db-pool-reaper", daemon=True)
+        self._reaper.start()
+
+        return None
+
+    def acquire(
+            self,
+            timeout=None):
+        """*borrow a healthy connection from the pool*
+
+        **Key Arguments**
+
+        - ``timeout`` -- override the pool ``checkoutTimeout`` (seconds)
+
+        **Return**
+
+        - ``dbConn`` -- a pymysql connection; hand it back with ``release``
+        """
+        if timeout is None:
+            timeout = self.checkoutTimeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+
+        while True:
+            dbConn = None
+            lastUsed = None
+            with self._lock:
+                if self._closed:
+                    raise PoolTimeout("the connection pool has been closed")
+                while not self._idle and len(self._inUse) + self._opening >= self.maxSize:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        if waited:
+                            self._metrics["waiters"] -= 1
+                        self._metrics["timeouts"] += 1
+                        raise PoolTimeout(
+                            "no database connection available after %(timeout)s seconds" % locals())
+                    if not waited:
+                        waited = True
+                        self._metrics["waiters"] += 1
+                    self._lock.wait(remaining)
+                if waited:
+                    waited = False
+                    self._metrics["waiters"] -= 1
+                if self._idle:
+                    dbConn, lastUsed = self._idle.pop()
+                    self._inUse.add(dbConn)
+                else:
+                    self._opening += 1
+
+            if dbConn is None:
+                try:
+                    dbConn = self._connect()
+                finally:
+                    with self._lock:
+                        self._opening -= 1
+                        if dbConn is not None:
+                            self._inUse.add(dbConn)
+                        else:
+                            self._lock.notify()
+            elif not self._is_healthy(dbConn, lastUsed):
+                self._discard(dbConn)
+                continue
+
+            waitSeconds = time.monotonic() - started
+            with self._lock:
+                self._metrics["checkouts"] += 1
+                self._metrics["waitSecondsTotal"] += waitSeconds
+                self._metrics["waitSecondsMax"] = max(
+                    self._metrics["waitSecondsMax"], waitSeconds)
+            return dbConn
+
+    def release(
+            self,
+            dbConn,
+            discard=False):
+        """*hand a borrowed connection back to the pool*
+
+        Any transaction left open by the borrower is rolled back and autocommit
+        restored; connections that fail this reset are closed instead of reused.
+
+        **Key Arguments**
+
+        - ``dbConn`` -- the connection returned by ``acquire``
+        - ``discard`` -- close the connection rather than returning it to the idle set
+        """
+        if not discard:
+            try:
+                dbConn.rollback()
+                dbConn.autocommit(True)
+            except Exception as e:
+                self.log.warning(
+                    "discarding pooled connection that failed to reset: %s" % (e,))
+                discard = True
+
+        with self._lock:
+            self._inUse.discard(dbConn)
+            if not discard and not self._closed:
+                self._idle.append((dbConn, time.monotonic()))
+                self._lock.notify()
+                return None
+
+        self._discard(dbConn, alreadyRemoved=True)
+        return None
+
+    def metrics(
+            self):
+        """*snapshot of the pool gauges and counters*
+
+        **Return**
+
+        - ``metrics`` -- dictionary of pool metrics
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["inUse"] = len(self._inUse)
+            metrics["idle"] = len(self._idle)
+            metrics["size"] = len(self._inUse) + len(self._idle) + self._opening
+            metrics["minSize"] = self.minSize
+            metrics["maxSize"] = self.maxSize
+        return metrics
+
+    def close(
+            self):
+        """*close every idle connection and refuse further checkouts*
+        """
+        with self._lock:
+            self._closed = True
+            idle = [c for c, _ in self._idle]
+            self._idle.clear()
+            self._lock.notify_all()
+        for dbConn in idle:
+            self._close_quietly(dbConn)
+        return None
+
+    def _connect(
+            self):
+        dbConn = database(
+            log=self.log,
+            dbSettings=self.dbSettings
+        ).connect()
+        with self._lock:
+            self._metrics["created"] += 1
+        return dbConn
+
+    def _is_healthy(
+            self,
+            dbConn,
+            lastUsed):
+        if lastUsed is not None and time.monotonic() - lastUsed < self.pingAfterIdleSeconds:
+            return True
+        try:
+            dbConn.ping(reconnect=False)
+            return True
+        except Exception as e:
+            self.log.info("pooled connection failed health check: %s" % (e,))
+            return False
+
+    def _discard(
+            self,
+            dbConn,
+            alreadyRemoved=False):
+        with self._lock:
+            if not alreadyRemoved:
+                self._inUse.discard(dbConn)
+            self._metrics["discarded"] += 1
+            self._lock.notify()
+        self._close_quietly(dbConn)
+
+    def _close_quietly(
+            self,
+            dbConn):
+        try:
+            dbConn.close()
+        except Exception:
+            pass
+
+    def _reap_forever(
+            self):
+        while True:
+            time.sleep(self.reapIntervalSeconds)
+            with self._lock:
+                if self._closed:
+                    return
+            try:
+                self._reap_idle()
+                self._fill_to_min_size()
+            except Exception as e:
+                self.log.warning("database pool reaper failed: %s" % (e,))
+
+    def _reap_idle(
+            self):
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            size = len(self._inUse) + len(self._idle) + self._opening
+            # THE OLDEST IDLE CONNECTIONS SIT ON THE LEFT OF THE DEQUE
+            while self._idle and size > self.minSize and now - self._idle[0][1] > self.maxIdleSeconds:
+                dbConn, _ = self._idle.popleft()
+                expired.append(dbConn)
+                size -= 1
+            self._metrics["reaped"] += len(expired)
+        for dbConn in expired:
+            self._close_quietly(dbConn)
+
+    def _fill_to_min_size(
+            self):
+        while True:
+            with self._lock:
+                size = len(self._inUse) + len(self._idle) + self._opening
+                if self._closed or size >= self.minSize:
+                    return
+                self._opening += 1
+            dbConn = None
+            try:
+                dbConn = self._connect()
+            finally:
+                with self._lock:
+                    self._opening -= 1
+                    if dbConn is not None:
+                        self._idle.appendleft((dbConn, time.monotonic()))
+                    self._lock.notify()
@@ -0,0 +1,177 @@
+# ---------------------------------------------------------------------------
+#  Shared, bounded thread pool for the file I/O on the remote assets mount
+# ---------------------------------------------------------------------------
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class bounded_io_pool(object):
+    """
+    *A process-wide thread pool for blocking file I/O, with a global concurrency cap*
+
+    All the requests share ``maxWorkers`` threads, and at most ``maxConcurrentReads``
+    tasks touch the remote mount at the same time. A request gives its batch of tasks a
+    deadline with ``map_with_deadline``, so one slow directory cannot stall the response.
+
+    **Key Arguments**
+
+    - ``log`` -- logger
+    - ``maxWorkers`` -- threads of the shared pool
+    - ``maxConcurrentReads`` -- tasks allowed to run their I/O concurrently
+    - ``name`` -- thread name prefix
+    """
+
+    def __init__(
+        self,
+        log,
+        maxWorkers=16,
+        maxConcurrentReads=8,
+        name="io-pool"
+    ):
+        self.log = log
+        self.maxWorkers = maxWorkers
+        self.maxConcurrentReads = min(maxConcurrentReads, maxWorkers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=maxWorkers, thread_name_prefix=name)
+        self._reads = threading.BoundedSemaphore(self.maxConcurrentReads)
+        self._lock = threading.Lock()
+        # THE FUTURES NOT FINISHED YET, SO shutdown CAN CANCEL THE QUEUED ONES
+        self._pending = set()
+
+        self._metrics = {
+            "queued": 0,
+            "running": 0,
+            "completed": 0,
+            "failed": 0,
+            "deadlineMisses": 0,
+            "queueSecondsTotal": 0.0,
+            "runSecondsTotal": 0.0,
+            "runSecondsMax": 0.0
+        }
+
+        return None
+
+    def submit(
+            self,
+            fn,
+            *args,
+            **kwargs):
+        """*queue ``fn(*args, **kwargs)`` on the shared pool*
+
+        **Return**
+
+        - ``future`` -- a ``concurrent.futures.Future``
+        """
+        queuedAt = time.monotonic()
+        with self._lock:
+            self._metrics["queued"] += 1
+        future = self._executor.submit(self._run, queuedAt, fn, args, kwargs)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._forget)
+        return future
+
+    def map_with_deadline(
+            self,
+            fn,
+            items,
+            timeout):
+        """*run ``fn(item)`` for every item and wait at most ``timeout`` seconds*
+
+        Tasks still queued at the deadline are cancelled; tasks already running finish
+        in the background but their results are dropped.
+
+        **Key Arguments**
+
+        - ``fn`` -- function taking one item
+        - ``items`` -- the items to process
+        - ``timeout`` -- deadline of the whole batch, in seconds
+
+        **Return**
+
+        - ``results`` -- list of ``(item, result)`` pairs of the tasks completed in time (failed tasks are logged and left out)
+        - ``missed`` -- the items whose task did not complete before the deadline
+        """
+        futures = dict((self.submit(fn, item), item) for item in items)
+        done, notDone = wait(futures, timeout=timeout)
+
+        results = []
+        for future in done:
+            try:
+                results.append((futures[future], future.result()))
+            except Exception as e:
+                self.log.warning("I/O task for %s failed: %s" % (futures[future], e))
+
+        missed = []
+        cancelled = 0
+        for future in notDone:
+            if future.cancel():
+                cancelled += 1
+            missed.append(futures[future])
+        if missed:
+            with self._lock:
+                self._metrics["deadlineMisses"] += len(missed)
+                self._metrics["queued"] -= cancelled
+            self.log.warning("%s I/O tasks missed their %s s deadline" % (len(missed), timeout))
+
+        return results, missed
+
+    def metrics(
+            self):
+        """*queue depth, running tasks and latency counters*
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics["maxWorkers"] = self.maxWorkers
+        metrics["maxConcurrentReads"] = self.maxConcurrentReads
+        return metrics
+
+    def shutdown(
+            self):
+        """*stop accepting tasks and drop the queued ones*
+        """
+        # cancel_futures=True NEEDS PYTHON 3.9, SO THE QUEUED TASKS ARE CANCELLED HERE
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            if future.cancel():
+                with self._lock:
+                    self._metrics["queued"] -= 1
+        self._executor.shutdown(wait=False)
+        return None
+
+    def _forget(
+            self,
+            future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def _run(
+            self,
+            queuedAt,
+            fn,
+            args,
+            kwargs):
+        with self._reads:
+            started = time.monotonic()
+            with self._lock:
+                self._metrics["queued"] -= 1
+                self._metrics["running"] += 1
+                self._metrics["queueSecondsTotal"] += started - queuedAt
+            failed = False
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                runSeconds = time.monotonic() - started
+                with self._lock:
+                    self._metrics["running"] -= 1
+                    self._metrics["completed"] += 1
+                    self._metrics["failed"] += int(failed)
+                    self._metrics["runSecondsTotal"] += runSeconds
+                    self._metrics["runSecondsMax"] = max(
+                        self._metrics["runSecondsMax"], runSeconds)
@@ -0,0 +1,99 @@
+# ---------------------------------------------------------------------------
+#  Columnar (array based) lightcurve payloads
+# ---------------------------------------------------------------------------
+
+import base64
+
+import numpy as np
+
+# DTYPES OF THE BINARY BUFFERS: MJDs NEED DOUBLE PRECISION (FLOAT32 ONLY RESOLVES ~6 MINUTES AT MJD 60000)
+BINARY_DTYPES = {
+    "mjd": "<f8",
+    "mag": "<f4",
+    "magErr": "<f4",
+    "limit": "u1"
+}
+
+
+def columnar_lightcurves(rows, binary=False):
+    """
+    Group photometry rows into per-transient, per filter/survey arrays.
+
+    - ``rows`` -- transientBucket rows with ``transientBucketId``, ``observationMJD``,
+      ``magnitude``, ``magnitudeError``, ``limitingMag``, ``filter`` and ``survey``
+    - ``binary`` -- emit every array as a base64 encoded little-endian buffer
+      (``{"dtype": ..., "b64": ...}``) rather than a JSON list
+
+    Returns one ``{"transientBucketId": ..., "series": [...]}`` dictionary per transient,
+    each series holding ``filter``, ``survey``, ``n`` and the ``mjd``, ``mag``,
+    ``magErr`` and ``limit`` arrays sorted by MJD. Missing magnitude errors are NaN
+    (``null`` in the JSON lists).
+    """
+    if not rows:
+        return []
+
+    count = len(rows)
+    transientBucketIds = np.fromiter((r["transientBucketId"] for r in rows), dtype=np.int64, count=count)
+    mjd = np.fromiter((_float(r["observationMJD"]) for r in rows), dtype=np.float64, count=count)
+    mag = np.fromiter((_float(r["magnitude"]) for r in rows), dtype=np.float64, count=count)
+    magErr = np.fromiter((_float(r["magnitudeError"]) for r in rows), dtype=np.float64, count=count)
+    limit = np.fromiter((bool(r["limitingMag"]) for r in rows), dtype=np.bool_, count=count)
+
+    # FILTER/SURVEY PAIRS ARE FACTORISED TO INTEGER CODES SO THE GROUPING IS A SINGLE LEXSORT
+    bands = {}
+    bandCodes = np.fromiter((bands.setdefault((r["filter"], r["survey"]), len(bands)) for r in rows),
+                            dtype=np.int64, count=count)
+    bandNames = [None] * len(bands)
+    for band, code in bands.items():
+        bandNames[code] = band
+
+    order = np.lexsort((mjd, bandCodes, transientBucketIds))
+    transientBucketIds = transientBucketIds[order]
+    bandCodes = bandCodes[order]
+    columns = {
+        "mjd": mjd[order],
+        "mag": mag[order],
+        "magErr": magErr[order],
+        "limit": limit[order]
+    }
+
+    # START OF EVERY (TRANSIENT, BAND) RUN IN THE SORTED ARRAYS
+    boundaries = np.flatnonzero(
+        (transientBucketIds[1:] != transientBucketIds[:-1]) | (bandCodes[1:] != bandCodes[:-1])) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [count]))
+
+    lightcurves = []
+    for start, end in zip(starts, ends):
+        transientBucketId = int(transientBucketIds[start])
+        if not lightcurves or lightcurves[-1]["transientBucketId"] != transientBucketId:
+            lightcurves.append({"transientBucketId": transientBucketId, "series": []})
+        thisFilter, thisSurvey = bandNames[bandCodes[start]]
+        series = {
+            "filter": thisFilter,
+            "survey": thisSurvey,
+            "n": int(end - start)
+        }
+        for name, values in columns.items():
+            series[name] = _encode(name, values[start:end], binary)
+        lightcurves[-1]["series"].append(series)
+
+    return lightcurves
+
+
+def _float(value):
+    if value is None:
+        return np.nan
+    return float(value)
+
+
+def _encode(name, values, binary):
+    if binary:
+        return {
+            "dtype": BINARY_DTYPES[name],
+            "b64": base64.b64encode(values.astype(BINARY_DTYPES[name]).tobytes()).decode("ascii")
+        }
+    if values.dtype == np.bool_:
+        return values.tolist()
+    # NaN IS NOT VALID JSON
+    return [None if v != v else v for v in values.tolist()]
@@ -0,0 +1,189 @@
+# ---------------------------------------------------------------------------
+#  Sidebar list counts (`meta_workflow_lists_counts`) maintenance
+# ---------------------------------------------------------------------------
+
+import os
+import threading
+import time
+
+import redis
+from fundamentals.mysql import writequery
+
+from packages import statements
+
+# all marshall workflow list titles
+MARSHALL_WORKFLOW_LISTS = ["inbox", "archive", "following", "pending observation",
+                           "followup complete", "review for followup", "pending classification"]
+
+# all alert workflow list titles
+ALERT_WORKFLOW_LISTS = ["external alert released", "pessto classification released",
+                        "archived without alert", "queued for atel"]
+
+
+def list_count_deltas(stateBefore, stateAfter):
+    """
+    Return the change each sidebar count needs when a transient moves from
+    ``stateBefore`` to ``stateAfter``.
+
+    - ``stateBefore`` / ``stateAfter`` -- dictionaries with ``marshallWorkflowLocation``,
+      ``alertWorkflowLocation``, ``snoozed`` and ``classifiedFlag`` (``None`` if the
+      transient does not exist in that state)
+
+    Lists whose count does not change are left out of the returned dictionary.
+    """
+    deltas = {}
+    for state, sign in ((stateBefore, -1), (stateAfter, 1)):
+        for listName in _lists_counting(state):
+            deltas[listName] = deltas.get(listName, 0) + sign
+    return dict((k, v) for k, v in deltas.items() if v)
+
+
+def apply_list_count_deltas(log, dbConn, deltas, unitOfWork=None):
+    """
+    Atomically add ``deltas`` (list name to +/- change) to ``meta_workflow_lists_counts``.
+
+    A single UPDATE applies every change as ``count = count + delta`` so concurrent
+    writers never overwrite each other's increments. With ``unitOfWork`` the UPDATE joins
+    that transaction instead of being committed on its own.
+    """
+    if not deltas:
+        return None
+    # THE LIST NAMES AND DELTAS ARE BOUND BY THE DRIVER
+    cases = " ".join(["when %s then %s"] * len(deltas))
+    args = []
+    for k, v in sorted(deltas.items()):
+        args.extend([k, int(v)])
+    args.append(sorted(deltas))
+    sqlQuery = """update meta_workflow_lists_counts set count = greatest(cast(count as signed) + (case lower(listname) %(cases)s else 0 end), 0) where listname in %%s""" % locals()
+    if unitOfWork:
+        unitOfWork.execute(sqlQuery, args)
+    else:
+        statements.write(log, dbConn, sqlQuery, args)
+    return None
+
+
+def refresh_sidebar_list_counts(log, dbConn):
+    """
+    Recount every sidebar list from scratch (a full scan of ``pesstoObjects`` per list).
+
+    Only the background reconciliation runs this; the request path applies
+    incremental deltas with ``apply_list_count_deltas``.
+    """
+    log.debug('starting the ``refresh_sidebar_list_counts`` function')
+
+    # count objects in each list and update the `meta_workflow_lists_counts`
+    # table
+    for thisList in MARSHALL_WORKFLOW_LISTS:
+        sqlQuery = """update meta_workflow_lists_counts set count = (select count(*) from pesstoObjects where marshallWorkflowLocation="%(thisList)s") where listname = "%(thisList)s" """ % locals(
+        )
+        writequery(log, sqlQuery, dbConn)
+
+    for thisList in ALERT_WORKFLOW_LISTS:
+        sqlQuery = """update meta_workflow_lists_counts set count = (select count(*) from pesstoObjects where alertWorkflowLocation="%(thisList)s") where listname = "%(thisList)s" """ % locals(
+        )
+        writequery(log, sqlQuery, dbConn)
+
+    # count all objects
+    sqlQuery = """update meta_workflow_lists_counts set count = (select count(*) from pesstoObjects) where listname = "all" """
+    writequery(log, sqlQuery, dbConn)
+
+    # count classified objects
+    sqlQuery = """update meta_workflow_lists_counts set count = (select count(*) from pesstoObjects where classifiedFlag = 1) where listname = "classified" """
+    writequery(log, sqlQuery, dbConn)
+
+    # count snoozed objects
+    sqlQuery = """update meta_workflow_lists_counts set count = (select count(*) from pesstoObjects where snoozed = 1) where listname = "snoozed" """
+    writequery(log, sqlQuery, dbConn)
+
+    log.debug('completed the ``refresh_sidebar_list_counts`` function')
+    return None
+
+
+def _lists_counting(state):
+    if not state:
+        return []
+    listNames = ["all"]
+    mwl = (state.get("marshallWorkflowLocation") or "").lower()
+    if mwl in MARSHALL_WORKFLOW_LISTS:
+        listNames.append(mwl)
+    awl = (state.get("alertWorkflowLocation") or "").lower()
+    if awl in ALERT_WORKFLOW_LISTS:
+        listNames.append(awl)
+    if state.get("classifiedFlag"):
+        listNames.append("classified")
+    if state.get("snoozed"):
+        listNames.append("snoozed")
+    return listNames
+
+
+class list_counts_reconciler(object):
+    """
+    *Background job recounting the sidebar lists to correct any drift of the incremental counts*
+
+    Every worker process runs one, but a Redis lock (``SET NX`` with an expiry) makes sure
+    only a single worker recounts per interval.
+
+    **Key Arguments**
+
+    - ``log`` -- logger
+    - ``pool`` -- the ``connection_pool`` to borrow a connection from
+    - ``redisClient`` -- a ``redis.StrictRedis`` client
+    - ``intervalSeconds`` -- how often the lists are recounted
+    - ``lockKey`` -- the Redis key of the cross-worker lock
+    """
+
+    def __init__(
+        self,
+        log,
+        pool,
+        redisClient,
+        intervalSeconds=600,
+        lockKey="marshall:list_counts:reconcile_lock"
+    ):
+        self.log = log
+        self.pool = pool
+        self.redis = redisClient
+        self.intervalSeconds = intervalSeconds
+        self.lockKey = lockKey
+        self.lastRunAt = None
+        self.runs = 0
+
+        self._thread = threading.Thread(
+            target=self._reconcile_forever, name="list-counts-reconciler", daemon=True)
+        self._thread.start()
+
+        return None
+
+    def reconcile(
+            self):
+        """*recount the sidebar lists now, unless another worker holds the lock*
+
+        **Return**
+
+        - ``ran`` -- True if this worker performed the recount
+        """
+        # THE LOCK IS LEFT TO EXPIRE SO THE OTHER WORKERS SKIP THE REST OF THIS INTERVAL
+        try:
+            if not self.redis.set(self.lockKey, os.getpid(), nx=True, ex=max(int(self.intervalSeconds), 1)):
+                return False
+        except redis.RedisError as e:
+            self.log.warning("could not take the list counts lock: %s" % (e,))
+            return False
+
+        dbConn = self.pool.acquire()
+        try:
+            refresh_sidebar_list_counts(self.log, dbConn)
+        finally:
+            self.pool.release(dbConn)
+        self.lastRunAt = time.time()
+        self.runs += 1
+        return True
+
+    def _reconcile_forever(
+            self):
+        while True:
+            time.sleep(self.intervalSeconds)
+            try:
+                self.reconcile()
+            except Exception as e:
+                self.log.warning("sidebar list count reconciliation failed: %s" % (e,))
@@ -4,16 +4,19 @@ from flask_jwt_extended import jwt_required
 from flask_jwt_extended import JWTManager
 from flask import jsonify
 
-from fundamentals.mysql import database, readquery
+import traceback
+
 from passlib.hash import sha256_crypt
+from packages import statements
 
 def login_user(dbConn, firstname, secondname, password, log):
-    # GETTING THE DATA FROM THE DATABASE
-    query = f"SELECT * from webapp_users WHERE firstname = '{firstname}' AND secondname='{secondname}'"
-    rs = readquery(
-        query,
+    # GETTING THE DATA FROM THE DATABASE (THE NAMES ARE BOUND BY THE DRIVER, NEVER INTERPOLATED)
+    query = "SELECT * from webapp_users WHERE firstname = %s AND secondname = %s"
+    rs = statements.read(
+        log,
         dbConn,
-        log
+        query,
+        (firstname, secondname)
     )
     if len(rs) <= 0:
         return jsonify({"msg": "Bad username or password. Please check your credentials.", "err":"Login error"}), 401
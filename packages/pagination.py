@@ -0,0 +1,142 @@
+# ---------------------------------------------------------------------------
+#  Keyset (seek) pagination helpers
+# ---------------------------------------------------------------------------
+
+import base64
+import datetime
+import decimal
+import json
+import re
+
+CURSOR_VERSION = 1
+NUMBER_RE = re.compile(r"^-?\d+(\.\d+)?([eE][-+]?\d+)?$")
+
+
+def encode_cursor(sortBy, sortDesc, keys, transientBucketId):
+    """
+    Build the opaque cursor pointing just after a ticket.
+
+    - ``sortBy`` / ``sortDesc`` -- the sort of the list the cursor belongs to
+    - ``keys`` -- the values of the ORDER BY expressions for the last ticket of the page
+    - ``transientBucketId`` -- the id of the last ticket (the tie-breaker)
+    """
+    payload = {
+        "v": CURSOR_VERSION,
+        "sortBy": sortBy,
+        "sortDesc": bool(sortDesc),
+        "keys": [_encode_key(k) for k in keys],
+        "id": int(transientBucketId)
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, sortBy, sortDesc, numberOfKeys):
+    """
+    Decode and validate a cursor produced by ``encode_cursor``.
+
+    Raises ``ValueError`` if the cursor is malformed or was issued for a
+    different sort order.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid pagination cursor")
+
+    if not isinstance(payload, dict) or payload.get("v") != CURSOR_VERSION:
+        raise ValueError("Invalid pagination cursor")
+    if payload.get("sortBy") != sortBy or payload.get("sortDesc") != bool(sortDesc):
+        raise ValueError("The pagination cursor was issued for a different sort order")
+
+    keys = payload.get("keys")
+    if not isinstance(keys, list) or len(keys) != numberOfKeys:
+        raise ValueError("Invalid pagination cursor")
+    for k in keys:
+        _validate_key(k)
+
+    transientBucketId = payload.get("id")
+    if not isinstance(transientBucketId, int) or isinstance(transientBucketId, bool):
+        raise ValueError("Invalid pagination cursor")
+
+    return keys, transientBucketId
+
+
+def keyset_predicate(orderTerms, keys):
+    """
+    Build the SQL condition selecting the rows that sort strictly after ``keys``.
+
+    ``orderTerms`` is the list of ``(expression, direction)`` pairs of the ORDER BY
+    (the last one being the unique tie-breaker) and ``keys`` the matching decoded
+    cursor keys. NULLs follow the MySQL ordering: first when ascending, last when
+    descending. The cursor keys are never written into the SQL: the condition holds
+    ``%s`` placeholders and their values are returned alongside it.
+
+    Returns ``(predicate, args)``.
+    """
+    disjuncts = []
+    args = []
+    equalities = []
+    equalityArgs = []
+    for (expression, direction), key in zip(orderTerms, keys):
+        value = _key_value(key)
+        descending = direction.strip().lower() == "desc"
+
+        after = None
+        afterArgs = []
+        if value is None:
+            if not descending:
+                after = "%(expression)s is not null" % locals()
+        elif descending:
+            after = "(%(expression)s < %%s or %(expression)s is null)" % locals()
+            afterArgs = [value]
+        else:
+            after = "%(expression)s > %%s" % locals()
+            afterArgs = [value]
+
+        if after:
+            disjuncts.append("(" + " and ".join(equalities + [after]) + ")")
+            args.extend(equalityArgs + afterArgs)
+
+        if value is None:
+            equalities.append("%(expression)s is null" % locals())
+        else:
+            equalities.append("%(expression)s = %%s" % locals())
+            equalityArgs.append(value)
+
+    if not disjuncts:
+        return "1=0", []
+    return "(" + " or ".join(disjuncts) + ")", args
+
+
+def _encode_key(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return ["n", str(int(value))]
+    if isinstance(value, (int, float, decimal.Decimal)):
+        return ["n", str(value)]
+    if isinstance(value, datetime.datetime):
+        return ["s", value.strftime("%Y-%m-%d %H:%M:%S.%f")]
+    if isinstance(value, datetime.date):
+        return ["s", value.isoformat()]
+    return ["s", str(value)]
+
+
+def _validate_key(key):
+    if key is None:
+        return
+    if not isinstance(key, list) or len(key) != 2 or key[0] not in ("n", "s") or not isinstance(key[1], str):
+        raise ValueError("Invalid pagination cursor")
+    if key[0] == "n" and not NUMBER_RE.match(key[1]):
+        raise ValueError("Invalid pagination cursor")
+
+
+def _key_value(key):
+    # NUMBERS ARE BOUND AS DECIMALS SO THEY COMPARE AS NUMBERS, NOT STRINGS
+    if key is None:
+        return None
+    kind, value = key
+    if kind == "n":
+        return decimal.Decimal(value)
+    return value
@@ -0,0 +1,193 @@
+# ---------------------------------------------------------------------------
+#  Redis-backed response cache for the ticket list views
+# ---------------------------------------------------------------------------
+
+import hashlib
+import json
+
+import redis
+
+# LIST VIEWS THAT ARE NOT TIED TO A SINGLE WORKFLOW LIST (e.g. `snoozed=False`
+# OR THE `mwl=all` COUNTS) DEPEND ON THIS GENERATION, BUMPED ON EVERY WRITE
+ALL_LISTS = "all"
+
+
+def lists_for_workflow_state(state):
+    """
+    Return the generation names of every list a transient with the given
+    ``pesstoObjects`` workflow state appears in.
+
+    - ``state`` -- dictionary with ``marshallWorkflowLocation``, ``alertWorkflowLocation``,
+      ``snoozed`` and ``classifiedFlag`` (``None`` for an unknown transient)
+    """
+    listNames = set([ALL_LISTS])
+    if not state:
+        return listNames
+    if state.get("marshallWorkflowLocation"):
+        listNames.add("mwl:" + state["marshallWorkflowLocation"].lower())
+    if state.get("alertWorkflowLocation"):
+        listNames.add("awl:" + state["alertWorkflowLocation"].lower())
+    if state.get("snoozed"):
+        listNames.add("snoozed")
+    if state.get("classifiedFlag"):
+        listNames.add("classified")
+    return listNames
+
+
+class response_cache(object):
+    """
+    *Cache of serialised /getTransients responses shared by all the workers through Redis*
+
+    Every cached response is keyed on the normalised sanitized payload plus the current
+    generation counter of each list it shows. Writes bump the generations of the lists
+    the touched transients were in (before and after the write), so a stale ticket list
+    is never served: its key simply stops being looked up and expires with its TTL.
+
+    **Key Arguments**
+
+    - ``log`` -- logger
+    - ``redisClient`` -- a ``redis.StrictRedis`` client (binary responses)
+    - ``ttlSeconds`` -- lifetime of a cached response
+    - ``prefix`` -- namespace of the Redis keys
+    """
+
+    def __init__(
+        self,
+        log,
+        redisClient,
+        ttlSeconds=60,
+        prefix="marshall:response_cache"
+    ):
+        self.log = log
+        self.redis = redisClient
+        self.ttlSeconds = ttlSeconds
+        self.prefix = prefix
+
+        return None
+
+    def generations_for_request(
+            self,
+            payload):
+        """*return the generation names a list request depends on, or None if it is not cacheable*
+
+        Free-text searches and streamed exports are not cached.
+        """
+        if "q" in payload or payload.get("format") == "ndjson":
+            return None
+
+        mwl = payload.get("mwl")
+        if mwl == "all":
+            return [ALL_LISTS]
+        if mwl == "allObsQueue":
+            return ["mwl:following", "mwl:pending observation"]
+        if mwl:
+            return ["mwl:" + mwl.lower()]
+        if payload.get("awl"):
+            return ["awl:" + payload["awl"].lower()]
+        if payload.get("snoozed") is True:
+            return ["snoozed"]
+        if payload.get("cf") == "1":
+            return ["classified"]
+        if "snoozed" in payload or "cf" in payload:
+            return [ALL_LISTS]
+        return None
+
+    def key_for(
+            self,
+            payload):
+        """*build the cache key of a sanitized /getTransients payload*
+
+        The generations are read here, i.e. *before* the database is queried, so a write
+        landing while the response is being built makes the stored entry unreachable.
+
+        **Return**
+
+        - ``key`` -- the Redis key, or None if the request must not be cached
+        """
+        listNames = self.generations_for_request(payload)
+        if not listNames:
+            return None
+
+        normalised = json.dumps(payload, sort_keys=True, default=str)
+        digest = hashlib.sha1(normalised.encode("utf-8")).hexdigest()
+        try:
+            generations = self.redis.mget(
+                [self._generation_key(n) for n in listNames])
+        except redis.RedisError as e:
+            self.log.warning("response cache unavailable: %s" % (e,))
+            return None
+        generations = [(g or b"0").decode("ascii") if isinstance(g, bytes) else str(g or 0)
+                       for g in generations]
+
+        return "%s:%s:%s" % (self.prefix, digest, (".").join(generations))
+
+    def generation(
+            self,
+            listName=ALL_LISTS):
+        """*return the current generation of ``listName`` (every write bumps ``all``), or None if Redis is unavailable*
+        """
+        try:
+            value = self.redis.get(self._generation_key(listName))
+        except redis.RedisError as e:
+            self.log.warning("response cache unavailable: %s" % (e,))
+            return None
+        return (value or b"0").decode("ascii") if isinstance(value, bytes) else str(value or 0)
+
+    def get(
+            self,
+            key):
+        """*return the cached response body for ``key`` (or None) and count the hit/miss*
+        """
+        try:
+            body = self.redis.get(key)
+            self.redis.incr("%s:%s" % (self.prefix, "hits" if body is not None else "misses"))
+        except redis.RedisError as e:
+            self.log.warning("response cache unavailable: %s" % (e,))
+            return None
+        return body
+
+    def set(
+            self,
+            key,
+            body):
+        """*store a serialised response body under ``key``*
+        """
+        try:
+            self.redis.set(key, body, ex=self.ttlSeconds)
+        except redis.RedisError as e:
+            self.log.warning("response cache unavailable: %s" % (e,))
+        return None
+
+    def bump(
+            self,
+            listNames):
+        """*invalidate every cached response showing one of ``listNames``*
+        """
+        listNames = set(listNames) | set([ALL_LISTS])
+        try:
+            pipe = self.redis.pipeline()
+            for name in listNames:
+                pipe.incr(self._generation_key(name))
+            pipe.execute()
+        except redis.RedisError as e:
+            self.log.error("could not invalidate the response cache: %s" % (e,))
+        return None
+
+    def metrics(
+            self):
+        """*hit/miss counters shared by all the workers*
+        """
+        try:
+            hits, misses = self.redis.mget(
+                ["%s:hits" % self.prefix, "%s:misses" % self.prefix])
+        except redis.RedisError:
+            return {}
+        return {
+            "hits": int(hits or 0),
+            "misses": int(misses or 0)
+        }
+
+    def _generation_key(
+            self,
+            listName):
+        return "%s:generation:%s" % (self.prefix, listName)
@@ -4,6 +4,18 @@
 
 import re
 SAFE_IDENTIFIER_RE = re.compile(r"^[A-Za-z0-9_ ]+$")
+CURSOR_RE = re.compile(r"^[A-Za-z0-9_-]{1,2048}$")
+SUPEREVENT_ID_RE = re.compile(r"^[A-Za-z0-9_]{1,32}$")
+SEARCH_TERM_SEPARATOR_RE = re.compile(r"[,\s]+")
+MAX_SEARCH_TERMS = 500
+# transientBucketIds a single /getLightcurve request may ask for
+MAX_LIGHTCURVE_IDS = 500
+# elementIds a single bulk /patchTransient list move may touch
+MAX_BULK_MOVE_IDS = 500
+# /coneSearch bounds: radius (arcsec), positions of a batch cross-match, matches returned
+MAX_CONE_RADIUS_ARCSEC = 36000
+MAX_CONE_SEARCH_POSITIONS = 20000
+MAX_CONE_SEARCH_MATCHES = 20000
 # Values that are used verbatim in SQL WHERE clauses in the models
 ALLOWED_MWL_VALUES = {
     "inbox",
@@ -38,20 +50,17 @@ def _sanitize_identifier(value):
 
 def _sanitize_string(value, max_length=255):
     """
-    Basic string sanitization for values that will be interpolated
-    into SQL string literals in the legacy models.
+    Basic string sanitization for free-text values.
 
     - Casts to string
     - Trims to max_length
-    - Escapes quotes and backslashes to reduce injection risk
+
+    The models bind these values as driver parameters (see packages/statements.py),
+    so they are not escaped here: escaping would be stored verbatim.
     """
     if value is None:
         return ""
-    s = str(value)[:max_length]
-    # Escape backslashes first, then quotes
-    s = s.replace("\\", "\\\\")
-    s = s.replace('"', '\\"').replace("'", "\\'")
-    return s
+    return str(value)[:max_length]
 
 
 def _sanitize_get_transients_request(raw):
@@ -66,9 +75,29 @@ def _sanitize_get_transients_request(raw):
     # Free-text search is already heavily cleaned in the model,
     # but we still remove obviously dangerous characters here.
     number_of_detected_params = 0
+    # q MAY HOLD SEVERAL NAMES/IDS (COMMA OR WHITESPACE SEPARATED, OR A JSON LIST);
+    # THEY ARE PASSED ON AS A COMMA-SEPARATED STRING OF ALPHANUMERIC TERMS
     q = raw.get("q")
     if q is not None:
-        cleaned["q"] = re.sub(r"[^A-Za-z0-9]", "", str(q))[:100]
+        if isinstance(q, (list, tuple)):
+            terms = [str(t) for t in q]
+        else:
+            terms = SEARCH_TERM_SEPARATOR_RE.split(str(q))
+        # KEEP IAU NAMES WRITTEN WITH A SPACE (`AT 2023abc`) AS A SINGLE TERM
+        merged = []
+        for term in terms:
+            if merged and merged[-1].upper() in ("AT", "SN") and term[:1].isdigit():
+                merged[-1] = merged[-1] + term
+            else:
+                merged.append(term)
+        searchTerms = []
+        for term in merged:
+            term = re.sub(r"[^A-Za-z0-9]", "", term)[:100]
+            if term and term not in searchTerms:
+                searchTerms.append(term)
+        if len(searchTerms) > MAX_SEARCH_TERMS:
+            raise ValueError("At most %s search terms can be given in q" % MAX_SEARCH_TERMS)
+        cleaned["q"] = (",").join(searchTerms)
         number_of_detected_params = number_of_detected_params + 1
 
     mwl = raw.get("mwl")
@@ -170,11 +199,32 @@ def _sanitize_get_transients_request(raw):
         except (TypeError, ValueError):
             pass
 
+    # Keyset pagination: "cursor" mode returns an opaque nextCursor with each page
+    pagination = raw.get("pagination")
+    if pagination in ("offset", "cursor"):
+        cleaned["pagination"] = pagination
+
+    cursor = raw.get("cursor")
+    if cursor is not None:
+        # the cursor is URL-safe base64; it is decoded and validated by the model
+        cursor_str = str(cursor)
+        if CURSOR_RE.match(cursor_str):
+            cleaned["cursor"] = cursor_str
+
     # Format and sort direction (low risk, but normalise anyway)
     format_ = raw.get("format")
-    if format_ in ("html_table", "html_tickets", "json"):
+    if format_ in ("html_table", "html_tickets", "json", "ndjson"):
         cleaned["format"] = format_
 
+    lc_format = raw.get("lcFormat")
+    if lc_format in ("rows", "columnar", "columnar_b64"):
+        cleaned["lcFormat"] = lc_format
+
+    # Total ticket count: exact (default), an EXPLAIN-based estimate, or none at all
+    count_mode = raw.get("countMode")
+    if count_mode in ("exact", "estimate", "none"):
+        cleaned["countMode"] = count_mode
+
     if "sortDesc" in raw:
         sort_desc = raw.get("sortDesc")
         cleaned["sortDesc"] = bool(sort_desc in (True, "True", "1", 1))
@@ -192,12 +242,28 @@ def _sanitize_patch_or_classify_request(raw):
 
     cleaned = {}
 
-    # Required identifier
-    element_id = raw.get("elementId")
-    try:
-        cleaned["elementId"] = int(element_id)
-    except (TypeError, ValueError):
-        raise ValueError("Invalid elementId")
+    # Required identifier: a single elementId, or a list of elementIds for a bulk list move
+    element_ids = raw.get("elementIds")
+    if element_ids is not None:
+        if not isinstance(element_ids, (list, tuple)) or not element_ids:
+            raise ValueError("Invalid elementIds")
+        transient_bucket_ids = []
+        for i in element_ids:
+            try:
+                tbid = int(i)
+            except (TypeError, ValueError):
+                raise ValueError("Invalid elementIds")
+            if tbid not in transient_bucket_ids:
+                transient_bucket_ids.append(tbid)
+        if len(transient_bucket_ids) > MAX_BULK_MOVE_IDS:
+            raise ValueError("At most %s elementIds can be moved at once" % MAX_BULK_MOVE_IDS)
+        cleaned["elementIds"] = transient_bucket_ids
+    else:
+        element_id = raw.get("elementId")
+        try:
+            cleaned["elementId"] = int(element_id)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid elementId")
 
     # Workflow targets – the model will further validate allowed values
     mwl = raw.get("mwl")
@@ -215,6 +281,9 @@ def _sanitize_patch_or_classify_request(raw):
     if "snoozed" in raw:
         cleaned["snoozed"] = bool(raw.get("snoozed") in (True, "True", "1", 1))
 
+    if "elementIds" in cleaned and not ("mwl" in cleaned or "awl" in cleaned or "snoozed" in cleaned):
+        raise ValueError("elementIds can only be used to move transients to another list")
+
     # PI details
     if "piName" in raw:
         cleaned["piName"] = _sanitize_string(raw.get("piName"), max_length=255)
@@ -344,6 +413,96 @@ def _sanitize_count_transients_request(raw):
     return cleaned
 
 
+def _sanitize_get_lightcurve_request(raw):
+    """
+    Sanitize the payload used by models_transients_lightcurves_get.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("Request body must be a JSON object")
+
+    cleaned = {}
+
+    # One or many transientBucketIds (JSON list or comma separated string)
+    ids = raw.get("transientBucketIds", raw.get("elementId"))
+    if isinstance(ids, (list, tuple)):
+        ids = list(ids)
+    elif ids is not None:
+        ids = [i for i in str(ids).split(",") if i.strip()]
+    if not ids:
+        raise ValueError("Missing transientBucketIds")
+    transient_bucket_ids = []
+    for i in ids:
+        try:
+            tbid = int(i)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid transientBucketId")
+        if tbid not in transient_bucket_ids:
+            transient_bucket_ids.append(tbid)
+    if len(transient_bucket_ids) > MAX_LIGHTCURVE_IDS:
+        raise ValueError("At most %s transientBucketIds can be requested" % MAX_LIGHTCURVE_IDS)
+    cleaned["transientBucketIds"] = transient_bucket_ids
+
+    if raw.get("sinceMjd") is not None:
+        try:
+            cleaned["sinceMjd"] = float(raw.get("sinceMjd"))
+        except (TypeError, ValueError):
+            raise ValueError("Invalid sinceMjd")
+
+    lc_format = raw.get("lcFormat")
+    if lc_format in ("rows", "columnar", "columnar_b64"):
+        cleaned["lcFormat"] = lc_format
+
+    return cleaned
+
+
+def _sanitize_superevent_request(raw):
+    """
+    Sanitize the payload used by models_superevent_transients_get.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("Request body must be a JSON object")
+
+    cleaned = {}
+
+    superevent_id = str(raw.get("supereventId") or "").strip()
+    if not SUPEREVENT_ID_RE.match(superevent_id):
+        raise ValueError("Invalid supereventId")
+    cleaned["supereventId"] = superevent_id
+
+    sort_by = raw.get("sortBy")
+    if sort_by is not None:
+        if sort_by not in ("probability", "distance"):
+            raise ValueError("sortBy must be probability or distance")
+        cleaned["sortBy"] = sort_by
+
+    if "sortDesc" in raw:
+        cleaned["sortDesc"] = bool(raw.get("sortDesc") in (True, "True", "1", 1))
+
+    # Only keep the transients inside this credible region (e.g. 90 for the 90% region)
+    if raw.get("maxContour") is not None:
+        try:
+            max_contour = float(raw.get("maxContour"))
+        except (TypeError, ValueError):
+            raise ValueError("Invalid maxContour")
+        if not 0 < max_contour <= 100:
+            raise ValueError("maxContour must be between 0 and 100")
+        cleaned["maxContour"] = max_contour
+
+    if "limit" in raw:
+        try:
+            cleaned["limit"] = max(1, min(int(raw.get("limit")), 20000))
+        except (TypeError, ValueError):
+            raise ValueError("Invalid limit")
+
+    if "pageStart" in raw:
+        try:
+            cleaned["pageStart"] = max(0, int(raw.get("pageStart")))
+        except (TypeError, ValueError):
+            raise ValueError("Invalid pageStart")
+
+    return cleaned
+
+
 # Sanitize the payload for PUT. If adding a new transient ("objectDate" present), validate and reformat necessary fields.
 def _sanitize_put_transient_payload(payload):
     """
@@ -412,4 +571,78 @@ def _sanitize_put_transient_payload(payload):
     # Ensure ticketAuthor is set to authenticated userid
     cleaned["ticketAuthor"] = payload.get("authenticated_userid", None)
 
-    return cleaned
\ No newline at end of file
+    return cleaned
+
+
+def _sanitize_coordinate(value, name, low, high):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid %s" % name)
+    if value != value or value < low or value > high:
+        raise ValueError("%s must be between %s and %s" % (name, low, high))
+    return value
+
+
+def _sanitize_cone_search_request(raw):
+    """
+    Sanitize the payload of /coneSearch. The mode follows from the keys given:
+
+    - batch -- ``positions`` (list of ``[ra, dec]`` or ``{"ra", "dec"}``) and ``radius``
+    - box -- ``raMin``, ``raMax``, ``decMin`` and ``decMax``
+    - cone -- ``ra``, ``dec`` and ``radius``
+
+    Coordinates are decimal degrees, the radius is in arcsec.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("Request body must be a JSON object")
+
+    cleaned = {}
+
+    if "positions" in raw:
+        cleaned["mode"] = "batch"
+        positions = raw.get("positions")
+        if not isinstance(positions, (list, tuple)) or not positions:
+            raise ValueError("Invalid positions")
+        if len(positions) > MAX_CONE_SEARCH_POSITIONS:
+            raise ValueError("At most %s positions can be cross-matched" % MAX_CONE_SEARCH_POSITIONS)
+        cleaned_positions = []
+        for position in positions:
+            if isinstance(position, dict):
+                position = (position.get("ra"), position.get("dec"))
+            if not isinstance(position, (list, tuple)) or len(position) != 2:
+                raise ValueError("Invalid position")
+            cleaned_positions.append((
+                _sanitize_coordinate(position[0], "ra", 0, 360),
+                _sanitize_coordinate(position[1], "dec", -90, 90)))
+        cleaned["positions"] = cleaned_positions
+        cleaned["nearestOnly"] = raw.get("nearestOnly") in (True, "True", "1", 1)
+    elif "raMin" in raw or "decMin" in raw:
+        cleaned["mode"] = "box"
+        for key in ("raMin", "raMax"):
+            cleaned[key] = _sanitize_coordinate(raw.get(key), key, 0, 360)
+        for key in ("decMin", "decMax"):
+            cleaned[key] = _sanitize_coordinate(raw.get(key), key, -90, 90)
+        if cleaned["decMin"] > cleaned["decMax"]:
+            raise ValueError("decMin must not be greater than decMax")
+    else:
+        cleaned["mode"] = "cone"
+        cleaned["ra"] = _sanitize_coordinate(raw.get("ra"), "ra", 0, 360)
+        cleaned["dec"] = _sanitize_coordinate(raw.get("dec"), "dec", -90, 90)
+
+    if cleaned["mode"] != "box":
+        radius = _sanitize_coordinate(raw.get("radius"), "radius", 0, MAX_CONE_RADIUS_ARCSEC)
+        if radius <= 0:
+            raise ValueError("radius must be positive")
+        cleaned["radius"] = radius
+
+    limit = raw.get("limit")
+    if limit is None:
+        cleaned["limit"] = 1000
+    else:
+        try:
+            cleaned["limit"] = max(1, min(int(limit), MAX_CONE_SEARCH_MATCHES))
+        except (TypeError, ValueError):
+            raise ValueError("Invalid limit")
+
+    return cleaned
@@ -0,0 +1,197 @@
+# ---------------------------------------------------------------------------
+#  In-memory free-text search index of transient names, PI names and LVK superevents
+# ---------------------------------------------------------------------------
+
+import bisect
+import re
+import time
+
+from fundamentals.mysql import readquery
+
+from packages.background_index import background_index
+
+NON_ALPHANUMERIC_RE = re.compile(r"[^a-z0-9]")
+# THE IAU PREFIXES: `AT 2023abc`, `SN2023abc` AND `2023abc` ARE THE SAME TRANSIENT
+IAU_PREFIX_RE = re.compile(r"^(at|sn)(?=[0-9])")
+
+RANK_EXACT = 0
+RANK_PREFIX = 1
+RANK_SUBSTRING = 2
+
+
+def normalise_name(name):
+    """
+    Lowercase ``name`` and drop every non-alphanumeric character (the same
+    normalisation as the ``REGEXP_REPLACE(name, "[^A-Za-z0-9]", "")`` of the SQL search).
+    """
+    return NON_ALPHANUMERIC_RE.sub("", str(name or "").lower())
+
+
+def search_keys(name):
+    """
+    Return the normalised forms ``name`` is indexed (and searched) under: the
+    normalised name itself plus, for IAU names, the name without its AT/SN prefix.
+    """
+    normalised = normalise_name(name)
+    if not normalised:
+        return []
+    keys = [normalised]
+    stripped = IAU_PREFIX_RE.sub("", normalised)
+    if stripped != normalised:
+        keys.append(stripped)
+    return keys
+
+
+def _trigrams(key):
+    return set([key[i:i + 3] for i in range(len(key) - 2)])
+
+
+class search_index(background_index):
+    """
+    *Ranked name lookup answering the /getTransients ``q`` search from memory*
+
+    The index maps the normalised transient names (akas), PI names and LVK superevent ids
+    to their transientBucketIds. Prefix matches use a sorted key list, substring matches
+    a trigram index, so a lookup never scans the catalogue.
+
+    The index is rebuilt in a background thread (see ``background_index``) whenever the
+    shared Redis generation is bumped (``mark_stale``, called on PI changes and new
+    transients) or, to pick up the external ingests, once it is older than ``maxAgeSeconds``.
+
+    **Key Arguments**
+
+    - ``log`` -- logger
+    - ``pool`` -- the ``connection_pool`` the rebuilds borrow a connection from
+    - ``redisClient`` -- a ``redis.StrictRedis`` client holding the shared generation
+    - ``checkIntervalSeconds`` -- how often the generation is checked
+    - ``maxAgeSeconds`` -- the index is rebuilt at least this often
+    - ``generationKey`` -- the Redis key of the generation counter
+    """
+
+    indexName = "search index"
+
+    def __init__(
+        self,
+        log,
+        pool,
+        redisClient,
+        checkIntervalSeconds=10,
+        maxAgeSeconds=900,
+        generationKey="marshall:search_index:generation"
+    ):
+        # THE STATE IS (keyToIds, sortedKeys, trigramToKeys)
+        super().__init__(log, pool, redisClient, checkIntervalSeconds, maxAgeSeconds, generationKey)
+
+        return None
+
+    def search(
+            self,
+            query,
+            limit=None):
+        """*return the transientBucketIds matching ``query``, best matches first*
+
+        Exact name matches rank before prefix matches, which rank before substring
+        matches; ties are broken by the shortest matching name.
+
+        **Key Arguments**
+
+        - ``query`` -- the free-text search string
+        - ``limit`` -- maximum number of ids returned (None for all)
+
+        **Return**
+
+        - ``transientBucketIds`` -- ranked list of ids, or None if the index is not built yet
+        """
+        state = self._state
+        if state is None:
+            return None
+        keyToIds, sortedKeys, trigramToKeys = state
+
+        best = {}
+
+        def add(key, rank):
+            score = (rank, len(key))
+            for transientBucketId in keyToIds.get(key, ()):
+                if transientBucketId not in best or score < best[transientBucketId]:
+                    best[transientBucketId] = score
+
+        for needle in search_keys(query):
+            # EXACT
+            add(needle, RANK_EXACT)
+
+            # PREFIX
+            start = bisect.bisect_left(sortedKeys, needle)
+            for key in sortedKeys[start:]:
+                if not key.startswith(needle):
+                    break
+                add(key, RANK_PREFIX)
+
+            # SUBSTRING
+            if len(needle) >= 3:
+                candidates = None
+                for trigram in sorted(_trigrams(needle), key=lambda t: len(trigramToKeys.get(t, ()))):
+                    keys = trigramToKeys.get(trigram)
+                    if not keys:
+                        candidates = set()
+                        break
+                    candidates = set(keys) if candidates is None else candidates & keys
+                    if not candidates:
+                        break
+                candidates = candidates or ()
+            else:
+                candidates = sortedKeys
+            for key in candidates:
+                if needle in key:
+                    add(key, RANK_SUBSTRING)
+
+        ranked = sorted(best, key=lambda t: (best[t], t))
+        if limit is not None:
+            ranked = ranked[:limit]
+        return ranked
+
+    def rebuild(
+            self):
+        """*read every searchable name from the database and swap in a fresh index*
+        """
+        started = time.monotonic()
+        generation = self._read_generation()
+
+        dbConn = self.pool.acquire()
+        try:
+            rows = []
+            sqlQuery = """select transientBucketId, name from marshall_transient_akas"""
+            rows += readquery(sqlQuery, dbConn, self.log)
+            sqlQuery = """select transientBucketId, pi_name as name from pesstoObjects where pi_name is not null"""
+            rows += readquery(sqlQuery, dbConn, self.log)
+            sqlQuery = """select distinct s.transientBucketId, s.superevent_id as name from lvk_skytag s, lvk_alerts a, lvk_events e where s.mapId=a.primaryId and e.superevent_id=a.superevent_id and a.alert_time =e.alert_time"""
+            rows += readquery(sqlQuery, dbConn, self.log)
+        finally:
+            self.pool.release(dbConn)
+
+        keyToIds = {}
+        for row in rows:
+            for key in search_keys(row["name"]):
+                keyToIds.setdefault(key, set()).add(row["transientBucketId"])
+
+        trigramToKeys = {}
+        for key in keyToIds:
+            for trigram in _trigrams(key):
+                trigramToKeys.setdefault(trigram, set()).add(key)
+
+        self._swap((keyToIds, sorted(keyToIds), trigramToKeys), generation, started)
+
+        self.log.info("search index rebuilt with %s names in %0.2f s" %
+                      (len(keyToIds), self.buildSeconds))
+        return None
+
+    def metrics(
+            self):
+        """*size and freshness of the index*
+        """
+        state = self._state
+        return {
+            "names": len(state[0]) if state else 0,
+            "rebuilds": self.rebuilds,
+            "buildSeconds": self.buildSeconds or 0.0,
+            "ageSeconds": self.ageSeconds or 0.0
+        }
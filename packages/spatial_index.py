@@ -0,0 +1,294 @@
+# ---------------------------------------------------------------------------
+#  In-memory positional (cone, box and batch cross-match) index of the transients
+# ---------------------------------------------------------------------------
+
+import math
+import time
+
+import numpy as np
+from fundamentals.mysql import readquery
+
+from packages.background_index import background_index
+
+
+def angular_separation(ra1, dec1, ra2, dec2):
+    """
+    Great-circle separation (degrees) between positions given in degrees.
+
+    Uses the haversine formula, which stays accurate for arcsecond separations, and
+    broadcasts like any numpy expression (a position against an array of positions).
+    """
+    ra1, dec1, ra2, dec2 = [np.radians(np.asarray(x, dtype="f8")) for x in (ra1, dec1, ra2, dec2)]
+    a = np.sin((dec2 - dec1) / 2) ** 2 + \
+        np.cos(dec1) * np.cos(dec2) * np.sin((ra2 - ra1) / 2) ** 2
+    return np.degrees(2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0))))
+
+
+def ra_half_width(dec, radius):
+    """
+    Half-width in RA (degrees) of the smallest RA range enclosing a cone of ``radius``
+    degrees centred at declination ``dec`` (180 when the cone reaches a pole).
+    """
+    if abs(dec) + radius >= 89.999999:
+        return 180.0
+    dec = math.radians(dec)
+    radius = math.radians(radius)
+    denominator = math.sqrt(abs(math.cos(dec - radius) * math.cos(dec + radius)))
+    return min(180.0, math.degrees(math.atan(math.sin(radius) / denominator)))
+
+
+class spatial_index(background_index):
+    """
+    *Zone index answering the /coneSearch cone, box and batch queries from memory*
+
+    The master position of every transient (``transientBucket`` rows with ``masterIdFlag = 1``)
+    is held in numpy arrays sorted by declination zone and then by RA. A cone only
+    visits the zones it overlaps and, in each, the RA range found by binary search;
+    the exact separations of those few candidates are then computed in one vectorised
+    step, so cross-matching thousands of positions takes seconds.
+
+    Like the name ``search_index``, the arrays are rebuilt in a background thread (see
+    ``background_index``) whenever the shared Redis generation is bumped (``mark_stale``, called when a transient is added)
+    or once they are older than ``maxAgeSeconds`` (the ingests happen outside the API).
+
+    **Key Arguments**
+
+    - ``log`` -- logger
+    - ``pool`` -- the ``connection_pool`` the rebuilds borrow a connection from
+    - ``redisClient`` -- a ``redis.StrictRedis`` client holding the shared generation
+    - ``zoneHeightDeg`` -- height of the declination zones
+    - ``checkIntervalSeconds`` -- how often the generation is checked
+    - ``maxAgeSeconds`` -- the index is rebuilt at least this often
+    - ``generationKey`` -- the Redis key of the generation counter
+    """
+
+    indexName = "spatial index"
+
+    def __init__(
+        self,
+        log,
+        pool,
+        redisClient,
+        zoneHeightDeg=0.25,
+        checkIntervalSeconds=10,
+        maxAgeSeconds=900,
+        generationKey="marshall:spatial_index:generation"
+    ):
+        # SET BEFORE THE FIRST REBUILD STARTS; THE STATE IS (transientBucketIds, raDeg, decDeg, zoneStarts)
+        self.zoneHeightDeg = zoneHeightDeg
+        self.zones = int(math.ceil(180.0 / zoneHeightDeg))
+        self.queries = 0
+        super().__init__(log, pool, redisClient, checkIntervalSeconds, maxAgeSeconds, generationKey)
+
+        return None
+
+    def cone(
+            self,
+            raDeg,
+            decDeg,
+            radiusDeg,
+            limit=None):
+        """*return the transients within ``radiusDeg`` of a position, nearest first*
+
+        **Key Arguments**
+
+        - ``raDeg``, ``decDeg`` -- the centre of the cone
+        - ``radiusDeg`` -- the radius of the cone
+        - ``limit`` -- maximum number of matches returned (None for all)
+
+        **Return**
+
+        - ``matches`` -- list of ``{"transientBucketId", "raDeg", "decDeg", "separationArcsec"}``, or None if the index is not built yet
+        """
+        state = self._state
+        if state is None:
+            return None
+        self.queries += 1
+        return self._cone(state, raDeg, decDeg, radiusDeg, limit)
+
+    def box(
+            self,
+            raMin,
+            raMax,
+            decMin,
+            decMax,
+            limit=None):
+        """*return the transients inside an RA/Dec box, ordered by declination zone and RA*
+
+        A box with ``raMin`` greater than ``raMax`` wraps through RA 0.
+
+        **Return**
+
+        - ``matches`` -- list of ``{"transientBucketId", "raDeg", "decDeg"}``, or None if the index is not built yet
+        """
+        state = self._state
+        if state is None:
+            return None
+        self.queries += 1
+        ids, ra, dec, zoneStarts = state
+
+        if raMin <= raMax:
+            raRanges = [(raMin, raMax)]
+        else:
+            raRanges = [(raMin, 360.0), (0.0, raMax)]
+        candidates = self._candidates(state, decMin, decMax, raRanges)
+        candidates = candidates[(dec[candidates] >= decMin) & (dec[candidates] <= decMax)]
+        if limit is not None:
+            candidates = candidates[:limit]
+
+        return [{
+            "transientBucketId": int(ids[i]),
+            "raDeg": float(ra[i]),
+            "decDeg": float(dec[i])
+        } for i in candidates]
+
+    def batch(
+            self,
+            positions,
+            radiusDeg,
+            nearestOnly=False,
+            limitPerPosition=None):
+        """*cross-match a list of positions against the transients*
+
+        **Key Arguments**
+
+        - ``positions`` -- list of ``(raDeg, decDeg)``
+        - ``radiusDeg`` -- the match radius
+        - ``nearestOnly`` -- only keep the nearest transient of each position
+        - ``limitPerPosition`` -- maximum number of matches per position (None for all)
+
+        **Return**
+
+        - ``matches`` -- list of ``{"position", "transientBucketId", "raDeg", "decDeg", "separationArcsec"}`` (``position`` is the index in ``positions``), or None if the index is not built yet
+        """
+        state = self._state
+        if state is None:
+            return None
+        self.queries += 1
+        if nearestOnly:
+            limitPerPosition = 1
+
+        matches = []
+        for position, (raDeg, decDeg) in enumerate(positions):
+            for match in self._cone(state, raDeg, decDeg, radiusDeg, limitPerPosition):
+                match["position"] = position
+                matches.append(match)
+        return matches
+
+    def rebuild(
+            self):
+        """*read the master position of every transient and swap in fresh arrays*
+        """
+        started = time.monotonic()
+        generation = self._read_generation()
+
+        dbConn = self.pool.acquire()
+        try:
+            sqlQuery = """select transientBucketId, raDeg, decDeg from transientBucket where replacedByRowId = 0 and masterIdFlag = 1 and raDeg is not null and decDeg is not null"""
+            rows = readquery(sqlQuery, dbConn, self.log)
+        finally:
+            self.pool.release(dbConn)
+
+        count = len(rows)
+        ids = np.fromiter((r["transientBucketId"] for r in rows), dtype="i8", count=count)
+        ra = np.fromiter((r["raDeg"] for r in rows), dtype="f8", count=count) % 360.0
+        dec = np.fromiter((r["decDeg"] for r in rows), dtype="f8", count=count)
+
+        # ONE POSITION PER TRANSIENT
+        ids, first = np.unique(ids, return_index=True)
+        ra = ra[first]
+        dec = dec[first]
+
+        zone = self._zone(dec)
+        order = np.lexsort((ra, zone))
+        ids, ra, dec, zone = ids[order], ra[order], dec[order], zone[order]
+        zoneStarts = np.searchsorted(zone, np.arange(self.zones + 1))
+
+        self._swap((ids, ra, dec, zoneStarts), generation, started)
+
+        self.log.info("spatial index rebuilt with %s positions in %0.2f s" %
+                      (len(ids), self.buildSeconds))
+        return None
+
+    def metrics(
+            self):
+        """*size, freshness and use of the index*
+        """
+        state = self._state
+        return {
+            "positions": len(state[0]) if state else 0,
+            "rebuilds": self.rebuilds,
+            "queries": self.queries,
+            "buildSeconds": self.buildSeconds or 0.0,
+            "ageSeconds": self.ageSeconds or 0.0
+        }
+
+    def _zone(
+            self,
+            dec):
+        zone = np.floor((np.asarray(dec, dtype="f8") + 90.0) / self.zoneHeightDeg).astype("i8")
+        return np.clip(zone, 0, self.zones - 1)
+
+    def _candidates(
+            self,
+            state,
+            decMin,
+            decMax,
+            raRanges):
+        # THE ROWS OF EVERY ZONE OVERLAPPING [decMin, decMax] WHOSE RA FALLS IN ONE OF raRanges
+        ids, ra, dec, zoneStarts = state
+        firstZone, lastZone = [int(z) for z in self._zone([decMin, decMax])]
+        slices = []
+        for zone in range(firstZone, lastZone + 1):
+            start, end = zoneStarts[zone], zoneStarts[zone + 1]
+            if start == end:
+                continue
+            zoneRa = ra[start:end]
+            for low, high in raRanges:
+                first = start + np.searchsorted(zoneRa, low, side="left")
+                last = start + np.searchsorted(zoneRa, high, side="right")
+                if last > first:
+                    slices.append(np.arange(first, last))
+        if not slices:
+            return np.empty(0, dtype="i8")
+        return np.concatenate(slices)
+
+    def _cone(
+            self,
+            state,
+            raDeg,
+            decDeg,
+            radiusDeg,
+            limit):
+        ids, ra, dec, zoneStarts = state
+        raDeg = raDeg % 360.0
+        decMin = max(-90.0, decDeg - radiusDeg)
+        decMax = min(90.0, decDeg + radiusDeg)
+
+        # THE RA RANGE, SPLIT IN TWO WHERE IT WRAPS THROUGH RA 0
+        halfWidth = ra_half_width(decDeg, radiusDeg)
+        if halfWidth >= 180.0:
+            raRanges = [(0.0, 360.0)]
+        else:
+            low, high = raDeg - halfWidth, raDeg + halfWidth
+            if low < 0:
+                raRanges = [(low + 360.0, 360.0), (0.0, high)]
+            elif high >= 360.0:
+                raRanges = [(low, 360.0), (0.0, high - 360.0)]
+            else:
+                raRanges = [(low, high)]
+
+        candidates = self._candidates(state, decMin, decMax, raRanges)
+        separation = angular_separation(raDeg, decDeg, ra[candidates], dec[candidates])
+        inside = separation <= radiusDeg
+        candidates, separation = candidates[inside], separation[inside]
+        order = np.argsort(separation, kind="stable")
+        if limit is not None:
+            order = order[:limit]
+
+        return [{
+            "transientBucketId": int(ids[candidates[i]]),
+            "raDeg": float(ra[candidates[i]]),
+            "decDeg": float(dec[candidates[i]]),
+            "separationArcsec": float(separation[i] * 3600.0)
+        } for i in order]
@@ -0,0 +1,159 @@
+# ---------------------------------------------------------------------------
+#  Parameterised SQL statements (driver-bound values, cached templates)
+# ---------------------------------------------------------------------------
+
+import threading
+from functools import lru_cache
+
+import pymysql
+
+# IN LISTS ARE PADDED UP TO ONE OF THESE LENGTHS SO A HANDFUL OF STATEMENT TEXTS COVERS EVERY LIST SIZE
+IN_LIST_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+_metricsLock = threading.Lock()
+_metrics = {
+    "executions": 0,
+    "templateMisses": 0
+}
+
+
+def statement_metrics():
+    """
+    Executions of parameterised statements and the hit rate of the template cache.
+    """
+    with _metricsLock:
+        metrics = dict(_metrics)
+    info = _expand_template.cache_info()
+    metrics["templates"] = info.currsize
+    metrics["templateHits"] = info.hits
+    return metrics
+
+
+def bind(sqlQuery, args=()):
+    """
+    Expand the list arguments of a parameterised statement.
+
+    ``sqlQuery`` uses the pymysql ``%s`` placeholders (``%%`` for a literal percent sign).
+    A list or tuple argument fills an ``IN %s`` placeholder: it becomes a parenthesised
+    list of placeholders, padded up to the next ``IN_LIST_BUCKETS`` length by repeating
+    its last value (which does not change the result of an ``IN``), so the statement text
+    only varies with the bucket and not with the exact list length. An empty list matches
+    nothing.
+
+    Returns ``(sqlQuery, flatArgs)`` ready for ``cursor.execute``.
+    """
+    if args is None:
+        return sqlQuery, None
+    args = tuple(args)
+    shape = []
+    flatArgs = []
+    for arg in args:
+        if isinstance(arg, (list, tuple, set, frozenset)):
+            values = list(arg)
+            if not values:
+                shape.append(0)
+                continue
+            size = _bucket(len(values))
+            values.extend([values[-1]] * (size - len(values)))
+            shape.append(size)
+            flatArgs.extend(values)
+        else:
+            shape.append(None)
+            flatArgs.append(arg)
+    return _expand_template(sqlQuery, tuple(shape)), tuple(flatArgs)
+
+
+def read(log, dbConn, sqlQuery, args=()):
+    """
+    Run a parameterised ``select`` and return its rows as dictionaries.
+
+    - ``log`` -- logger
+    - ``dbConn`` -- the database connection
+    - ``sqlQuery`` -- the statement, with ``%s`` placeholders
+    - ``args`` -- the values of the placeholders (lists fill ``IN %s``)
+    """
+    sqlQuery, flatArgs = bind(sqlQuery, args)
+    _count()
+    with dbConn.cursor(pymysql.cursors.DictCursor) as cursor:
+        try:
+            cursor.execute(sqlQuery, flatArgs)
+        except Exception as e:
+            log.warning("MySQL raised an error - read command not executed.\n%s\nHere is the sqlQuery\n\t%s" % (e, sqlQuery[:1000]))
+            raise
+        return list(cursor.fetchall())
+
+
+def read_chunked(log, dbConn, sqlQuery, ids, chunkSize=IN_LIST_BUCKETS[-1]):
+    """
+    Run a parameterised ``select`` whose only placeholder is an ``IN %s`` list, in chunks.
+
+    The ids are bound ``chunkSize`` at a time, so long lists neither blow up the statement
+    text nor the number of distinct templates, and an empty list runs no query at all.
+    Rows are returned chunk after chunk: an ``order by`` only holds within a chunk, which
+    is enough for per-id orderings (all the rows of an id come from the same chunk).
+
+    - ``ids`` -- the values of the ``IN %s`` list
+    - ``chunkSize`` -- values bound per statement
+    """
+    ids = list(ids)
+    rows = []
+    for start in range(0, len(ids), chunkSize):
+        rows.extend(read(log, dbConn, sqlQuery, (ids[start:start + chunkSize],)))
+    return rows
+
+
+def write(log, dbConn, sqlQuery, args=()):
+    """
+    Run a parameterised ``insert``/``update``/``call`` and commit it.
+
+    Inside a transaction use ``unit_of_work.execute`` instead, which does not commit.
+
+    Returns the number of rows affected.
+    """
+    sqlQuery, flatArgs = bind(sqlQuery, args)
+    _count()
+    with dbConn.cursor() as cursor:
+        try:
+            cursor.execute(sqlQuery, flatArgs)
+        except Exception as e:
+            log.warning("MySQL raised an error - write command not executed.\n%s\nHere is the sqlQuery\n\t%s" % (e, sqlQuery[:1000]))
+            raise
+        rowcount = cursor.rowcount
+    dbConn.commit()
+    return rowcount
+
+
+def _bucket(length):
+    for size in IN_LIST_BUCKETS:
+        if length <= size:
+            return size
+    # BEYOND THE LAST BUCKET, ROUND UP TO A MULTIPLE OF IT
+    last = IN_LIST_BUCKETS[-1]
+    return -(-length // last) * last
+
+
+@lru_cache(maxsize=1024)
+def _expand_template(sqlQuery, shape):
+    with _metricsLock:
+        _metrics["templateMisses"] += 1
+    if all(size is None for size in shape):
+        return sqlQuery
+    # SPLIT ON THE PLACEHOLDERS, LEAVING THE ESCAPED %% ALONE
+    parts = sqlQuery.replace("%%", "\0").split("%s")
+    if len(parts) != len(shape) + 1:
+        raise ValueError("the statement has %s placeholders but %s arguments were given" % (len(parts) - 1, len(shape)))
+    pieces = [parts[0]]
+    for size, part in zip(shape, parts[1:]):
+        if size is None:
+            pieces.append("%s")
+        elif size == 0:
+            pieces.append("(NULL)")
+        else:
+            pieces.append("(" + (",").join(["%s"] * size) + ")")
+        pieces.append(part)
+    return ("").join(pieces).replace("\0", "%%")
+
+
+def _count():
+    with _metricsLock:
+        _metrics["executions"] += 1
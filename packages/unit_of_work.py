@@ -0,0 +1,203 @@
+# ---------------------------------------------------------------------------
+#  Single-transaction write path for the PUT/PATCH models
+# ---------------------------------------------------------------------------
+
+import random
+import threading
+import time
+
+import pymysql
+
+from packages.statements import bind
+
+# MySQL ERRORS AFTER WHICH THE WHOLE TRANSACTION CAN SAFELY BE REPLAYED
+RETRYABLE_ERRORS = {
+    1205: "lock wait timeout",
+    1213: "deadlock"
+}
+
+_metricsLock = threading.Lock()
+_metrics = {
+    "transactions": 0,
+    "commits": 0,
+    "rollbacks": 0,
+    "retries": 0,
+    "statements": 0,
+    "statementSecondsTotal": 0.0,
+    "statementSecondsMax": 0.0
+}
+
+
+def unit_of_work_metrics():
+    """
+    Transaction, retry and statement timing counters of every ``unit_of_work`` of the process.
+    """
+    with _metricsLock:
+        return dict(_metrics)
+
+
+class unit_of_work(object):
+    """
+    *Run all the statements of one request in a single transaction*
+
+    ``fundamentals.mysql.writequery`` commits after every statement, so a failure halfway
+    through a request leaves half-applied state and every statement pays its own commit.
+    The writes of a request go through ``execute`` instead and ``run`` wraps them in one
+    transaction with one commit. A transaction aborted by a deadlock or a lock wait
+    timeout is rolled back and the whole unit of work replayed.
+
+    The duration of every statement of the last attempt is kept in ``timings``.
+
+    **Key Arguments**
+
+    - ``log`` -- logger
+    - ``dbConn`` -- the database connection
+    - ``maxRetries`` -- replays allowed after a deadlock or lock wait timeout
+    - ``retryDelaySeconds`` -- base of the randomised exponential backoff between replays
+
+    **Usage**
+
+    ```python
+    uow = unit_of_work(log=log, dbConn=dbConn)
+
+    def work():
+        uow.execute("update pesstoObjects set snoozed = 0 where transientBucketId = 1")
+        uow.execute("insert into transients_history_logs ...")
+
+    uow.run(work)
+    ```
+    """
+
+    def __init__(
+        self,
+        log,
+        dbConn,
+        maxRetries=3,
+        retryDelaySeconds=0.05
+    ):
+        self.log = log
+        self.dbConn = dbConn
+        self.maxRetries = maxRetries
+        self.retryDelaySeconds = retryDelaySeconds
+        self.timings = []
+        self.attempts = 0
+
+        return None
+
+    def run(
+            self,
+            work):
+        """*call ``work()`` inside a transaction and commit it*
+
+        ``work`` may be called more than once, so it must only change state through this
+        unit of work (or reset whatever else it changes when it starts).
+
+        **Key Arguments**
+
+        - ``work`` -- callable taking no arguments
+
+        **Return**
+
+        - ``result`` -- the value returned by ``work``
+        """
+        self.attempts = 0
+        while True:
+            self.attempts += 1
+            self.timings = []
+            _count("transactions")
+            self.dbConn.begin()
+            try:
+                result = work()
+                started = time.monotonic()
+                self.dbConn.commit()
+                self._record("COMMIT", started, None)
+                _count("commits")
+            except Exception as e:
+                self._rollback()
+                code = e.args[0] if isinstance(e, pymysql.err.MySQLError) and e.args else None
+                if code not in RETRYABLE_ERRORS or self.attempts > self.maxRetries:
+                    raise
+                _count("retries")
+                delay = self.retryDelaySeconds * (2 ** (self.attempts - 1)) * (1 + random.random())
+                self.log.warning("transaction aborted by a %s, replaying it in %.3f s (attempt %s/%s)" % (
+                    RETRYABLE_ERRORS[code], delay, self.attempts, self.maxRetries))
+                time.sleep(delay)
+                continue
+
+            self.log.debug("unit of work committed: %s" % (self.report(),))
+            return result
+
+    def execute(
+            self,
+            sqlQuery,
+            args=None):
+        """*execute one statement of the transaction*
+
+        **Key Arguments**
+
+        - ``sqlQuery`` -- the statement, with ``%s`` placeholders when ``args`` are given
+        - ``args`` -- the values of the placeholders, bound by the driver (lists fill ``IN %s``, see ``statements.bind``)
+
+        **Return**
+
+        - ``rowcount`` -- the number of rows affected
+        """
+        sqlQuery, args = bind(sqlQuery, args)
+        with self.dbConn.cursor() as cursor:
+            started = time.monotonic()
+            cursor.execute(sqlQuery, args)
+            self._record(sqlQuery, started, cursor.rowcount)
+            return cursor.rowcount
+
+    def query(
+            self,
+            sqlQuery,
+            args=None):
+        """*read rows inside the transaction*
+
+        **Return**
+
+        - ``rows`` -- list of dictionaries
+        """
+        sqlQuery, args = bind(sqlQuery, args)
+        with self.dbConn.cursor(pymysql.cursors.DictCursor) as cursor:
+            started = time.monotonic()
+            cursor.execute(sqlQuery, args)
+            rows = cursor.fetchall()
+            self._record(sqlQuery, started, len(rows))
+            return list(rows)
+
+    def report(
+            self):
+        """*one line summary of the statement timings of the last attempt*
+        """
+        total = sum(t["seconds"] for t in self.timings)
+        statements = ", ".join(["%s %.1f ms" % (t["statement"], t["seconds"] * 1000) for t in self.timings])
+        return "%s statements in %.1f ms (attempt %s): %s" % (len(self.timings), total * 1000, self.attempts, statements)
+
+    def _rollback(
+            self):
+        _count("rollbacks")
+        try:
+            self.dbConn.rollback()
+        except Exception as e:
+            self.log.warning("could not roll the transaction back: %s" % (e,))
+
+    def _record(
+            self,
+            sqlQuery,
+            started,
+            rows):
+        seconds = time.monotonic() - started
+        # THE START OF THE (WHITESPACE-NORMALISED) STATEMENT IS ENOUGH TO TELL THEM APART
+        statement = " ".join(sqlQuery.split())[:60]
+        self.timings.append({"statement": statement, "seconds": seconds, "rows": rows})
+        with _metricsLock:
+            _metrics["statements"] += 1
+            _metrics["statementSecondsTotal"] += seconds
+            _metrics["statementSecondsMax"] = max(_metrics["statementSecondsMax"], seconds)
+
+
+def _count(name):
+    with _metricsLock:
+        _metrics[name] += 1